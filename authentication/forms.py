@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.contrib.auth.forms import UserCreationForm as BaseUserCreationForm, UserChangeForm as BaseUserChangeForm
+from model2 import images
 from .models import User
 
 class UserUpdateForm(BaseUserChangeForm):
@@ -28,6 +30,17 @@ class UserUpdateForm(BaseUserChangeForm):
             'gender': forms.Select(attrs={'class': 'rounded-lg border border-amber-900'}),
         }
 
+    prepared_picture = None
+
+    def clean_profile_picture(self):
+        # a new picture is decoded here and stored after the response
+        # (model2.images.attach), so the instance keeps the old one for now
+        picture = self.cleaned_data.get('profile_picture')
+        if isinstance(picture, UploadedFile):
+            self.prepared_picture = images.prepare(picture, 'avatar')
+            return self.instance.profile_picture
+        return picture
+
 
 class UserCreationForm(BaseUserCreationForm):
     class Meta:
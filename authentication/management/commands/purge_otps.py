@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from authentication import otp
+
+
+class Command(BaseCommand):
+    help = "Delete email OTPs past their expiry and the send rate-limit window."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = otp.purge(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} OTPs."))
@@ -1,5 +1,9 @@
+import functools
+import re
+import time
+
 from django.shortcuts import redirect
-from django.urls import reverse, resolve
+from django.urls import NoReverseMatch, reverse
 from django.conf import settings
 
 EXEMPT_URL_NAMES = {
@@ -9,32 +13,84 @@ EXEMPT_URL_NAMES = {
     # add names for any API auth endpoints, health checks, etc.
 }
 
+
+@functools.cache
+def exempt_prefixes():
+    """One compiled pattern for static, media and TERMS_WHITELIST_PREFIXES paths."""
+    prefixes = [settings.STATIC_URL, getattr(settings, 'MEDIA_URL', None)]
+    prefixes += getattr(settings, "TERMS_WHITELIST_PREFIXES", [])
+    prefixes = sorted({p if p.startswith('/') else '/' + p for p in prefixes if p})
+    return re.compile('|'.join(re.escape(prefix) for prefix in prefixes) or r'(?!)')
+
+
+@functools.cache
+def exempt_paths():
+    """The paths of EXEMPT_URL_NAMES, reversed once."""
+    paths = set()
+    for name in EXEMPT_URL_NAMES:
+        try:
+            paths.add(reverse(name))
+        except NoReverseMatch:
+            pass
+    return frozenset(paths)
+
+
+def is_exempt_prefix(request):
+    """Static, media and whitelisted paths; these never need the session or the user."""
+    return exempt_prefixes().match(request.path) is not None
+
+
 def is_exempt_path(request):
-    # allow static/media and staff/admin & debug endpoints by path prefix
-    if request.path.startswith(settings.STATIC_URL) or getattr(settings, 'MEDIA_URL', None) and request.path.startswith(settings.MEDIA_URL):
-        return True
-    try:
-        view_name = resolve(request.path_info).view_name
-    except Exception:
-        view_name = None
-    if view_name in EXEMPT_URL_NAMES:
-        return True
-    # allow admin, static, or any explicit extras in settings
-    for prefix in getattr(settings, "TERMS_WHITELIST_PREFIXES", []):
-        if request.path.startswith(prefix):
-            return True
-    return False
+    return is_exempt_prefix(request) or request.path in exempt_paths()
 
 
 class TermsCheckMiddleware:
+    """
+    Send signed-in users who have not accepted the current TERMS_VERSION to the terms page.
+
+    Exempt paths are matched against patterns built once, before the user is
+    looked at. Once a user is known to have accepted, the version is kept in
+    their session, so later requests are let through without loading the user.
+    """
+    SESSION_KEY = "_terms_version"
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            if not request.user.agreed_to_terms and request.path not in [
-                reverse('terms_and_conditions'),
-                reverse('logout'),
-            ]:
+        if is_exempt_path(request) or request.session.get(self.SESSION_KEY) == settings.TERMS_VERSION:
+            return self.get_response(request)
+
+        user = request.user
+        if user.is_authenticated:
+            if not (user.agreed_to_terms and user.terms_version == settings.TERMS_VERSION):
                 return redirect('terms_and_conditions')
+            request.session[self.SESSION_KEY] = settings.TERMS_VERSION
+        return self.get_response(request)
+
+
+class SlidingSessionMiddleware:
+    """
+    Keep active sessions alive without writing them on every request.
+
+    Replaces SESSION_SAVE_EVERY_REQUEST: an existing session is marked
+    modified only when it was last refreshed more than
+    SESSION_REFRESH_INTERVAL seconds ago, which makes the session
+    middleware save it and re-issue the cookie with a new expiry.
+    Requests without a session cookie never create one here, and exempt
+    paths (static, media, health) never load the session at all.
+    """
+    REFRESHED_KEY = "_refreshed_at"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if is_exempt_prefix(request):
+            return self.get_response(request)
+        session = request.session
+        if session.session_key and not session.is_empty():
+            now = int(time.time())
+            if now - session.get(self.REFRESHED_KEY, 0) >= settings.SESSION_REFRESH_INTERVAL:
+                session[self.REFRESHED_KEY] = now
         return self.get_response(request)
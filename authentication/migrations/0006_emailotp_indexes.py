@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_user_agreed_to_terms_user_terms_accepted_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailotp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(fields=['temp_email', 'purpose', 'is_used', 'created_at'], name='otp_email_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(fields=['user', 'purpose', 'is_used', 'created_at'], name='otp_user_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(fields=['created_at'], name='otp_created_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 import uuid
@@ -50,11 +51,20 @@ class EmailOTP(models.Model):
     purpose = models.CharField(max_length=20)  
     created_at = models.DateTimeField(default=timezone.now)
     is_used = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)  # wrong codes tried against this one
     token = models.UUIDField(default=uuid.uuid4, editable=False)  
 
+    class Meta:
+        indexes = [
+            # the live code for an email or user (authentication.otp)
+            models.Index(fields=['temp_email', 'purpose', 'is_used', 'created_at'], name='otp_email_lookup_idx'),
+            models.Index(fields=['user', 'purpose', 'is_used', 'created_at'], name='otp_user_lookup_idx'),
+            # purge_otps
+            models.Index(fields=['created_at'], name='otp_created_idx'),
+        ]
+
     def is_expired(self):
-        # expire after 10 minutes
-        return timezone.now() > self.created_at + timezone.timedelta(minutes=10)
+        return timezone.now() > self.created_at + timezone.timedelta(seconds=settings.OTP_TTL)
 
     def __str__(self):
         target = self.user.email if self.user else self.temp_email
@@ -0,0 +1,109 @@
+"""
+Email one-time codes.
+
+An email (or user) has at most one live code per purpose: issuing a new
+one retires the old, so verifying is a single probe of the lookup index
+for the newest unused, unexpired code, with the expiry compared in SQL.
+A code is burnt after OTP_MAX_ATTEMPTS wrong guesses, and an email gets at
+most OTP_SEND_LIMIT codes, whatever their purpose, in OTP_SEND_WINDOW
+seconds, so a code can't be guessed by asking for new ones either.
+
+``send`` mails a code through the task queue. The task is given the
+code's pk and reads the code itself, so codes never sit in the task table.
+
+Codes are purged by ``manage.py purge_otps`` once they are past both the
+expiry and the rate-limit window.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from tasks.mail import send_mail
+from tasks.queue import enqueue, task
+
+from .models import EmailOTP
+
+
+# what a code can be for; anything else posted as a purpose is refused
+PURPOSES = ('verify', 'reset')
+
+
+class RateLimited(Exception):
+    pass
+
+
+def owner(email=None, user=None):
+    return {'user': user} if user is not None else {'temp_email': email}
+
+
+def live(purpose, email=None, user=None):
+    """The codes that can still be used, newest first."""
+    return EmailOTP.objects.filter(
+        **owner(email, user),
+        purpose=purpose,
+        is_used=False,
+        created_at__gt=timezone.now() - timedelta(seconds=settings.OTP_TTL),
+    ).order_by('-created_at')
+
+
+def create(purpose, email=None, user=None):
+    """Create a code for ``email`` (or ``user``) and return the EmailOTP; raises RateLimited past the send limit."""
+    since = timezone.now() - timedelta(seconds=settings.OTP_SEND_WINDOW)
+    if EmailOTP.objects.filter(**owner(email, user), created_at__gte=since).count() >= settings.OTP_SEND_LIMIT:
+        raise RateLimited
+    EmailOTP.objects.filter(**owner(email, user), purpose=purpose, is_used=False).update(is_used=True)
+    code = f"{secrets.randbelow(1_000_000):06d}"
+    return EmailOTP.objects.create(user=user, temp_email=email, code=code, purpose=purpose)
+
+
+def issue(purpose, email=None, user=None):
+    """Create a code for ``email`` (or ``user``) and return it; raises RateLimited past the send limit."""
+    return create(purpose, email, user).code
+
+
+def send(purpose, subject, email=None, user=None):
+    """Create a code and queue the email carrying it; raises RateLimited past the send limit."""
+    otp = create(purpose, email, user)
+    return enqueue(mail_code, otp_id=otp.pk, subject=subject)
+
+
+@task(max_attempts=5, backoff=30)
+def mail_code(otp_id, subject):
+    otp = EmailOTP.objects.select_related('user').filter(pk=otp_id, is_used=False).first()
+    if otp is None:
+        return  # used, replaced or purged before the email went out
+    send_mail(
+        subject,
+        f"Your OTP is {otp.code}. It expires in {settings.OTP_TTL // 60} minutes.",
+        [otp.temp_email or otp.user.email],
+    )
+
+
+def verify(code, purpose, email=None, user=None):
+    """Use up the live code if it is ``code``; a wrong guess counts against it."""
+    otp = live(purpose, email, user).only('pk', 'code', 'attempts').first()
+    if otp is None or not code:
+        return False
+    if not constant_time_compare(otp.code, code):
+        EmailOTP.objects.filter(pk=otp.pk).update(
+            attempts=F('attempts') + 1,
+            is_used=otp.attempts + 1 >= settings.OTP_MAX_ATTEMPTS,
+        )
+        return False
+    # conditional, so two requests can't both use it
+    return EmailOTP.objects.filter(pk=otp.pk, is_used=False).update(is_used=True) == 1
+
+
+def purge(batch_size=1000):
+    """Delete the codes past their expiry and the rate-limit window, ``batch_size`` at a time."""
+    cutoff = timezone.now() - timedelta(seconds=max(settings.OTP_TTL, settings.OTP_SEND_WINDOW))
+    total = 0
+    while True:
+        pks = list(EmailOTP.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return total
+        total += EmailOTP.objects.filter(pk__in=pks).delete()[0]
@@ -1,3 +1,164 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from model2.testing import TEST_STORAGES
+
+from . import otp
+from .middleware import TermsCheckMiddleware
+from .models import EmailOTP, User
+
+
+@override_settings(STORAGES=TEST_STORAGES, SESSION_REFRESH_INTERVAL=600)
+class SlidingSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("reader", "reader@example.com", "pw", agreed_to_terms=True)
+        self.client.force_login(self.user)
+
+    def get_at(self, now):
+        with mock.patch("authentication.middleware.time.time", return_value=now):
+            return self.client.get(reverse("about"))
+
+    def test_session_is_written_at_most_once_per_interval(self):
+        first = self.get_at(1_000_000)
+        self.assertIn("sessionid", first.cookies)
+
+        self.assertNotIn("sessionid", self.get_at(1_000_300).cookies)
+        self.assertIn("sessionid", self.get_at(1_000_700).cookies)
+
+    def test_anonymous_visitors_get_no_session(self):
+        self.client.logout()
+        self.assertNotIn("sessionid", self.client.get(reverse("about")).cookies)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class TermsCheckTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("reader", "reader@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def test_users_must_accept_the_current_version(self):
+        self.assertRedirects(self.client.get(reverse("about")), reverse("terms_and_conditions"))
+        self.client.post(reverse("terms_and_conditions"), {"action": "accept"})
+        self.assertEqual(self.client.get(reverse("about")).status_code, 200)
+
+        with self.settings(TERMS_VERSION="2.0"):
+            self.assertRedirects(self.client.get(reverse("about")), reverse("terms_and_conditions"))
+
+    def test_accepted_terms_are_remembered_in_the_session(self):
+        User.objects.filter(pk=self.user.pk).update(agreed_to_terms=True)
+        self.client.get(reverse("about"))
+        middleware = TermsCheckMiddleware(lambda request: "ok")
+        request = RequestFactory().get(reverse("about"))
+        request.session = self.client.session  # no request.user: touching it would fail
+        with self.assertNumQueries(0):
+            self.assertEqual(middleware(request), "ok")
+
+
+class TermsCheckFastPathTests(TestCase):
+    """The terms check's fast paths run no query, URL lookup or user access."""
+
+    def assert_passes_untouched(self, request):
+        middleware = TermsCheckMiddleware(lambda request: "response")
+        middleware(request)  # build the matchers
+        with mock.patch.object(WSGIRequest, "user", new_callable=mock.PropertyMock, create=True) as user, \
+                mock.patch("authentication.middleware.reverse") as reverse_, \
+                mock.patch("authentication.middleware.redirect") as redirect, \
+                self.assertNumQueries(0):
+            self.assertEqual(middleware(request), "response")
+        user.assert_not_called()
+        reverse_.assert_not_called()
+        redirect.assert_not_called()
+
+    def test_exempt_paths_never_touch_the_session_or_user(self):
+        request = RequestFactory().get("/static/css/output.css")  # no session attached
+        self.assert_passes_untouched(request)
+
+    def test_accepted_session_is_a_dictionary_lookup(self):
+        request = RequestFactory().get("/home/browse/")
+        request.session = {TermsCheckMiddleware.SESSION_KEY: settings.TERMS_VERSION}
+        self.assert_passes_untouched(request)
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3, OTP_SEND_LIMIT=3)
+class EmailOTPTests(TestCase):
+    def test_a_code_is_used_once(self):
+        code = otp.issue("verify", email="new@example.com")
+
+        self.assertTrue(otp.verify(code, "verify", email="new@example.com"))
+        self.assertFalse(otp.verify(code, "verify", email="new@example.com"))
+
+    def test_verifying_is_one_probe_and_one_update(self):
+        code = otp.issue("verify", email="new@example.com")
+
+        with self.assertNumQueries(2):
+            self.assertTrue(otp.verify(code, "verify", email="new@example.com"))
+
+    def test_codes_are_for_their_email_and_purpose(self):
+        code = otp.issue("verify", email="new@example.com")
+
+        self.assertFalse(otp.verify(code, "reset", email="new@example.com"))
+        self.assertFalse(otp.verify(code, "verify", email="other@example.com"))
+
+    def test_a_new_code_retires_the_old_one(self):
+        old = otp.issue("verify", email="new@example.com")
+        new = otp.issue("verify", email="new@example.com")
+
+        self.assertEqual(otp.live("verify", email="new@example.com").count(), 1)
+        if old != new:
+            self.assertFalse(otp.verify(old, "verify", email="new@example.com"))
+        self.assertTrue(otp.verify(new, "verify", email="new@example.com"))
+
+    def test_expired_codes_fail(self):
+        code = otp.issue("verify", email="new@example.com")
+        EmailOTP.objects.update(created_at=timezone.now() - timedelta(seconds=settings.OTP_TTL + 1))
+
+        self.assertFalse(otp.verify(code, "verify", email="new@example.com"))
+
+    def test_wrong_guesses_burn_the_code(self):
+        code = otp.issue("verify", email="new@example.com")
+        wrong = "000000" if code != "000000" else "111111"
+        for _ in range(3):
+            self.assertFalse(otp.verify(wrong, "verify", email="new@example.com"))
+
+        self.assertFalse(otp.verify(code, "verify", email="new@example.com"))
+
+    def test_codes_per_email_are_limited(self):
+        for _ in range(3):
+            otp.issue("verify", email="new@example.com")
+
+        with self.assertRaises(otp.RateLimited):
+            otp.issue("verify", email="new@example.com")
+        with self.assertRaises(otp.RateLimited):
+            otp.issue("reset", email="new@example.com")  # the limit covers every purpose
+        otp.issue("verify", email="other@example.com")
+
+        response = self.client.post(reverse("send_otp"), {"email": "new@example.com"})
+        self.assertEqual(response.status_code, 429)
+
+    def test_unknown_purposes_are_refused(self):
+        for name in ("send_otp", "verify_email_otp"):
+            with self.subTest(view=name):
+                response = self.client.post(
+                    reverse(name), {"email": "new@example.com", "otp": "123456", "purpose": "x" * 100}
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(EmailOTP.objects.exists())
+
+    def test_purge_keeps_codes_inside_the_rate_limit_window(self):
+        otp.issue("verify", email="old@example.com")
+        otp.issue("verify", email="new@example.com")
+        EmailOTP.objects.filter(temp_email="old@example.com").update(
+            created_at=timezone.now() - timedelta(seconds=settings.OTP_SEND_WINDOW + 1),
+        )
+
+        call_command("purge_otps", "--batch-size", "1", stdout=StringIO())
+
+        self.assertEqual(list(EmailOTP.objects.values_list("temp_email", flat=True)), ["new@example.com"])
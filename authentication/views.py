@@ -1,13 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
-from .models import User, EmailOTP
+from .models import User
+from . import otp
+from model2 import images
 from .forms import UserUpdateForm, ForgotPasswordForm, OTPVerificationForm, ResetPasswordForm
 from django.urls import reverse 
-import random
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
 from django.db import IntegrityError
 from datetime import datetime, date
@@ -50,6 +50,8 @@ def update_profile(request):
 
                 # Save updated user info
                 updated_user.save()
+                if form.prepared_picture:
+                    images.attach(updated_user, 'profile_picture', form.prepared_picture)
 
                 messages.success(request, "Profile updated successfully!")
 
@@ -182,11 +184,11 @@ def verify_otp(request):
     if request.method == "POST":
         user = request.user
         code = request.POST.get("otp")
-        otp_obj = EmailOTP.objects.filter(user=user, code=code, is_used=False).last()
+        purpose = request.POST.get("purpose", "verify")
+        if purpose not in otp.PURPOSES:
+            return HttpResponseBadRequest("Unknown purpose.")
 
-        if otp_obj and not otp_obj.is_expired():
-            otp_obj.is_used = True
-            otp_obj.save()
+        if otp.verify(code, purpose, user=user):
             messages.success(request, "OTP verified successfully ✅")
             # Proceed with the next step (e.g. mark email as verified or allow password reset)
             return redirect("home")
@@ -199,26 +201,17 @@ def send_otp(request):
     if request.method == "POST":
         email = request.POST.get("email")
         purpose = request.POST.get("purpose", "verify")
+        if purpose not in otp.PURPOSES:
+            return JsonResponse({"success": False, "message": "Unknown purpose."}, status=400)
 
         if not email:
             return JsonResponse({"success": False, "message": "Email is required."})
 
-        otp = str(random.randint(100000, 999999))
-
-        # ✅ Create OTP entry not tied to any user
-        EmailOTP.objects.create(
-            user=None,  # No user link at all
-            code=otp,
-            purpose=purpose,
-            temp_email=email  # Add this field in your EmailOTP model if not already
-        )
-
-        send_mail(
-            subject="Your Verification Code",
-            message=f"Your OTP is {otp}. It expires in 10 minutes.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-        )
+        # not tied to any user yet
+        try:
+            otp.send(purpose, "Your Verification Code", email=email)
+        except otp.RateLimited:
+            return JsonResponse({"success": False, "message": "Too many codes requested. Please try again later."}, status=429)
 
         return JsonResponse({"success": True, "message": "OTP sent successfully!"})
 
@@ -230,17 +223,12 @@ def send_otp(request):
 def verify_email_otp(request):
     if request.method == "POST":
         email = request.POST.get("email")
-        otp = request.POST.get("otp")
-
-        otp_obj = EmailOTP.objects.filter(
-            temp_email=email,  # match to email directly
-            code=otp,
-            is_used=False
-        ).last()
+        code = request.POST.get("otp")
+        purpose = request.POST.get("purpose", "verify")
+        if purpose not in otp.PURPOSES:
+            return JsonResponse({"success": False, "message": "Unknown purpose."}, status=400)
 
-        if otp_obj and not otp_obj.is_expired():
-            otp_obj.is_used = True
-            otp_obj.save()
+        if otp.verify(code, purpose, email=email):
             return JsonResponse({"success": True, "message": "OTP verified successfully!"})
         else:
             return JsonResponse({"success": False, "message": "Invalid or expired OTP."})
@@ -265,29 +253,23 @@ def forgotpassword(request):
                 if not User.objects.filter(email=email).exists():
                     messages.error(request, "No account found with that email.")
                 else:
-                    otp = str(random.randint(100000, 999999))
-                    EmailOTP.objects.create(temp_email=email, code=otp, purpose="reset")
-                    send_mail(
-                        subject="Password Reset OTP",
-                        message=f"Your OTP is {otp}. It expires in 10 minutes.",
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[email],
-                    )
-                    request.session["reset_email"] = email
-                    messages.success(request, "OTP sent to your email.")
-                    stage = "otp"
+                    try:
+                        otp.send("reset", "Password Reset OTP", email=email)
+                    except otp.RateLimited:
+                        messages.error(request, "Too many codes requested. Please try again later.")
+                    else:
+                        request.session["reset_email"] = email
+                        messages.success(request, "OTP sent to your email.")
+                        stage = "otp"
             else:
                 messages.error(request, "Please enter a valid email address.")
 
         # --- Stage 2: user verifies OTP ---
         elif "verify_otp" in request.POST:
-            otp = request.POST.get("otp")
+            code = request.POST.get("otp")
             email = request.session.get("reset_email")
 
-            otp_obj = EmailOTP.objects.filter(temp_email=email, code=otp, is_used=False).last()
-            if otp_obj and not otp_obj.is_expired():
-                otp_obj.is_used = True
-                otp_obj.save()
+            if otp.verify(code, "reset", email=email):
                 request.session["otp_verified"] = True
                 messages.success(request, "OTP verified! You can now reset your password.")
                 stage = "reset"
@@ -336,6 +318,7 @@ def terms_and_conditions(request):
             user = request.user
             user.agreed_to_terms = True
             user.agreed_to_terms_date = timezone.now()
+            user.terms_version = settings.TERMS_VERSION
             user.save()
             return redirect('home')  # or your desired redirect
 
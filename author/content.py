@@ -0,0 +1,33 @@
+"""
+Chapter bodies.
+
+Chapter text lives in ChapterContent, zlib-compressed and off the chapter
+row, so listing chapters never drags the prose along; it is read only when
+one chapter is shown. Word count and reading time are worked out once, when
+the text is saved.
+"""
+import math
+import re
+import zlib
+
+from django.utils.html import strip_tags
+
+COMPRESSION_LEVEL = 6
+WORDS_PER_MINUTE = 200
+WORD_RE = re.compile(r"\w+(?:['’-]\w+)*")
+
+
+def compress(text):
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+def count_words(html):
+    return len(WORD_RE.findall(strip_tags(html or "")))
+
+
+def reading_minutes(words):
+    return math.ceil(words / WORDS_PER_MINUTE) if words else 0
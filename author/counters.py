@@ -0,0 +1,163 @@
+"""
+Write-behind counters.
+
+Views and activity events are accumulated per process and written back in
+batches, so readers of a hot chapter do not all queue on the same rows.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, models
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Fields that only ever change as counters; a save limited to these does not
+# change how a book or chapter looks to caches and search indexes.
+COUNTER_FIELDS = frozenset({
+    'views', 'likes', 'comments_count', 'rating', 'total_ratings',
+    'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+})
+
+
+def counters_only(update_fields):
+    return bool(update_fields) and set(update_fields) <= COUNTER_FIELDS
+
+
+class WriteBehindBuffer:
+    """Counts keyed by ``(group, key)`` that are flushed on an interval or size threshold."""
+
+    interval_setting = None
+    threshold_setting = None
+
+    def __init__(self, flush_interval=None, flush_threshold=None):
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, self.interval_setting, 10)
+
+    @property
+    def flush_threshold(self):
+        if self._flush_threshold is not None:
+            return self._flush_threshold
+        return getattr(settings, self.threshold_setting, 500)
+
+    def _add(self, group, key, amount):
+        with self._lock:
+            counts = self._pending.setdefault(group, Counter())
+            counts[key] += amount
+            size = sum(len(c) for c in self._pending.values())
+            due = (
+                size >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every pending count. Groups that fail are logged and kept for
+        the next flush, so a database hiccup never fails the request that
+        happened to trigger the flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        failed = {}
+        for group, counts in pending.items():
+            if not counts:
+                continue
+            try:
+                self.write(group, counts)
+            except DatabaseError:
+                logger.exception("Could not flush %s for %s; keeping it for the next flush", type(self).__name__, group)
+                failed[group] = counts
+        if failed:
+            with self._lock:
+                for group, counts in failed.items():
+                    self._pending.setdefault(group, Counter()).update(counts)
+
+    def write(self, group, counts):
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop every pending count without writing it."""
+        with self._lock:
+            self._pending = {}
+
+
+class ViewCounter(WriteBehindBuffer):
+    """Pending ``views`` increments keyed by model and primary key."""
+
+    interval_setting = "VIEW_COUNTER_FLUSH_INTERVAL"
+    threshold_setting = "VIEW_COUNTER_FLUSH_THRESHOLD"
+
+    def add(self, model, pk, amount=1):
+        """Queue ``amount`` views for one row."""
+        self._add(model, pk, amount)
+
+    def pending(self, model, pk):
+        """Views queued for a row but not yet written to the database."""
+        with self._lock:
+            return self._pending.get(model, {}).get(pk, 0)
+
+    def apply_pending(self, *instances):
+        """Add queued views to each ``instance.views`` so it shows the buffered total."""
+        with self._lock:
+            for instance in instances:
+                instance.views += self._pending.get(type(instance), {}).get(instance.pk, 0)
+
+    def write(self, model, counts):
+        # one UPDATE ... CASE per model
+        model.objects.filter(pk__in=list(counts)).update(
+            views=F("views") + Case(
+                *[When(pk=pk, then=Value(n)) for pk, n in counts.items()],
+                default=Value(0),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+
+
+class ActivityLog(WriteBehindBuffer):
+    """Pending ActivityEvent rows, merged per (kind, book, chapter, day) and bulk-inserted."""
+
+    interval_setting = "ACTIVITY_LOG_FLUSH_INTERVAL"
+    threshold_setting = "ACTIVITY_LOG_FLUSH_THRESHOLD"
+
+    def record(self, kind, book_id, chapter_id=None, count=1):
+        self._add(kind, (book_id, chapter_id, timezone.localdate()), count)
+
+    def write(self, kind, counts):
+        ActivityEvent = apps.get_model("author", "ActivityEvent")
+        ActivityEvent.objects.bulk_create([
+            ActivityEvent(kind=kind, book_id=book_id, chapter_id=chapter_id, day=day, count=n)
+            for (book_id, chapter_id, day), n in counts.items()
+            if n
+        ])
+
+
+view_counter = ViewCounter()
+activity_log = ActivityLog()
+
+
+@atexit.register
+def _flush_on_exit():
+    for buffer in (view_counter, activity_log):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Could not flush %s on exit", type(buffer).__name__)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from author.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's rating totals and histogram from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--book", type=int, action="append", dest="books", help="Only this book id (repeatable).")
+
+    def handle(self, *args, **options):
+        fixed = reconcile_ratings(options["books"])
+        self.stdout.write(self.style.SUCCESS(f"Corrected rating totals on {fixed} book(s)."))
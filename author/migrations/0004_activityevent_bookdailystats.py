@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0003_remove_chapterviewlog_chapter_remove_book_favorites_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('view', 'Chapter view'), ('chapter_like', 'Chapter like'), ('comment_like', 'Comment like'), ('collection_add', 'Added to collection')], max_length=20)),
+                ('count', models.IntegerField(default=1)),
+                ('day', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to='author.book')),
+                ('chapter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_events', to='author.chapter')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'book'], name='author_acti_day_c8c513_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('comment_likes', models.IntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('bookmarks', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='author.book')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('book', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_likes(apps, schema_editor):
+    """Move rows from the implicit liked_by tables into the new like tables."""
+    for model_name, like_name, target in (
+        ('Chapter', 'ChapterLike', 'chapter'),
+        ('Comment', 'CommentLike', 'comment'),
+    ):
+        through = apps.get_model('author', model_name).liked_by.through
+        Like = apps.get_model('author', like_name)
+        rows = through.objects.values_list(f'{target}_id', 'user_id').iterator(chunk_size=2000)
+        batch = []
+        for target_id, user_id in rows:
+            batch.append(Like(**{f'{target}_id': target_id, 'user_id': user_id}))
+            if len(batch) >= 2000:
+                Like.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Like.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0004_activityevent_bookdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChapterLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chapter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_rows', to='author.chapter')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('chapter', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_rows', to='author.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('comment', 'user')},
+            },
+        ),
+        migrations.RunPython(copy_likes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chapter',
+            name='liked_by',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='liked_by',
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='liked_by',
+            field=models.ManyToManyField(blank=True, related_name='liked_chapters', through='author.ChapterLike', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='liked_by',
+            field=models.ManyToManyField(blank=True, related_name='liked_comments', through='author.CommentLike', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_totals(apps, schema_editor):
+    Book = apps.get_model('author', 'Book')
+    Review = apps.get_model('author', 'Review')
+    books = {}
+    for row in Review.objects.order_by().values('book_id', 'rating').annotate(n=Count('id')):
+        book = books.setdefault(row['book_id'], Book(pk=row['book_id'], rating_sum=0, total_ratings=0))
+        setattr(book, f"rating_{row['rating']}", getattr(book, f"rating_{row['rating']}", 0) + row['n'])
+        book.total_ratings += row['n']
+        book.rating_sum += row['rating'] * row['n']
+    fields = ['rating', 'rating_sum', 'total_ratings', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    for book in books.values():
+        book.rating = round(book.rating_sum / book.total_ratings, 2)
+    Book.objects.bulk_update(list(books.values()), fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0005_like_through_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0006_book_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookdailystats',
+            index=models.Index(fields=['date'], name='author_book_date_a80f0a_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from author.content import compress, count_words, decompress, reading_minutes
+
+BATCH_SIZE = 500
+
+
+def move_content(apps, schema_editor):
+    """Compress every chapter's text into ChapterContent and count its words."""
+    Chapter = apps.get_model('author', 'Chapter')
+    ChapterContent = apps.get_model('author', 'ChapterContent')
+    chapters = Chapter.objects.only('id', 'content').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(chapters.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for chapter in batch:
+            chapter.word_count = count_words(chapter.content)
+            chapter.reading_minutes = reading_minutes(chapter.word_count)
+        ChapterContent.objects.bulk_create(
+            [ChapterContent(chapter_id=chapter.id, data=compress(chapter.content or '')) for chapter in batch]
+        )
+        Chapter.objects.bulk_update(batch, ['word_count', 'reading_minutes'])
+        last_id = batch[-1].id
+
+
+def restore_content(apps, schema_editor):
+    Chapter = apps.get_model('author', 'Chapter')
+    ChapterContent = apps.get_model('author', 'ChapterContent')
+    for body in ChapterContent.objects.iterator(chunk_size=BATCH_SIZE):
+        Chapter.objects.filter(id=body.chapter_id).update(content=decompress(body.data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0007_bookdailystats_author_book_date_a80f0a_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChapterContent',
+            fields=[
+                ('chapter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='body', serialize=False, to='author.chapter')),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='reading_minutes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(move_content, restore_content),
+        migrations.RemoveField(
+            model_name='chapter',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:29
+
+import json
+
+from django.db import migrations, models
+
+from author.content import compress, decompress
+from author.rendering import render_chapter
+
+BATCH_SIZE = 500
+
+
+def render_existing(apps, schema_editor):
+    """Sanitize and paginate the text of every chapter saved before rendering existed."""
+    ChapterContent = apps.get_model('author', 'ChapterContent')
+    bodies = ChapterContent.objects.order_by('chapter_id')
+    last_id = 0
+    while True:
+        batch = list(bodies.filter(chapter_id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for body in batch:
+            pages, body.etag = render_chapter(decompress(body.data))
+            body.rendered = compress(json.dumps(pages))
+        ChapterContent.objects.bulk_update(batch, ['rendered', 'etag'])
+        last_id = batch[-1].chapter_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0008_chapter_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chaptercontent',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='chaptercontent',
+            name='rendered',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
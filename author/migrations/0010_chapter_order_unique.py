@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:46
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def renumber_chapters(apps, schema_editor):
+    """Number every book's chapters 1..n, so duplicate orders and gaps left by old deletes go away."""
+    Chapter = apps.get_model('author', 'Chapter')
+    changed = []
+    book_id = position = None
+    for chapter in Chapter.objects.only('pk', 'Book_id', 'order').order_by('Book_id', 'order', 'pk').iterator(chunk_size=BATCH_SIZE):
+        if chapter.Book_id != book_id:
+            book_id, position = chapter.Book_id, 0
+        position += 1
+        if chapter.order != position:
+            chapter.order = position
+            changed.append(chapter)
+    Chapter.objects.bulk_update(changed, ['order'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0009_chapter_rendered'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_chapters, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='chapter',
+            unique_together={('Book', 'order')},
+        ),
+    ]
@@ -1,6 +1,23 @@
-from django.db import models
+import json
+
+from django.db import IntegrityError, models, transaction
 from authentication.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils.functional import cached_property
+from . import content as chapter_text
+from .counters import view_counter, activity_log
+from .rendering import render_chapter
+
+
+def origin_model(origin):
+    """The model whose delete sent a ``post_delete``, from the signal's ``origin``."""
+    return origin.model if isinstance(origin, models.QuerySet) else type(origin)
+
+
+def cascaded(origin, model):
+    """Whether a ``post_delete`` of ``model`` rows comes from deleting something else (a book, a user)."""
+    return origin is not None and origin_model(origin) is not model
 
 
 class Book(models.Model):
@@ -30,6 +47,13 @@ class Book(models.Model):
     views = models.PositiveIntegerField(default=0)
     rating = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(5)])
     total_ratings = models.PositiveIntegerField(default=0)
+    # running totals behind ``rating``, see apply_rating_change
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -46,55 +70,154 @@ class Book(models.Model):
         return round(self.rating, 2)
 
     def increment_views(self):
+        """Queue a view on the write-behind counter (see author.counters)."""
+        view_counter.add(type(self), self.pk)
         self.views += 1
-        self.save(update_fields=["views"])
-
-    def update_average_rating(self):
-        """Recalculate and update the book's average rating."""
-        reviews = self.reviews.all()
-        if reviews.exists():
-            avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-            self.rating = round(avg_rating, 2)
-            self.total_ratings = reviews.count()
-        else:
-            self.rating = 0
-            self.total_ratings = 0
-        self.save(update_fields=['rating', 'total_ratings'])
-    
+
+    @property
+    def rating_distribution(self):
+        """``[{'stars', 'count', 'percent'}, ...]`` from 5 stars down to 1."""
+        return [
+            {
+                'stars': stars,
+                'count': getattr(self, f'rating_{stars}'),
+                'percent': round(100 * getattr(self, f'rating_{stars}') / self.total_ratings) if self.total_ratings else 0,
+            }
+            for stars in range(5, 0, -1)
+        ]
+
+    @classmethod
+    def apply_rating_change(cls, book_id, added=None, removed=None):
+        """
+        Add a rating of ``added`` stars and/or take away one of ``removed``
+        stars in a single UPDATE, recomputing the average from the new totals.
+        """
+        count = (added is not None) - (removed is not None)
+        new_sum = models.F('rating_sum') + ((added or 0) - (removed or 0))
+        new_count = models.F('total_ratings') + count
+        histogram = {}
+        if added is not None:
+            histogram[f'rating_{added}'] = models.F(f'rating_{added}') + 1
+        if removed is not None:
+            histogram[f'rating_{removed}'] = models.F(f'rating_{removed}') - 1
+        cls.objects.filter(pk=book_id).update(
+            rating_sum=new_sum,
+            total_ratings=new_count,
+            rating=Coalesce(Round(Cast(new_sum, models.FloatField()) / NullIf(new_count, 0), 2), 0.0),
+            **histogram,
+        )
+
 
 class Chapter(models.Model):
     Book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="chapters")
     title = models.CharField(max_length=100)
-    content = models.TextField()
     order = models.PositiveIntegerField()
     views = models.PositiveIntegerField(default=0)
     likes = models.PositiveIntegerField(default=0)
-    liked_by = models.ManyToManyField(User, related_name="liked_chapters", blank=True)
+    liked_by = models.ManyToManyField(User, through="ChapterLike", related_name="liked_chapters", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     comments_count = models.PositiveIntegerField(default=0)
+    # --- worked out from the text when it is saved ---
+    word_count = models.PositiveIntegerField(default=0)
+    reading_minutes = models.PositiveSmallIntegerField(default=0)
+
+    # text assigned to ``content`` but not saved yet
+    _pending_content = None
+
+    class Meta:
+        # kept gapless by author.ordering
+        unique_together = ('Book', 'order')
 
     def __str__(self):
         return f"{self.order}. {self.title}"
 
+    @property
+    def content(self):
+        """The chapter text, read from ChapterContent the first time it is used."""
+        if self._pending_content is not None:
+            return self._pending_content
+        if self.pk is None:
+            return ""
+        try:
+            return self.body.text
+        except ChapterContent.DoesNotExist:
+            return ""
+
+    @content.setter
+    def content(self, value):
+        self._pending_content = value or ""
+
+    def save(self, *args, **kwargs):
+        text = self._pending_content
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields) - {"content"}
+        if text is not None:
+            self.word_count = chapter_text.count_words(text)
+            self.reading_minutes = chapter_text.reading_minutes(self.word_count)
+            if update_fields is not None:
+                update_fields |= {"word_count", "reading_minutes"}
+        if update_fields is not None:
+            kwargs["update_fields"] = update_fields
+
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if text is not None:
+                # an UPDATE of the text, or an INSERT for a new chapter (or
+                # one that had none), without reading the old text first
+                self.body = ChapterContent(chapter=self, **ChapterContent.values_for(text))
+                self.body.save(force_insert=adding)
+                self._pending_content = None
+
     def increment_views(self):
+        """Queue a view on the write-behind counter (see author.counters)."""
+        view_counter.add(type(self), self.pk)
+        activity_log.record(ActivityEvent.VIEW, self.Book_id, self.pk)
         self.views += 1
-        self.save(update_fields=["views"])
 
     def toggle_like(self, user):
         """Add or remove a like from a user."""
-        if user in self.liked_by.all():
-            self.liked_by.remove(user)
-            self.likes = models.F('likes') - 1
-            liked = False
-        else:
-            self.liked_by.add(user)
-            self.likes = models.F('likes') + 1
-            liked = True
-        self.save(update_fields=["likes"])
-        self.refresh_from_db(fields=["likes"])
+        liked, delta = ChapterLike.toggle(self, user)
+        if delta:
+            activity_log.record(ActivityEvent.CHAPTER_LIKE, self.Book_id, self.pk, delta)
         return liked
 
 
+class ChapterContent(models.Model):
+    """A chapter's text, compressed and kept off the chapter row (see author.content)."""
+    chapter = models.OneToOneField(Chapter, on_delete=models.CASCADE, primary_key=True, related_name="body")
+    data = models.BinaryField()
+    # sanitized HTML split into pages, compressed JSON (see author.rendering)
+    rendered = models.BinaryField(default=b"")
+    etag = models.CharField(max_length=64, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.chapter_id}"
+
+    @staticmethod
+    def values_for(text):
+        """Field values storing ``text`` and its rendered pages."""
+        pages, etag = render_chapter(text)
+        return {
+            "data": chapter_text.compress(text),
+            "rendered": chapter_text.compress(json.dumps(pages)),
+            "etag": etag,
+        }
+
+    @cached_property
+    def text(self):
+        return chapter_text.decompress(self.data)
+
+    @cached_property
+    def pages(self):
+        """The rendered pages; safe to output as they are."""
+        if not self.rendered:
+            return [""]
+        return json.loads(chapter_text.decompress(self.rendered))
+
+
 class Comment(models.Model):
     chapter = models.ForeignKey(Chapter, related_name='comments', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -103,26 +226,94 @@ class Comment(models.Model):
 
     # --- Likes for comments ---
     likes = models.PositiveIntegerField(default=0)
-    liked_by = models.ManyToManyField(User, related_name="liked_comments", blank=True)
+    liked_by = models.ManyToManyField(User, through="CommentLike", related_name="liked_comments", blank=True)
 
     def __str__(self):
         return f"Comment by {self.user} on {self.chapter}"
 
     def toggle_like(self, user):
         """Add or remove a like from a user."""
-        if user in self.liked_by.all():
-            self.liked_by.remove(user)
-            self.likes = models.F('likes') - 1
-            liked = False
-        else:
-            self.liked_by.add(user)
-            self.likes = models.F('likes') + 1
-            liked = True
-        self.save(update_fields=["likes"])
-        self.refresh_from_db(fields=["likes"])
+        liked, delta = CommentLike.toggle(self, user)
+        if delta:
+            activity_log.record(ActivityEvent.COMMENT_LIKE, self.chapter.Book_id, self.chapter_id, delta)
         return liked
 
 
+# --- Likes ---
+class Like(models.Model):
+    """
+    One row per (target, user). The target's ``likes`` column is a
+    denormalized count kept in step by ``toggle``.
+    """
+    target_field = None
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="%(class)ss")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def toggle(cls, target, user):
+        """
+        Like ``target`` if ``user`` has not, otherwise unlike it. Returns
+        ``(liked, delta)`` where delta is the change actually applied to the
+        count (0 if a concurrent request got there first), and leaves the
+        fresh count on ``target.likes``.
+        """
+        lookup = {cls.target_field: target, "user": user}
+        with transaction.atomic():
+            deleted, _ = cls.objects.filter(**lookup).delete()
+            if deleted:
+                liked, delta = False, -1
+            else:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(**lookup)
+                    liked, delta = True, 1
+                except IntegrityError:
+                    liked, delta = True, 0
+            if delta:
+                type(target).objects.filter(pk=target.pk).update(likes=models.F("likes") + delta)
+            target.refresh_from_db(fields=["likes"])
+        return liked, delta
+
+    @classmethod
+    def liked_ids(cls, user, targets):
+        """The ids among ``targets`` (ids or a queryset) that ``user`` has liked, in one query."""
+        if not user.is_authenticated:
+            return set()
+        return set(
+            cls.objects.filter(user=user, **{f"{cls.target_field}__in": targets})
+            .values_list(f"{cls.target_field}_id", flat=True)
+        )
+
+    @classmethod
+    def exists_for(cls, user, outer_ref="pk"):
+        """An annotation telling whether ``user`` likes each row of the outer query."""
+        if not user.is_authenticated:
+            return models.Value(False, output_field=models.BooleanField())
+        return models.Exists(cls.objects.filter(user=user, **{cls.target_field: models.OuterRef(outer_ref)}))
+
+
+class ChapterLike(Like):
+    target_field = "chapter"
+
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name="like_rows")
+
+    class Meta:
+        unique_together = ("chapter", "user")
+
+
+class CommentLike(Like):
+    target_field = "comment"
+
+    comment = models.ForeignKey("Comment", on_delete=models.CASCADE, related_name="like_rows")
+
+    class Meta:
+        unique_together = ("comment", "user")
+
+
 class Review(models.Model):
     book = models.ForeignKey(Book, related_name="reviews", on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -138,23 +329,67 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.user.username} rated {self.book.bname} ({self.rating}/5)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_rating = instance.__dict__.get('rating')
+        return instance
+
     def save(self, *args, **kwargs):
-        """Override save to update book rating stats automatically."""
-        super().save(*args, **kwargs)
-        self.update_book_rating()
-
-    def delete(self, *args, **kwargs):
-        """Recalculate average when review is deleted."""
-        book = self.book
-        super().delete(*args, **kwargs)
-        book.update_average_rating()
-
-    def update_book_rating(self):
-        """Recalculate the average rating for the book."""
-        reviews = Review.objects.filter(book=self.book)
-        avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg'] or 0
-        total_ratings = reviews.count()
-
-        self.book.rating = round(avg_rating, 2)
-        self.book.total_ratings = total_ratings
-        self.book.save(update_fields=['rating', 'total_ratings'])
+        """Save and move the book's rating totals by the change in this review's rating."""
+        previous = None if self._state.adding else getattr(self, '_saved_rating', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.rating != previous:
+                Book.apply_rating_change(self.book_id, added=self.rating, removed=previous)
+        self._saved_rating = self.rating
+
+
+class ActivityEvent(models.Model):
+    """
+    Append-only log of reader activity. Rows are written in batches by
+    author.counters.activity_log, one per (kind, book, chapter, day) with the
+    summed ``count`` (negative for unlikes), and rolled up into BookDailyStats.
+    """
+    VIEW = 'view'
+    CHAPTER_LIKE = 'chapter_like'
+    COMMENT_LIKE = 'comment_like'
+    COLLECTION_ADD = 'collection_add'  # no longer written; see author.rollups
+    KINDS = [
+        (VIEW, 'Chapter view'),
+        (CHAPTER_LIKE, 'Chapter like'),
+        (COMMENT_LIKE, 'Comment like'),
+        (COLLECTION_ADD, 'Added to collection'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='activity_events')
+    chapter = models.ForeignKey(Chapter, null=True, blank=True, on_delete=models.SET_NULL, related_name='activity_events')
+    count = models.IntegerField(default=1)
+    day = models.DateField()  # partition key
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['day', 'book'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} x{self.count} on {self.book_id} ({self.day})"
+
+
+class BookDailyStats(models.Model):
+    """Per-book totals for one day, rebuilt from ActivityEvent, Comment and Collection by author.rollups."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comment_likes = models.IntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    bookmarks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'date')
+        ordering = ['date']
+        indexes = [models.Index(fields=['date'])]  # date-range scans for rankings
+
+    def __str__(self):
+        return f"{self.book_id} on {self.date}"
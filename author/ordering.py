@@ -0,0 +1,115 @@
+"""
+Chapter order.
+
+A book's chapters are numbered 1..n without gaps, and (book, order) is
+unique. Inserting, deleting and moving a chapter shift the chapters after
+it with set-based UPDATEs instead of saving them one by one, inside a
+transaction that holds the book row locked, so two edits to the same book
+run one after the other.
+
+The unique constraint is checked row by row while an UPDATE runs, so
+moving a range by one in place could collide with a row not moved yet.
+A shift is therefore two UPDATEs: the range is lifted clear of every real
+order (by OFFSET), then set down at its new place.
+
+Inserting and deleting save or delete a chapter, whose signals already
+refresh what depends on the order (cached tables of contents, the first
+chapter's search excerpt). Moving and reordering only run UPDATEs, which
+skip the signals, so they send ``chapters_reordered`` instead.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+from django.dispatch import Signal
+
+from .models import Book, Chapter
+
+# above any real chapter order
+OFFSET = 1_000_000
+
+# sent with ``book_id`` after chapter orders changed without a save
+chapters_reordered = Signal()
+
+
+def lock_book(book_id):
+    """Hold the book row until the transaction ends (a no-op on SQLite, which locks the database)."""
+    list(Book.objects.select_for_update().filter(pk=book_id).values_list("pk", flat=True))
+
+
+def last_order(book_id):
+    return Chapter.objects.filter(Book_id=book_id).aggregate(last=Max("order"))["last"] or 0
+
+
+def shift(book_id, delta, start, end=None):
+    """Move the orders from ``start`` to ``end`` (inclusive, open-ended without) by ``delta``."""
+    chapters = Chapter.objects.filter(Book_id=book_id, order__gte=start)
+    if end is not None:
+        chapters = chapters.filter(order__lte=end)
+    if not chapters.update(order=F("order") + OFFSET):
+        return 0
+    return Chapter.objects.filter(Book_id=book_id, order__gte=OFFSET).update(order=F("order") - OFFSET + delta)
+
+
+def insert_chapter(book, position=None, **fields):
+    """Create a chapter at ``position`` (at the end without one), moving the later chapters down."""
+    with transaction.atomic():
+        lock_book(book.pk)
+        last = last_order(book.pk)
+        position = last + 1 if position is None else min(max(position, 1), last + 1)
+        if position <= last:
+            shift(book.pk, 1, position)
+        return Chapter.objects.create(Book=book, order=position, **fields)
+
+
+def delete_chapter(chapter):
+    """Delete ``chapter`` and close the gap it leaves."""
+    book_id = chapter.Book_id
+    with transaction.atomic():
+        lock_book(book_id)
+        order = Chapter.objects.filter(pk=chapter.pk).values_list("order", flat=True).first()
+        chapter.delete()
+        if order is not None:
+            shift(book_id, -1, order + 1)
+
+
+def move_chapter(chapter, position):
+    """Put ``chapter`` at ``position``, moving the chapters in between by one."""
+    book_id = chapter.Book_id
+    with transaction.atomic():
+        lock_book(book_id)
+        current = Chapter.objects.filter(pk=chapter.pk).values_list("order", flat=True).get()
+        position = min(max(position, 1), last_order(book_id))
+        if position == current:
+            return
+        Chapter.objects.filter(pk=chapter.pk).update(order=0)  # out of the way; real orders start at 1
+        if position < current:
+            shift(book_id, 1, position, current - 1)
+        else:
+            shift(book_id, -1, current + 1, position)
+        Chapter.objects.filter(pk=chapter.pk).update(order=position)
+    chapter.order = position
+    chapters_reordered.send(sender=Chapter, book_id=book_id)
+
+
+def reorder_chapters(book, chapter_ids):
+    """
+    Number the book's chapters in the order of ``chapter_ids``, which must
+    list each of them exactly once. Only the chapters whose place changed
+    are written, with one bulk_update.
+    """
+    chapter_ids = [int(pk) for pk in chapter_ids]
+    with transaction.atomic():
+        lock_book(book.pk)
+        chapters = Chapter.objects.filter(Book=book).only("pk", "order").in_bulk()
+        if len(chapter_ids) != len(chapters) or set(chapter_ids) != set(chapters):
+            raise ValueError("chapter_ids must list every chapter of the book once")
+        moved = []
+        for order, pk in enumerate(chapter_ids, start=1):
+            if chapters[pk].order != order:
+                chapters[pk].order = order
+                moved.append(chapters[pk])
+        if not moved:
+            return 0
+        Chapter.objects.filter(pk__in=[c.pk for c in moved]).update(order=F("order") + OFFSET)
+        Chapter.objects.bulk_update(moved, ["order"], batch_size=500)
+    chapters_reordered.send(sender=Chapter, book_id=book.pk)
+    return len(moved)
@@ -0,0 +1,49 @@
+"""
+Rebuilding Book rating totals from the reviews themselves.
+
+Review writes move the totals incrementally (Book.apply_rating_change); this
+is for repairing drift, e.g. after a bulk delete that skipped the signals.
+"""
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import Book, Review
+
+RATING_FIELDS = ['rating', 'rating_sum', 'total_ratings', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+def totals_from_reviews(book_ids=None):
+    """``{book_id: {field: value}}`` for every book with at least one review."""
+    rows = Review.objects.order_by().values('book_id', 'rating').annotate(n=Count('id'))
+    if book_ids is not None:
+        rows = rows.filter(book_id__in=book_ids)
+
+    totals = defaultdict(lambda: dict.fromkeys(RATING_FIELDS, 0))
+    for row in rows:
+        values = totals[row['book_id']]
+        values[f"rating_{row['rating']}"] += row['n']
+        values['total_ratings'] += row['n']
+        values['rating_sum'] += row['rating'] * row['n']
+    for values in totals.values():
+        values['rating'] = round(values['rating_sum'] / values['total_ratings'], 2)
+    return totals
+
+
+def reconcile_ratings(book_ids=None, batch_size=500):
+    """Make each book's rating totals match its reviews; returns how many books were corrected."""
+    totals = totals_from_reviews(book_ids)
+    empty = dict.fromkeys(RATING_FIELDS, 0)
+    books = Book.objects.only('pk', *RATING_FIELDS).order_by('pk')
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+
+    changed = []
+    for book in books.iterator(chunk_size=batch_size):
+        values = totals.get(book.pk, empty)
+        if any(getattr(book, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(book, field, value)
+            changed.append(book)
+    Book.objects.bulk_update(changed, RATING_FIELDS, batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,155 @@
+"""
+Sanitized, pre-rendered chapter HTML.
+
+Author HTML from the editor is cleaned once, when the chapter is saved: only
+an allowlist of tags, attributes and inline styles survives, scripts and
+similar elements are dropped with their contents, unclosed tags are closed
+and runs of empty spacer paragraphs are collapsed. Long chapters are cut
+into pages at top-level blocks. The pages and their ETag are stored with
+the chapter text (ChapterContent), so the reader page never re-parses or
+re-sanitizes anything.
+"""
+import hashlib
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from .content import WORD_RE
+
+PAGE_WORDS = 3000
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strike', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# dropped together with everything inside them. Never a void element (embed,
+# input...): those have no end tag to stop the dropping, and are skipped
+# like any other tag not allowed.
+DROPPED_TAGS = {
+    'script', 'style', 'iframe', 'object', 'noscript', 'template',
+    'textarea', 'select', 'button', 'form', 'svg', 'math', 'head', 'title',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+SAFE_URL_SCHEMES = {'', 'http', 'https', 'mailto'}
+ALLOWED_STYLES = {
+    'background-color', 'color', 'font-family', 'font-size', 'font-style', 'font-weight',
+    'margin-left', 'padding-left', 'text-align', 'text-decoration',
+}
+STYLE_VALUE_RE = re.compile(r"^[#\w\s,.%'\"()-]+$")
+CONTROL_RE = re.compile(r"[\x00-\x20\x7f]+")
+EMPTY_PARAGRAPHS_RE = re.compile(r"(?:<p>(?:\s|\xa0|<br>)*</p>\s*){2,}")
+
+
+def clean_url(value):
+    scheme = urlsplit(CONTROL_RE.sub('', value)).scheme.lower()
+    return value.strip() if scheme in SAFE_URL_SCHEMES else None
+
+
+def clean_style(value):
+    kept = []
+    for declaration in value.split(';'):
+        name, _, style = declaration.partition(':')
+        name, style = name.strip().lower(), style.strip()
+        if name in ALLOWED_STYLES and style and 'url(' not in style.lower() and STYLE_VALUE_RE.match(style):
+            kept.append(f"{name}: {style}")
+    return '; '.join(kept)
+
+
+class ChapterSanitizer(HTMLParser):
+    def __init__(self, page_words=PAGE_WORDS):
+        super().__init__(convert_charrefs=True)
+        self.page_words = page_words
+        self.pages = [[]]
+        self.words = 0      # words on the current page
+        self.open = []      # allowed tags currently open
+        self.dropping = 0   # depth inside a dropped element
+
+    def emit(self, markup):
+        self.pages[-1].append(markup)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        self.emit(f"<{tag}{self.clean_attributes(tag, attrs)}>")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <svg/> and the like have nothing inside to drop
+        if tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        while self.open:
+            closed = self.open.pop()
+            self.emit(f"</{closed}>")
+            if closed == tag:
+                break
+        if not self.open:
+            self.maybe_break_page()
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.emit(escape(data, quote=False))
+        self.words += len(WORD_RE.findall(data))
+        if not self.open:
+            self.maybe_break_page()
+
+    def maybe_break_page(self):
+        if self.words >= self.page_words:
+            self.pages.append([])
+            self.words = 0
+
+    def clean_attributes(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        cleaned = []
+        for name, value in attrs:
+            value = value or ''
+            if name == 'style':
+                value = clean_style(value)
+            elif name not in allowed:
+                continue
+            elif name in URL_ATTRIBUTES:
+                value = clean_url(value)
+            if value:
+                cleaned.append(f' {name}="{escape(value)}"')
+        if tag == 'a':
+            cleaned.append(' rel="nofollow noopener"')
+        return ''.join(cleaned)
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.emit(f"</{self.open.pop()}>")
+
+
+def render_chapter(html, page_words=PAGE_WORDS):
+    """``(pages, etag)``: sanitized HTML split into pages, and a hash of the result."""
+    sanitizer = ChapterSanitizer(page_words)
+    sanitizer.feed(html or '')
+    sanitizer.close()
+    pages = [EMPTY_PARAGRAPHS_RE.sub('<p>\xa0</p>', ''.join(page)).strip() for page in sanitizer.pages]
+    pages = [page for page in pages if page] or ['']
+    etag = hashlib.sha256('\x00'.join(pages).encode('utf-8')).hexdigest()[:32]
+    return pages, etag
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Book, Review, origin_model
+
+
+@receiver(post_delete, sender=Review)
+def remove_rating(sender, instance, origin=None, **kwargs):
+    # a receiver rather than Review.delete so reviews removed by a cascade
+    # (e.g. a deleted user) are taken out of the totals too; a deleted book
+    # takes its totals with it
+    if origin_model(origin) is Book:
+        return
+    Book.apply_rating_change(instance.book_id, removed=getattr(instance, '_saved_rating', instance.rating))
@@ -0,0 +1,124 @@
+"""
+Statistics for a book, shared by the author dashboard and anything else that
+needs the same numbers.
+
+Past days come from the BookDailyStats rollups; yesterday and today, which
+the periodic rollup may not have reached yet, are summed from the raw event
+log. Days without activity are filled in here rather than queried one by one.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import BookDailyStats, Chapter
+from .rollups import STAT_FIELDS, aggregate_daily, start_of_day
+
+DEFAULT_RANGE_DAYS = 7
+MAX_RANGE_DAYS = 365
+
+
+def parse_range(value, default=DEFAULT_RANGE_DAYS):
+    """Turn the ``?range=`` parameter into a day count between 1 and MAX_RANGE_DAYS."""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(days, 1), MAX_RANGE_DAYS)
+
+
+def calc_growth(today, yesterday):
+    if yesterday == 0:
+        return 100 if today > 0 else 0
+    return round(((today - yesterday) / yesterday) * 100, 1)
+
+
+def daily_totals(book, start, today):
+    """``{date: {field: total}}`` for ``book`` from ``start`` to ``today``."""
+    live_from = today - timedelta(days=1)
+    days = {
+        row['date']: row
+        for row in BookDailyStats.objects.filter(book=book, date__gte=start, date__lt=live_from)
+        .values('date', *STAT_FIELDS)
+    }
+    for (_, day), values in aggregate_daily(max(start, live_from), today, book=book).items():
+        days[day] = values
+    return days
+
+
+def book_statistics(book, range_days=DEFAULT_RANGE_DAYS, today=None):
+    """Everything the stats page shows for ``book`` over the last ``range_days`` days."""
+    today = today or timezone.localdate()
+    yesterday = today - timedelta(days=1)
+    # always cover yesterday so growth can be computed for a 1-day range
+    start = today - timedelta(days=max(range_days, 2) - 1)
+
+    days = daily_totals(book, start, today)
+    empty = dict.fromkeys(STAT_FIELDS, 0)
+
+    def views_on(day):
+        return days.get(day, empty)['views']
+
+    def likes_on(day):
+        return days.get(day, empty)['likes']
+
+    def comments_on(day):
+        return days.get(day, empty)['comments']
+
+    def bookmarks_on(day):
+        return days.get(day, empty)['bookmarks']
+
+    daily_labels, daily_views, daily_likes, daily_comments, daily_bookmarks, daily_engagement = [], [], [], [], [], []
+
+    for i in range(range_days):
+        day = today - timedelta(days=(range_days - 1 - i))
+        views_sum, likes_sum = views_on(day), likes_on(day)
+        comments_sum, bookmarks_sum = comments_on(day), bookmarks_on(day)
+
+        daily_labels.append(day.strftime("%b %d"))
+        daily_views.append(views_sum)
+        daily_likes.append(likes_sum)
+        daily_comments.append(comments_sum)
+        daily_bookmarks.append(bookmarks_sum)
+        daily_engagement.append(views_sum + likes_sum + comments_sum + bookmarks_sum)
+
+    today_views, today_likes = views_on(today), likes_on(today)
+    today_comments, today_bookmarks = comments_on(today), bookmarks_on(today)
+
+    engagement_data = {
+        "views": today_views,
+        "comments": today_comments,
+        "bookmarks": today_bookmarks,
+    }
+
+    start_month = today.replace(day=1)
+    next_month = (start_month + timedelta(days=32)).replace(day=1)
+
+    update_dates = list(
+        Chapter.objects.filter(
+            Book=book,
+            created_at__gte=start_of_day(start_month),
+            created_at__lt=start_of_day(next_month),
+        ).values_list("created_at__day", flat=True)
+    )
+
+    return {
+        "book": book,
+        "today_views": today_views,
+        "today_likes": today_likes,
+        "today_comments": today_comments,
+        "view_growth": calc_growth(today_views, views_on(yesterday)),
+        "like_growth": calc_growth(today_likes, likes_on(yesterday)),
+        "comment_growth": calc_growth(today_comments, comments_on(yesterday)),
+        "total_engagement": sum(engagement_data.values()),
+        "top_chapters": book.chapters.order_by("-views", "-likes")[:5],
+        "daily_labels": daily_labels,
+        "today_bookmarks": today_bookmarks,
+        "daily_views": daily_views,
+        "daily_likes": daily_likes,
+        "daily_comments": daily_comments,
+        "daily_bookmarks": daily_bookmarks,
+        "daily_engagement": daily_engagement,
+        "engagement_data": engagement_data,
+        "update_dates": update_dates,
+        "range": range_days,
+    }
@@ -1,3 +1,389 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from library.models import Collection, Library
+from model2.testing import TEST_STORAGES
+
+from . import content as chapter_text, ordering
+from .counters import ViewCounter, activity_log
+from .models import (
+    ActivityEvent, Book, BookDailyStats, Chapter, ChapterContent, ChapterLike, Comment, CommentLike, Review,
+)
+from .rendering import render_chapter
+from .rollups import rebuild_daily_stats
+from .statistics import book_statistics
+
+
+class RenderChapterTests(SimpleTestCase):
+    def render(self, html, **kwargs):
+        pages, _ = render_chapter(html, **kwargs)
+        return pages
+
+    def test_scripts_and_handlers_are_removed(self):
+        [page] = self.render(
+            '<p onclick="steal()">Hi<script>alert(1)</script></p>'
+            '<a href="javascript:alert(1)">x</a><a href="https://example.com" target="_blank">y</a>'
+        )
+        self.assertEqual(
+            page,
+            '<p>Hi</p><a rel="nofollow noopener">x</a>'
+            '<a href="https://example.com" rel="nofollow noopener">y</a>',
+        )
+
+    def test_styles_are_filtered_and_tags_closed(self):
+        [page] = self.render(
+            '<p style="text-align: center; position: fixed; background: url(x)"><strong>bold'
+        )
+        self.assertEqual(page, '<p style="text-align: center"><strong>bold</strong></p>')
+
+    def test_text_is_escaped_and_spacer_paragraphs_collapsed(self):
+        [page] = self.render('<p>a &lt;b&gt;</p><p>&nbsp;</p><p></p><p>&nbsp;</p><p>c</p>')
+        self.assertEqual(page, '<p>a &lt;b&gt;</p><p>\xa0</p><p>c</p>')
+
+    def test_long_chapters_split_at_top_level_blocks(self):
+        html = ''.join(f'<p>{"word " * 40}</p>' for _ in range(5))
+        pages = self.render(html, page_words=100)
+        self.assertEqual(len(pages), 2)
+        self.assertTrue(all(page.startswith('<p>') and page.endswith('</p>') for page in pages))
+
+    def test_void_and_self_closed_tags_do_not_drop_the_rest(self):
+        [page] = self.render('<p>a</p><embed src="x"><p>b</p><svg/><input type="text"><p>c</p>')
+        self.assertEqual(page, '<p>a</p><p>b</p><p>c</p>')
+
+    def test_etag_follows_the_rendered_output(self):
+        _, first = render_chapter('<p>same</p>')
+        _, with_script = render_chapter('<p>same</p><script>x()</script>')
+        _, other = render_chapter('<p>different</p>')
+        self.assertEqual(first, with_script)
+        self.assertNotEqual(first, other)
+
+
+class ChapterContentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+
+    def test_text_is_stored_compressed_with_its_counts(self):
+        text = "<p>" + "Über café-goers don't sleep. " * 200 + "</p>"
+        chapter = Chapter.objects.create(Book=self.book, title="One", content=text, order=1)
+
+        body = ChapterContent.objects.get(chapter=chapter)
+        self.assertLess(len(bytes(body.data)), len(text.encode()) / 10)
+        self.assertEqual(chapter_text.decompress(body.data), text)
+        self.assertEqual((chapter.word_count, chapter.reading_minutes), (800, 4))  # "café-goers", "don't": one word each
+        self.assertEqual(Chapter.objects.get(pk=chapter.pk).content, text)
+
+    def test_listing_chapters_leaves_the_text_unread(self):
+        Chapter.objects.create(Book=self.book, title="One", content="<p>text</p>", order=1)
+        with self.assertNumQueries(1):
+            [chapter] = self.book.chapters.all()
+            self.assertEqual(chapter.word_count, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(chapter.content, "<p>text</p>")
+
+    def test_saving_new_text_replaces_the_stored_text(self):
+        chapter = Chapter.objects.create(Book=self.book, title="One", content="<p>old</p>", order=1)
+        etag = chapter.body.etag
+        chapter = Chapter.objects.get(pk=chapter.pk)
+        chapter.content = "<p>new words</p>"
+        chapter.save()
+
+        body = ChapterContent.objects.get(chapter=chapter)
+        self.assertEqual((body.text, body.pages), ("<p>new words</p>", ["<p>new words</p>"]))
+        self.assertNotEqual(body.etag, etag)
+        self.assertEqual(ChapterContent.objects.count(), 1)
+
+        ChapterContent.objects.all().delete()  # a chapter whose text went missing
+        chapter.content = "<p>again</p>"
+        chapter.save()
+        self.assertEqual(ChapterContent.objects.get(chapter=chapter).text, "<p>again</p>")
+
+
+class ChapterOrderingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+        self.chapters = [
+            Chapter.objects.create(Book=self.book, title=f"Chapter {order}", content="text", order=order)
+            for order in range(1, 6)
+        ]
+
+    def titles(self):
+        return list(self.book.chapters.order_by("order").values_list("title", flat=True))
+
+    def orders(self):
+        return list(self.book.chapters.order_by("order").values_list("order", flat=True))
+
+    def test_deleting_closes_the_gap_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            ordering.delete_chapter(self.chapters[0])
+        for order in range(5, 40):
+            Chapter.objects.create(Book=self.book, title=f"Extra {order}", content="text", order=order)
+        first = self.book.chapters.get(order=1)
+        with CaptureQueriesContext(connection) as large:
+            ordering.delete_chapter(first)
+
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(self.orders(), list(range(1, 39)))
+        self.assertEqual(self.titles()[:3], ["Chapter 3", "Chapter 4", "Chapter 5"])
+
+    def test_inserting_at_a_position_moves_the_later_chapters_down(self):
+        ordering.insert_chapter(self.book, 2, title="New", content="text")
+        ordering.insert_chapter(self.book, 99, title="Last", content="text")
+        self.assertEqual(
+            self.titles(), ["Chapter 1", "New", "Chapter 2", "Chapter 3", "Chapter 4", "Chapter 5", "Last"]
+        )
+        self.assertEqual(self.orders(), list(range(1, 8)))
+
+    def test_moving_a_chapter_either_way(self):
+        ordering.move_chapter(self.chapters[0], 4)
+        self.assertEqual(self.titles(), ["Chapter 2", "Chapter 3", "Chapter 4", "Chapter 1", "Chapter 5"])
+        ordering.move_chapter(self.chapters[4], 1)
+        self.assertEqual(self.titles(), ["Chapter 5", "Chapter 2", "Chapter 3", "Chapter 4", "Chapter 1"])
+        self.assertEqual(self.orders(), list(range(1, 6)))
+
+    def test_reordering_writes_only_the_moved_chapters(self):
+        ids = [chapter.pk for chapter in self.chapters]
+        moved = ordering.reorder_chapters(self.book, [ids[1], ids[0], *ids[2:]])
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.titles()[:2], ["Chapter 2", "Chapter 1"])
+
+        with self.assertRaises(ValueError):
+            ordering.reorder_chapters(self.book, ids[:-1])
+
+    def test_reorder_view_is_for_the_books_author(self):
+        ids = [str(chapter.pk) for chapter in reversed(self.chapters)]
+        url = reverse("reorder_chapters", args=[self.book.pk])
+        self.client.force_login(self.author)
+        response = self.client.post(url, {"order[]": ids}, secure=True)
+        self.assertEqual(response.json(), {"success": True, "moved": 4})
+        self.assertEqual(self.titles()[0], "Chapter 5")
+        self.assertEqual(self.client.post(url, {"order[]": ids[:2]}, secure=True).status_code, 400)
+
+        other = User.objects.create_user("other", "other@example.com", "pw", agreed_to_terms=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(url, {"order[]": ids}, secure=True).status_code, 404)
+
+    def test_two_chapters_cannot_share_a_place(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Chapter.objects.create(Book=self.book, title="Duplicate", content="text", order=3)
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.books = [Book.objects.create(user=author, bname=f"Book {i}", genre="Fantasy", description="d") for i in range(3)]
+        self.chapter = Chapter.objects.create(Book=self.books[0], title="One", content="text", order=1)
+        self.counter = ViewCounter(flush_interval=3600, flush_threshold=1000)
+
+    def views(self, obj):
+        return type(obj).objects.values_list("views", flat=True).get(pk=obj.pk)
+
+    def test_each_model_is_written_with_one_case_update(self):
+        for i, book in enumerate(self.books):
+            self.counter.add(Book, book.pk, i + 1)
+        self.counter.add(Chapter, self.chapter.pk, 4)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.counter.flush()
+
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        self.assertIn("CASE WHEN", updates[0])
+
+        self.assertEqual([self.views(book) for book in self.books], [1, 2, 3])
+        self.assertEqual(self.views(self.chapter), 4)
+        self.assertEqual(self.counter.pending(Book, self.books[0].pk), 0)
+
+    def test_failed_groups_are_kept_and_the_rest_written(self):
+        self.counter.add(Book, self.books[0].pk, 2)
+        self.counter.add(Chapter, self.chapter.pk, 3)
+        write = ViewCounter.write
+
+        def failing_books(counter, model, counts):
+            if model is Book:
+                raise DatabaseError("locked")
+            write(counter, model, counts)
+
+        with mock.patch.object(ViewCounter, "write", failing_books), self.assertLogs("author.counters", "ERROR"):
+            self.counter.flush()
+
+        self.assertEqual(self.views(self.chapter), 3)
+        self.assertEqual(self.counter.pending(Book, self.books[0].pk), 2)
+        self.assertEqual(self.counter.pending(Chapter, self.chapter.pk), 0)
+
+        self.counter.flush()
+        self.assertEqual(self.views(self.books[0]), 2)
+
+    def test_a_failing_flush_does_not_fail_the_view_that_triggered_it(self):
+        counter = ViewCounter(flush_interval=3600, flush_threshold=1)
+        with mock.patch.object(ViewCounter, "write", side_effect=DatabaseError("locked")), \
+                self.assertLogs("author.counters", "ERROR"):
+            counter.add(Book, self.books[0].pk)
+
+        self.assertEqual(counter.pending(Book, self.books[0].pk), 1)
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_log.clear)
+        author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.readers = [User.objects.create_user(f"r{i}", f"r{i}@example.com", "pw") for i in range(2)]
+        book = Book.objects.create(user=author, bname="Book", genre="Fantasy", description="d")
+        self.chapter = Chapter.objects.create(Book=book, title="One", content="text", order=1)
+        self.comment = Comment.objects.create(chapter=self.chapter, user=author, content="hi")
+
+    def test_toggling_likes_and_unlikes_and_keeps_the_count(self):
+        first, second = self.readers
+        self.assertTrue(self.chapter.toggle_like(first))
+        self.assertTrue(self.chapter.toggle_like(second))
+        self.assertEqual(self.chapter.likes, 2)
+
+        self.assertFalse(self.chapter.toggle_like(first))
+        self.assertEqual(self.chapter.likes, 1)
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).likes, 1)
+        self.assertEqual(list(ChapterLike.objects.values_list("user", flat=True)), [second.pk])
+
+    def test_comment_likes_are_counted_apart_from_chapter_likes(self):
+        self.comment.toggle_like(self.readers[0])
+
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).likes, 1)
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).likes, 0)
+        self.assertEqual(CommentLike.liked_ids(self.readers[0], [self.comment.pk]), {self.comment.pk})
+        self.assertEqual(CommentLike.liked_ids(self.readers[1], [self.comment.pk]), set())
+
+
+class RatingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.readers = [User.objects.create_user(f"r{i}", f"r{i}@example.com", "pw") for i in range(3)]
+        self.book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+
+    def totals(self):
+        book = Book.objects.get(pk=self.book.pk)
+        return book.rating, book.total_ratings, [getattr(book, f"rating_{stars}") for stars in range(1, 6)]
+
+    def test_totals_follow_new_edited_and_deleted_reviews(self):
+        reviews = [Review.objects.create(book=self.book, user=reader, rating=rating)
+                   for reader, rating in zip(self.readers, (5, 4, 2))]
+        self.assertEqual(self.totals(), (3.67, 3, [0, 1, 0, 1, 1]))
+
+        edited = Review.objects.get(pk=reviews[2].pk)
+        edited.rating = 5
+        edited.save()
+        edited.review = "Still a five"
+        edited.save()
+        self.assertEqual(self.totals(), (4.67, 3, [0, 0, 0, 1, 2]))
+
+        Review.objects.get(pk=reviews[0].pk).delete()
+        self.assertEqual(self.totals(), (4.5, 2, [0, 0, 0, 1, 1]))
+
+        self.readers[1].delete()
+        self.assertEqual(self.totals(), (5.0, 1, [0, 0, 0, 0, 1]))
+
+    def test_deleting_a_book_does_not_update_it_per_review(self):
+        for reader in self.readers:
+            Review.objects.create(book=self.book, user=reader, rating=3)
+        with CaptureQueriesContext(connection) as queries:
+            self.book.delete()
+        self.assertFalse([q for q in queries if q["sql"].startswith('UPDATE "author_book"')])
+
+    def test_reconcile_ratings_repairs_drift(self):
+        for reader, rating in zip(self.readers, (1, 3, 5)):
+            Review.objects.create(book=self.book, user=reader, rating=rating)
+        Book.objects.filter(pk=self.book.pk).update(rating=1.0, total_ratings=7, rating_3=0)
+
+        out = StringIO()
+        call_command("reconcile_ratings", "--book", str(self.book.pk), stdout=out)
+
+        self.assertIn("Corrected rating totals on 1 book(s).", out.getvalue())
+        self.assertEqual(self.totals(), (3.0, 3, [1, 0, 1, 0, 1]))
+
+
+class StatisticsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.readers = [User.objects.create_user(f"r{i}", f"r{i}@example.com", "pw") for i in range(3)]
+        self.book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+        self.chapter = Chapter.objects.create(Book=self.book, title="One", content="text", order=1)
+
+    def event(self, kind, count, days_ago=0):
+        ActivityEvent.objects.create(
+            kind=kind, book=self.book, chapter=self.chapter, count=count, day=self.today - timedelta(days=days_ago)
+        )
+
+    def bookmark(self, reader, days_ago=0):
+        library, _ = Library.objects.get_or_create(user=reader)
+        entry = Collection.objects.create(library=library, book=self.book)
+        Collection.objects.filter(pk=entry.pk).update(added_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_rollup_sums_events_comments_and_bookmarks(self):
+        self.event(ActivityEvent.VIEW, 5)
+        self.event(ActivityEvent.VIEW, 2)
+        self.event(ActivityEvent.CHAPTER_LIKE, 3)
+        self.event(ActivityEvent.CHAPTER_LIKE, -1)
+        self.event(ActivityEvent.COLLECTION_ADD, 1)  # written before bookmarks came from Collection
+        Comment.objects.create(chapter=self.chapter, user=self.readers[0], content="Nice")
+        self.bookmark(self.readers[0])
+        self.bookmark(self.readers[1], days_ago=3)  # from before the event log
+
+        self.assertEqual(rebuild_daily_stats(self.today - timedelta(days=3), self.today), 2)
+
+        today = BookDailyStats.objects.get(book=self.book, date=self.today)
+        self.assertEqual((today.views, today.likes, today.comments, today.bookmarks), (7, 2, 1, 1))
+        earlier = BookDailyStats.objects.get(book=self.book, date=self.today - timedelta(days=3))
+        self.assertEqual((earlier.views, earlier.bookmarks), (0, 1))
+
+    def test_rollup_command_replaces_the_days_it_covers(self):
+        BookDailyStats.objects.create(book=self.book, date=self.today, views=99)
+        self.event(ActivityEvent.VIEW, 4)
+
+        out = StringIO()
+        call_command("rollup_daily_stats", "--days", "2", stdout=out)
+
+        self.assertIn("Rebuilt 1 daily rows", out.getvalue())
+        self.assertEqual(BookDailyStats.objects.get(book=self.book, date=self.today).views, 4)
+
+    def test_statistics_read_rollups_for_past_days_and_raw_rows_for_recent_ones(self):
+        BookDailyStats.objects.create(book=self.book, date=self.today - timedelta(days=3), views=10, bookmarks=2)
+        BookDailyStats.objects.create(book=self.book, date=self.today, views=99)  # not rolled up again yet
+        self.event(ActivityEvent.VIEW, 2, days_ago=1)
+        self.event(ActivityEvent.VIEW, 4)
+        self.bookmark(self.readers[0])
+
+        stats = book_statistics(self.book, 7, today=self.today)
+
+        self.assertEqual(stats["daily_views"], [0, 0, 0, 10, 0, 2, 4])
+        self.assertEqual(stats["daily_bookmarks"], [0, 0, 0, 2, 0, 0, 1])
+        self.assertEqual((stats["today_views"], stats["view_growth"]), (4, 100.0))
+        self.assertEqual(stats["total_engagement"], 5)
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_statistics_page_clamps_the_range_and_is_the_author_s_only(self):
+        url = reverse("statistics", args=[self.book.pk])
+        self.client.force_login(self.author)
+        for value, days in (("30", 30), ("0", 1), ("9999", 365), ("abc", 7)):
+            response = self.client.get(url, {"range": value})
+            self.assertEqual(response.context["range"], days)
+            self.assertEqual(len(response.context["daily_views"]), days)
+
+        self.client.force_login(User.objects.create_user("other", "other@example.com", "pw", agreed_to_terms=True))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_statistics_take_the_same_queries_for_any_range(self):
+        self.event(ActivityEvent.VIEW, 1)
+        with CaptureQueriesContext(connection) as week:
+            list(book_statistics(self.book, 7)["top_chapters"])
+        with CaptureQueriesContext(connection) as year:
+            list(book_statistics(self.book, 365)["top_chapters"])
+        self.assertEqual(len(week), len(year))
@@ -10,6 +10,7 @@ urlpatterns = [
     path('create/editbook/<int:book_id>/', login_required(views.editbook, login_url='login'), name='editbook'),
     path('create/addchapter/<int:book_id>/', login_required(views.addchapter, login_url='login'), name='addchapter'),
     path('create/abookpage/<int:book_id>/', login_required(views.abookpage, login_url='login'), name='abookpage'),
+    path('create/reorder/<int:book_id>/', login_required(views.reorder_chapters, login_url='login'), name='reorder_chapters'),
     path("create/<int:pk>/delete_chapter/", login_required(views.delete_chapter, login_url='login'), name="delete_chapter"),
     path('create/<int:chapter_id>/edit/', login_required(views.edit_chapter, login_url='login'), name='edit_chapter'),
     path("create/<int:pk>/delete_book/", login_required(views.delete_book, login_url='login'), name="delete_book"),
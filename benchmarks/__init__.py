@@ -0,0 +1,16 @@
+"""
+Query, time and memory budgets for every view.
+
+``benchmarks.factories`` seeds a dataset with bulk inserts and
+``benchmarks.tests`` requests every URL of the reader, author, library and
+moderator apps against it, failing when a view runs more queries, takes
+longer or allocates more than its budget in ``benchmarks.budgets``. It
+also checks how fast queued email goes out through the task queue.
+
+The query budgets run with the rest of the suite on a small dataset. The
+wall-clock and memory ceilings depend on the machine, so those tests are
+tagged ``benchmark`` and left out unless asked for. For release tracking,
+pick a larger dataset and keep the report::
+
+    BENCHMARK_SCALE=large BENCHMARK_REPORT=benchmark.json python manage.py test benchmarks --tag benchmark
+"""
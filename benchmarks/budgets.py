@@ -0,0 +1,110 @@
+"""
+The routes to benchmark and what each may cost.
+
+ROUTES is keyed by URL name, optionally with a ``:variant`` suffix when a
+name is requested more than once (a form page and its POST). Each entry
+gives:
+
+* ``as``: who makes the request, one of benchmarks.runner.ROLES;
+* ``args``, ``query`` / ``data``: URL arguments and GET or POST data, either
+  as they are or as a function of the seeded dataset;
+* ``method``: ``get`` (the default) or ``post``;
+* ``queries``: the most queries a cold request (empty cache) may run. A
+  function of the dataset for the views known to grow with it, so the
+  number records how they grow until they are fixed;
+* ``seconds`` / ``memory``: wall time and peak allocation ceilings when the
+  defaults below do not fit, checked only by the ``benchmark``-tagged tests;
+* ``skip``: why the route cannot be measured.
+
+The task queue has budgets of its own: the queries a request spends
+queueing an email, and (``benchmark``-tagged) how many queued emails a
+worker sends per second.
+"""
+MAX_SECONDS = 2.0
+MAX_MEMORY = 64 * 1024 * 1024
+
+TASK_ENQUEUE_QUERIES = 1
+MIN_TASKS_PER_SECOND = 100
+
+book = lambda d: (d["book"],)  # noqa: E731
+chapter = lambda d: (d["chapter"],)  # noqa: E731
+
+ROUTES = {
+    # --- reader ---
+    "home": {"as": "anonymous", "queries": 3},
+    "browse": {"as": "anonymous", "queries": 2},
+    "browse:search": {"as": "anonymous", "query": {"q": "Book 1"}, "queries": 3},
+    "browse_more": {"as": "anonymous", "query": {"q": "Book"}, "queries": 2},
+    "ranking": {"as": "anonymous", "queries": 2},
+    "contest": {"as": "anonymous", "queries": 0},
+    "about": {"as": "anonymous", "queries": 0},
+    "book": {"as": "anonymous", "args": book, "queries": 11},
+    "book:signed-in": {"as": "reader", "args": book, "queries": 13},
+    "read": {"as": "reader", "args": lambda d: (d["book"], d["chapter"]), "queries": 7},
+    "add_to_collection": {"as": "reader", "args": book, "queries": 6},
+    "increment_chapter_view": {"as": "reader", "method": "post", "args": chapter, "queries": 4},
+    "toggle_like": {"as": "reader", "method": "post", "args": book, "skip": "Book has no favorites relation"},
+    "toggle_chapter_like": {"as": "reader", "method": "post", "args": chapter, "queries": 8},
+    "add_comment": {"as": "reader", "method": "post", "args": chapter, "data": {"content": "Benchmark"}, "queries": 6},
+    "chapter_comments": {"as": "reader", "args": chapter, "queries": 3},
+    "add_or_edit_review": {
+        "as": "reader", "method": "post", "args": book, "data": {"rating": 4, "review": "Edited"}, "queries": 11,
+    },
+    "delete_review": {"as": "reader", "method": "post", "args": book, "queries": 7},
+    "delete_review_by_id": {"as": "reader", "method": "post", "args": lambda d: (d["review"],), "queries": 7},
+    "check_review": {"as": "reader", "args": book, "queries": 4},
+    "book_reviews": {"as": "anonymous", "args": book, "queries": 3},
+
+    # --- author ---
+    "create": {"as": "author", "queries": 4},
+    "payment": {"as": "author", "queries": 2},
+    "addbook": {"as": "author", "queries": 2},
+    "addbook:post": {
+        "as": "author", "method": "post",
+        "data": {"bname": "New", "btype": "novel", "genre": "Fantasy", "agerating": "13+", "description": "d"},
+        "queries": 10,
+    },
+    "editbook": {"as": "author", "args": book, "queries": 4},
+    "addchapter": {"as": "author", "args": book, "queries": 3},
+    "addchapter:post": {
+        "as": "author", "method": "post", "args": book, "data": {"title": "New", "content": "<p>New chapter</p>"},
+        "queries": 14,
+    },
+    "abookpage": {"as": "author", "args": book, "queries": 5},
+    "delete_chapter": {"as": "author", "args": chapter, "queries": 21},
+    "reorder_chapters": {
+        "as": "author", "method": "post", "args": book,
+        "data": lambda d: {"order[]": [d["last_chapter"], *d["chapter_ids"][:-1]]}, "queries": 12,
+    },
+    "edit_chapter": {"as": "author", "args": chapter, "queries": 5},
+    "edit_chapter:post": {
+        "as": "author", "method": "post", "args": chapter, "data": {"title": "Edited", "content": "<p>Edited</p>"},
+        "queries": 11,
+    },
+    # the cascade deletes by lists of ids, which SQLite takes in batches of
+    # at most 999, so the large dataset needs a couple more
+    "delete_book": {"as": "author", "args": book, "queries": 30},
+    "statistics": {"as": "author", "args": book, "query": {"range": 30}, "queries": 11},
+
+    # --- library ---
+    "library": {"as": "reader", "queries": 5},
+    "library_collection_more": {"as": "reader", "queries": 4},
+    "remove_from_collection": {"as": "reader", "args": book, "queries": 4},
+
+    # --- moderator ---
+    "highlight_list": {"as": "staff", "queries": 15},
+    # lists every book, loading each one's author separately
+    "add_book_page": {
+        "as": "staff",
+        "queries": lambda d: 4 + d["counts"]["books"], "seconds": lambda d: MAX_SECONDS + d["counts"]["books"] / 500,
+    },
+    "add_highlight": {
+        "as": "staff", "method": "post", "data": lambda d: {"book_id": d["book"], "category": "FEATURED"}, "queries": 7,
+    },
+    "delete_highlight": {"as": "staff", "args": lambda d: (d["highlight"],), "queries": 6},
+    "reorder_highlight": {
+        "as": "staff", "method": "post", "data": lambda d: {"order[]": d["top_shelf"][::-1]}, "queries": 7,
+    },
+    "add_news": {"as": "staff", "method": "post", "data": {"title": "News", "content": "Benchmark"}, "queries": 3},
+    "delete_news": {"as": "staff", "args": lambda d: (d["news"],), "queries": 4},
+}
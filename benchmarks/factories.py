@@ -0,0 +1,265 @@
+"""
+Bulk factories for the benchmark dataset.
+
+Everything is written with bulk_create, so no model signals run: the
+denormalized counters (likes, comments_count, rating totals) are set here
+and the derived tables (rankings, search index) are rebuilt at the end the
+way their management commands do it.
+"""
+import io
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.utils import timezone
+
+from authentication.models import User
+from author import content as chapter_text
+from author.models import (
+    ActivityEvent, Book, BookDailyStats, Chapter, ChapterContent, ChapterLike, Comment, CommentLike, Review,
+)
+from author.ratings import reconcile_ratings
+from library.models import Collection, History, Library
+from moderator.models import HighlightedBook, News
+from reader.rankings import refresh_rankings
+
+BATCH_SIZE = 1000
+
+SCALES = {
+    # part of the normal test run
+    "small": {
+        "users": 40, "authors": 5, "books": 12, "chapters": 20, "commented_chapters": 3,
+        "comments": 10, "likes": 10, "reviews": 10, "collection": 10, "history": 5, "days": 30,
+        "tasks": 200,
+    },
+    "medium": {
+        "users": 1000, "authors": 100, "books": 300, "chapters": 100, "commented_chapters": 5,
+        "comments": 30, "likes": 50, "reviews": 30, "collection": 30, "history": 15, "days": 60,
+        "tasks": 2000,
+    },
+    # what the site is expected to grow to
+    "large": {
+        "users": 5000, "authors": 500, "books": 2000, "chapters": 200, "commented_chapters": 5,
+        "comments": 50, "likes": 200, "reviews": 50, "collection": 100, "history": 15, "days": 90,
+        "tasks": 10000,
+    },
+}
+
+GENRES = ["Fantasy", "Romance", "Mystery", "Sci-Fi", "Horror", "Drama"]
+PARAGRAPH = (
+    "The lamps along the harbour went out one by one as she walked, and the "
+    "sea kept its own counsel beneath the boards. "
+)
+
+
+def chapter_bodies(variants=3, paragraphs=60):
+    """A few ChapterContent value sets, rendered once and shared by every chapter."""
+    bodies = []
+    for variant in range(variants):
+        text = "".join(f"<p>{variant} {PARAGRAPH * 4}</p>" for _ in range(paragraphs))
+        words = chapter_text.count_words(text)
+        bodies.append((ChapterContent.values_for(text), words, chapter_text.reading_minutes(words)))
+    return bodies
+
+
+def create_users(count):
+    password = make_password("benchmark")  # hashing once, not per user
+    users = User.objects.bulk_create(
+        [
+            User(
+                username=f"user{i}", email=f"user{i}@example.com", password=password,
+                agreed_to_terms=True, terms_accepted_at=timezone.now(),
+            )
+            for i in range(count)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    libraries = Library.objects.bulk_create([Library(user=user) for user in users], batch_size=BATCH_SIZE)
+    return users, {library.user_id: library.pk for library in libraries}
+
+
+def create_books(authors, count):
+    return Book.objects.bulk_create(
+        [
+            Book(
+                user=authors[i % len(authors)],
+                bname=f"Book {i}",
+                btype=Book.BOOK_TYPES[i % len(Book.BOOK_TYPES)][0],
+                genre=GENRES[i % len(GENRES)],
+                agerating=Book.AGE_RATINGS[i % len(Book.AGE_RATINGS)][0],
+                description=f"The {i}th book of the benchmark shelf.",
+                views=i * 37 % 1000,
+            )
+            for i in range(count)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def create_chapters(book, scale, bodies, likes):
+    """The chapters of one book with their text; the first few carry the comments and likes."""
+    chapters = Chapter.objects.bulk_create(
+        [
+            Chapter(
+                Book=book, title=f"Chapter {order}", order=order, views=order * 7,
+                likes=likes if order <= scale["commented_chapters"] else 0,
+                comments_count=scale["comments"] if order <= scale["commented_chapters"] else 0,
+                word_count=bodies[order % len(bodies)][1],
+                reading_minutes=bodies[order % len(bodies)][2],
+            )
+            for order in range(1, scale["chapters"] + 1)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    ChapterContent.objects.bulk_create(
+        [ChapterContent(chapter=chapter, **bodies[chapter.order % len(bodies)][0]) for chapter in chapters],
+        batch_size=BATCH_SIZE,
+    )
+    return chapters
+
+
+def create_discussion(chapters, readers, scale, likes):
+    """Comments, chapter likes and comment likes on the commented chapters."""
+    commented = chapters[:scale["commented_chapters"]]
+    voters = readers[:likes]
+    comments = Comment.objects.bulk_create(
+        [
+            Comment(
+                chapter=chapter, user=readers[i % len(readers)], content=f"Comment {i} on {chapter.title}",
+                likes=likes if i == 0 else 0,
+            )
+            for chapter in commented
+            for i in range(scale["comments"])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    ChapterLike.objects.bulk_create(
+        [ChapterLike(chapter=chapter, user=user) for chapter in commented for user in voters],
+        batch_size=BATCH_SIZE,
+    )
+    CommentLike.objects.bulk_create(
+        [CommentLike(comment=comment, user=user) for comment in comments if comment.likes for user in voters],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def create_reviews(books, readers, scale):
+    count = min(scale["reviews"], len(readers))
+    Review.objects.bulk_create(
+        [
+            Review(book=book, user=readers[(j + k) % len(readers)], rating=(j + k) % 5 + 1, review=f"Review {k}")
+            for j, book in enumerate(books)
+            for k in range(count)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    reconcile_ratings()
+
+
+def create_libraries(books, readers, libraries, first_chapters, scale):
+    """Each reader's collection and reading history, starting from a different book."""
+    collections, history = [], []
+    for i, user in enumerate(readers):
+        library_id = libraries[user.pk]
+        for k in range(min(scale["collection"], len(books))):
+            book = books[(i + k) % len(books)]
+            collections.append(Collection(library_id=library_id, book=book))
+        for k in range(min(scale["history"], History.LIMIT, len(books))):
+            book = books[(i + k) % len(books)]
+            history.append(History(library_id=library_id, book=book, last_read_chapter=first_chapters[book.pk]))
+    Collection.objects.bulk_create(collections, batch_size=BATCH_SIZE)
+    History.objects.bulk_create(history, batch_size=BATCH_SIZE)
+
+
+def create_activity(books, scale):
+    """Rolled-up daily stats for past days and raw events for the days not rolled up yet."""
+    today = timezone.localdate()
+    stats, events = [], []
+    for j, book in enumerate(books):
+        for day in range(2, scale["days"]):
+            stats.append(BookDailyStats(
+                book=book, date=today - timedelta(days=day),
+                views=(j * 13 + day * 7) % 500, likes=(j + day) % 20, comments=(j + day) % 5, bookmarks=day % 3,
+            ))
+        for day in (0, 1):
+            events.append(ActivityEvent(kind=ActivityEvent.VIEW, book=book, count=j % 50 + 1, day=today - timedelta(days=day)))
+    BookDailyStats.objects.bulk_create(stats, batch_size=BATCH_SIZE)
+    ActivityEvent.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+
+def create_home(books, staff):
+    HighlightedBook.objects.bulk_create(
+        [
+            HighlightedBook(book=book, category=category, order=order, added_by=staff)
+            for category, shelf in ((HighlightedBook.CATEGORY_TOP, books[:15]), (HighlightedBook.CATEGORY_FEATURED, books[15:25] or books[:10]))
+            for order, book in enumerate(shelf, start=1)
+        ]
+    )
+    News.objects.bulk_create([News(title=f"News {i}", content=f"Announcement {i}", added_by=staff) for i in range(10)])
+
+
+def seed(scale="small"):
+    """
+    Create the dataset for ``scale`` (a key of SCALES) and return what the
+    benchmarked routes need: the users playing each role and the ids of the
+    rows they act on.
+    """
+    scale = SCALES[scale]
+    bodies = chapter_bodies()
+
+    users, libraries = create_users(scale["users"])
+    staff, author, reader = users[:3]
+    User.objects.filter(pk=staff.pk).update(is_staff=True)
+    staff.is_staff = True
+    # the first reader is ``reader``, so they have reviewed, liked and collected the first book
+    authors, readers = users[1:1 + scale["authors"]], users[2:]
+    likes = min(scale["likes"], len(readers))
+
+    books = create_books(authors, scale["books"])
+    first_chapters, book_chapters = {}, []
+    for book in books:
+        chapters = create_chapters(book, scale, bodies, likes)
+        create_discussion(chapters, readers, scale, likes)
+        first_chapters[book.pk] = chapters[0]
+        if book is books[0]:
+            book_chapters = chapters
+
+    create_reviews(books, readers, scale)
+    create_libraries(books, readers, libraries, first_chapters, scale)
+    create_activity(books, scale)
+    create_home(books, staff)
+
+    refresh_rankings()
+    call_command("rebuild_search_index", stdout=io.StringIO())
+
+    book = books[0]
+    chapter = book_chapters[0]
+    return {
+        "scale": scale,
+        "staff": staff,
+        "author": author,
+        "reader": reader,
+        "book": book.pk,
+        "chapter": chapter.pk,
+        "last_chapter": book_chapters[-1].pk,
+        "chapter_ids": [c.pk for c in book_chapters],
+        "comment": chapter.comments.order_by("pk").values_list("pk", flat=True).first(),
+        "review": Review.objects.get(book=book, user=reader).pk,
+        "highlight": HighlightedBook.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "top_shelf": list(
+            HighlightedBook.objects.filter(category=HighlightedBook.CATEGORY_TOP).order_by("order").values_list("pk", flat=True)
+        ),
+        "news": News.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "counts": {
+            "users": len(users),
+            "books": len(books),
+            "chapters": Chapter.objects.count(),
+            "comments": Comment.objects.count(),
+            "reviews": Review.objects.count(),
+            "chapter_likes": ChapterLike.objects.count(),
+            "collections": Collection.objects.count(),
+            "daily_stats": BookDailyStats.objects.count(),
+        },
+        "book_chapters": len(book_chapters),
+        "books_by_author": sum(1 for b in books if b.user_id == author.pk),
+    }
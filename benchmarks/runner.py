@@ -0,0 +1,85 @@
+"""
+Requesting a route and measuring what it cost.
+
+Every measurement runs inside a transaction that is rolled back, so routes
+that write (likes, deletes, new chapters) leave the dataset as it was for
+the next one. The write-behind counters are emptied for the same reason.
+"""
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from author.counters import activity_log, view_counter
+
+ROLES = ("anonymous", "reader", "author", "staff")
+
+
+def role_clients(dataset):
+    """A signed-in test client per role, past the first request's session writes."""
+    clients = {}
+    for role in ROLES:
+        client = Client()
+        if role != "anonymous":
+            client.force_login(dataset[role])
+        # the sliding-expiry refresh and terms check write the session once
+        client.get(reverse("about"), secure=True)
+        clients[role] = client
+    return clients
+
+
+def resolve(value, dataset):
+    return value(dataset) if callable(value) else value
+
+
+def route_request(name, route, dataset):
+    """``(method, path, data)`` for a ROUTES entry."""
+    path = reverse(name.split(":")[0], args=resolve(route.get("args", ()), dataset))
+    method = route.get("method", "get")
+    data = resolve(route.get("data", route.get("query")), dataset)
+    return method, path, data
+
+
+def request(client, method, path, data, cold=True, trace_memory=False):
+    """Run one request in a rolled-back transaction; returns the response and what it cost."""
+    if cold:
+        cache.clear()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data, secure=True)
+                seconds = time.perf_counter() - started
+            transaction.set_rollback(True)
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        view_counter.clear()
+        activity_log.clear()
+    return response, {"queries": len(queries), "seconds": seconds, "peak_bytes": peak}
+
+
+def measure(client, method, path, data):
+    """
+    Cold (empty cache) and warm (straight after) query counts and times,
+    plus the peak memory of a separate cold run, since tracing allocations
+    slows everything it watches.
+    """
+    response, cold = request(client, method, path, data)
+    _, warm = request(client, method, path, data, cold=False)
+    _, traced = request(client, method, path, data, trace_memory=True)
+    return {
+        "status": response.status_code,
+        "queries": cold["queries"],
+        "seconds": cold["seconds"],
+        "warm_queries": warm["queries"],
+        "warm_seconds": warm["seconds"],
+        "peak_bytes": traced["peak_bytes"],
+    }
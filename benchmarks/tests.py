@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+import django
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from author import urls as author_urls
+from library import urls as library_urls
+from model2.testing import TEST_STORAGES
+from moderator import urls as moderator_urls
+from reader import urls as reader_urls
+from tasks import queue
+from tasks.mail import queue_mail
+
+from . import budgets, factories, runner
+
+SCALE = os.getenv("BENCHMARK_SCALE", "small")
+REPORT = os.getenv("BENCHMARK_REPORT")
+
+
+@override_settings(STORAGES=TEST_STORAGES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ViewBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = factories.seed(SCALE)
+
+    def test_every_route_has_a_budget(self):
+        names = {
+            pattern.name
+            for urls in (reader_urls, author_urls, library_urls, moderator_urls)
+            for pattern in urls.urlpatterns
+        }
+        self.assertEqual(names, {key.split(":")[0] for key in budgets.ROUTES})
+
+    def test_views_stay_within_query_budget(self):
+        clients = runner.role_clients(self.dataset)
+        for name, route in budgets.ROUTES.items():
+            if "skip" in route:
+                continue
+            method, path, data = runner.route_request(name, route, self.dataset)
+            response, cold = runner.request(clients[route["as"]], method, path, data)
+            with self.subTest(route=name):
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(cold["queries"], runner.resolve(route["queries"], self.dataset))
+
+    @tag("benchmark")
+    def test_views_stay_within_time_and_memory_budget(self):
+        clients = runner.role_clients(self.dataset)
+        results = {}
+        for name, route in budgets.ROUTES.items():
+            if "skip" in route:
+                results[name] = {"skipped": route["skip"]}
+                continue
+            method, path, data = runner.route_request(name, route, self.dataset)
+            result = runner.measure(clients[route["as"]], method, path, data)
+            result.update(
+                method=method.upper(),
+                path=path,
+                budget_queries=runner.resolve(route["queries"], self.dataset),
+                budget_seconds=runner.resolve(route.get("seconds", budgets.MAX_SECONDS), self.dataset),
+                budget_memory=runner.resolve(route.get("memory", budgets.MAX_MEMORY), self.dataset),
+            )
+            results[name] = result
+
+            with self.subTest(route=name):
+                self.assertLess(result["status"], 400)
+                self.assertLessEqual(result["seconds"], result["budget_seconds"])
+                self.assertLessEqual(result["peak_bytes"], result["budget_memory"])
+
+        if REPORT:
+            self.write_report(results)
+
+    def write_report(self, results):
+        report = {
+            "scale": SCALE,
+            "created_at": timezone.now().isoformat(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": self.dataset["counts"],
+            "routes": results,
+        }
+        with open(REPORT, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+@override_settings(TASKS_MODE="worker")
+class TaskThroughputTests(TestCase):
+    def test_queueing_email_stays_within_budget(self):
+        with CaptureQueriesContext(connection) as queries:
+            queue_mail("Your Verification Code", "Your OTP is 123456.", ["reader0@example.com"])
+        self.assertLessEqual(len(queries), budgets.TASK_ENQUEUE_QUERIES)
+
+    @tag("benchmark")
+    def test_queued_email_keeps_up(self):
+        count = factories.SCALES[SCALE]["tasks"]
+        for i in range(count):
+            queue_mail("Your Verification Code", "Your OTP is 123456.", [f"reader{i}@example.com"])
+
+        started = time.perf_counter()
+        while queue.run_due(500):
+            pass
+        per_second = count / (time.perf_counter() - started)
+
+        self.assertEqual(len(mail.outbox), count)
+        self.assertGreaterEqual(per_second, budgets.MIN_TASKS_PER_SECOND)
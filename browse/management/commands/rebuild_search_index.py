@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from author.models import Book
+from browse.models import BookSearchDocument
+from browse.search import document_fields, documents_changed, get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search document of every book and the search index behind them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        books = Book.objects.select_related("user").order_by("id")
+        total = 0
+
+        batch = []
+        for book in books.iterator(chunk_size=batch_size):
+            batch.append(BookSearchDocument(book=book, **document_fields(book)))
+            if len(batch) >= batch_size:
+                total += self.write(batch)
+                batch = []
+        if batch:
+            total += self.write(batch)
+
+        get_backend().rebuild()
+        documents_changed.send(sender=BookSearchDocument, book_ids=None)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} books."))
+
+    def write(self, documents):
+        BookSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=["title", "author_name", "genre", "description", "excerpt", "updated_at"],
+        )
+        return len(documents)
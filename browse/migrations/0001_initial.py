@@ -0,0 +1,85 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:11
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_COLUMNS = "title, author_name, genre, description, excerpt"
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE browse_booksearch_fts USING fts5(
+        {FTS_COLUMNS},
+        content='browse_booksearchdocument', content_rowid='book_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER browse_booksearch_ai AFTER INSERT ON browse_booksearchdocument BEGIN
+        INSERT INTO browse_booksearch_fts(rowid, {FTS_COLUMNS})
+        VALUES (new.book_id, new.title, new.author_name, new.genre, new.description, new.excerpt);
+    END""",
+    f"""CREATE TRIGGER browse_booksearch_ad AFTER DELETE ON browse_booksearchdocument BEGIN
+        INSERT INTO browse_booksearch_fts(browse_booksearch_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.book_id, old.title, old.author_name, old.genre, old.description, old.excerpt);
+    END""",
+    f"""CREATE TRIGGER browse_booksearch_au AFTER UPDATE ON browse_booksearchdocument BEGIN
+        INSERT INTO browse_booksearch_fts(browse_booksearch_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.book_id, old.title, old.author_name, old.genre, old.description, old.excerpt);
+        INSERT INTO browse_booksearch_fts(rowid, {FTS_COLUMNS})
+        VALUES (new.book_id, new.title, new.author_name, new.genre, new.description, new.excerpt);
+    END""",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS browse_booksearch_au",
+    "DROP TRIGGER IF EXISTS browse_booksearch_ad",
+    "DROP TRIGGER IF EXISTS browse_booksearch_ai",
+    "DROP TABLE IF EXISTS browse_booksearch_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX browse_booksearch_vector_gin ON browse_booksearchdocument USING gin (search_vector)",
+    "CREATE INDEX browse_booksearch_title_trgm ON browse_booksearchdocument USING gin (title gin_trgm_ops)",
+    "CREATE INDEX browse_booksearch_author_trgm ON browse_booksearchdocument USING gin (author_name gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS browse_booksearch_author_trgm",
+    "DROP INDEX IF EXISTS browse_booksearch_title_trgm",
+    "DROP INDEX IF EXISTS browse_booksearch_vector_gin",
+]
+
+
+def _run(statements):
+    """Run the statements for the current database vendor, if it has any."""
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_search_indexes = _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+drop_search_indexes = _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('author', '0004_activityevent_bookdailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchDocument',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='author.book')),
+                ('title', models.CharField(max_length=100)),
+                ('author_name', models.CharField(max_length=150)),
+                ('genre', models.CharField(max_length=50)),
+                ('description', models.TextField(blank=True)),
+                ('excerpt', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
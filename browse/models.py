@@ -1,3 +1,22 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from author.models import Book
 
-# Create your models here.
+
+class BookSearchDocument(models.Model):
+    """
+    Denormalized search text for one book, kept up to date by browse.signals.
+    PostgreSQL searches ``search_vector`` (GIN indexed); SQLite searches the
+    FTS5 table mirrored from this one by triggers (see migration 0001).
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=100)
+    author_name = models.CharField(max_length=150)
+    genre = models.CharField(max_length=50)
+    description = models.TextField(blank=True)
+    excerpt = models.TextField(blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.title}"
@@ -0,0 +1,179 @@
+"""
+Book search.
+
+Each book has a BookSearchDocument holding its title, author, genre,
+description and an excerpt of the first chapter. The backend follows the
+database: PostgreSQL full text search (with a trigram fallback for typos),
+SQLite FTS5 for local development, or a plain scan of the documents for
+anything else. Every backend returns book ids, best match first.
+
+``documents_changed`` is sent with the ``book_ids`` whose documents were
+written, so pages listing books (reader.cache) know to revalidate.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
+from django.utils.html import strip_tags
+
+from .models import BookSearchDocument
+
+EXCERPT_LENGTH = 500
+TOKEN_RE = re.compile(r"\w+")
+
+# sent with ``book_ids`` (None for all) after search documents were written
+documents_changed = Signal()
+
+
+def search_config():
+    return getattr(settings, "SEARCH_CONFIG", "english")
+
+
+class PostgresSearchBackend:
+    trigram_threshold = 0.2
+
+    def vector(self):
+        config = search_config()
+        return (
+            SearchVector('title', weight='A', config=config)
+            + SearchVector('author_name', weight='B', config=config)
+            + SearchVector('genre', weight='B', config=config)
+            + SearchVector('description', weight='C', config=config)
+            + SearchVector('excerpt', weight='D', config=config)
+        )
+
+    def search(self, query, limit):
+        search_query = SearchQuery(query, search_type='websearch', config=search_config())
+        ids = list(
+            BookSearchDocument.objects.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', 'title')
+            .values_list('book_id', flat=True)[:limit]
+        )
+        if ids:
+            return ids
+        # nothing matched whole words, fall back to fuzzy title/author matches
+        return list(
+            BookSearchDocument.objects.annotate(
+                similarity=Greatest(
+                    TrigramSimilarity('title', query),
+                    TrigramSimilarity('author_name', query),
+                )
+            )
+            .filter(similarity__gt=self.trigram_threshold)
+            .order_by('-similarity', 'title')
+            .values_list('book_id', flat=True)[:limit]
+        )
+
+    def refresh(self, book_ids):
+        BookSearchDocument.objects.filter(pk__in=book_ids).update(search_vector=self.vector())
+
+    def rebuild(self):
+        BookSearchDocument.objects.update(search_vector=self.vector())
+
+
+class SQLiteSearchBackend:
+    """FTS5 table ``browse_booksearch_fts``, kept in sync by triggers."""
+
+    # bm25 weights for title, author_name, genre, description, excerpt
+    weights = (10.0, 5.0, 5.0, 2.0, 1.0)
+
+    def search(self, query, limit):
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+        # every word must match, as a prefix so partial words still find books
+        match = " ".join(f'"{token}"*' for token in tokens)
+        weights = ", ".join(str(w) for w in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM browse_booksearch_fts WHERE browse_booksearch_fts MATCH %s "
+                f"ORDER BY bm25(browse_booksearch_fts, {weights}) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def refresh(self, book_ids):
+        pass  # triggers already did it
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO browse_booksearch_fts(browse_booksearch_fts) VALUES ('rebuild')")
+
+
+class BasicSearchBackend:
+    def search(self, query, limit):
+        condition = Q()
+        for field in ('title', 'author_name', 'genre', 'description'):
+            condition |= Q(**{f'{field}__icontains': query})
+        return list(
+            BookSearchDocument.objects.filter(condition)
+            .order_by('title')
+            .values_list('book_id', flat=True)[:limit]
+        )
+
+    def refresh(self, book_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+def search_books(query, limit=None):
+    """Ids of the books matching ``query``, best match first."""
+    limit = limit or getattr(settings, "SEARCH_MAX_RESULTS", 500)
+    return get_backend().search(query, limit)
+
+
+def first_chapter_text(book):
+    first_chapter = book.chapters.select_related('body').order_by('order').first()
+    return first_chapter.content if first_chapter else ''
+
+
+def document_fields(book):
+    return {
+        'title': book.bname,
+        'author_name': book.user.username,
+        'genre': book.genre,
+        'description': book.description or '',
+        'excerpt': strip_tags(first_chapter_text(book))[:EXCERPT_LENGTH],
+    }
+
+
+def update_document(book):
+    """Create or refresh the search document for ``book``."""
+    BookSearchDocument.objects.update_or_create(book=book, defaults=document_fields(book))
+    get_backend().refresh([book.pk])
+    documents_changed.send(sender=BookSearchDocument, book_ids=[book.pk])
+
+
+def update_excerpt(book):
+    """Refresh the first-chapter excerpt of an already indexed book."""
+    if BookSearchDocument.objects.filter(book=book).update(
+        excerpt=strip_tags(first_chapter_text(book))[:EXCERPT_LENGTH]
+    ):
+        get_backend().refresh([book.pk])
+        documents_changed.send(sender=BookSearchDocument, book_ids=[book.pk])
+
+
+def update_author_name(user):
+    documents = BookSearchDocument.objects.filter(book__user=user)
+    book_ids = list(documents.values_list('book_id', flat=True))
+    if book_ids:
+        BookSearchDocument.objects.filter(pk__in=book_ids).update(author_name=user.username)
+        get_backend().refresh(book_ids)
+        documents_changed.send(sender=BookSearchDocument, book_ids=book_ids)
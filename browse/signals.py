@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import User
+from author.counters import counters_only
+from author.models import Book, Chapter, ChapterContent, cascaded
+from author.ordering import chapters_reordered
+
+from . import search
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, update_fields=None, **kwargs):
+    if counters_only(update_fields):
+        return
+    search.update_document(instance)
+
+
+@receiver([post_save, post_delete], sender=Chapter)
+def index_excerpt(sender, instance, update_fields=None, origin=None, **kwargs):
+    # a book (or user) being deleted takes its search document with it, and
+    # a chapter saved with new text is indexed by index_chapter_text
+    if counters_only(update_fields) or cascaded(origin, Chapter) or instance._pending_content is not None:
+        return
+    search.update_excerpt(Book(pk=instance.Book_id))
+
+
+@receiver(chapters_reordered)
+def index_reordered_excerpt(sender, book_id, **kwargs):
+    # another chapter may be first now
+    search.update_excerpt(Book(pk=book_id))
+
+
+@receiver(post_save, sender=ChapterContent)
+def index_chapter_text(sender, instance, **kwargs):
+    # the text is written just after its chapter, so this is when a new or
+    # edited first chapter's excerpt can be read
+    search.update_excerpt(Book(pk=instance.chapter.Book_id))
+
+
+@receiver(post_save, sender=User)
+def index_author_name(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'username' not in update_fields:
+        return
+    search.update_author_name(instance)
@@ -1,3 +1,77 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from authentication.models import User
+from author.models import Book, Chapter
+
+from . import search
+from .models import BookSearchDocument
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("writer", "writer@example.com", "pw", agreed_to_terms=True)
+
+    def book(self, bname, genre="Drama", description="", chapter=None):
+        book = Book.objects.create(user=self.author, bname=bname, genre=genre, description=description)
+        if chapter:
+            Chapter.objects.create(Book=book, title="One", content=chapter, order=1)
+        return book
+
+    def test_title_matches_rank_above_description_and_excerpt_matches(self):
+        in_excerpt = self.book("Quiet Harbour", chapter="<p>A dragon sleeps under the harbour.</p>")
+        in_description = self.book("Mountain Road", description="A story about a dragon.")
+        in_title = self.book("Dragon Tears")
+        self.book("Unrelated")
+
+        self.assertEqual(search.search_books("dragon"), [in_title.pk, in_description.pk, in_excerpt.pk])
+
+    def test_every_word_must_match_as_a_prefix(self):
+        book = self.book("Salt and Stone", genre="Fantasy")
+        self.book("Salt Water")
+        self.assertEqual(search.search_books("sal fanta"), [book.pk])
+        self.assertEqual(search.search_books("!!"), [])
+
+    def test_documents_follow_renames_and_first_chapter_edits(self):
+        book = self.book("Old Title", chapter="<p>old words</p>")
+        book.bname = "New Title"
+        book.save()
+        self.author.username = "renamed"
+        self.author.save()
+        chapter = book.chapters.get()
+        chapter.content = "<p>fresh words</p>"
+        chapter.save()
+
+        document = BookSearchDocument.objects.get(book=book)
+        self.assertEqual((document.title, document.author_name, document.excerpt),
+                         ("New Title", "renamed", "fresh words"))
+        self.assertEqual(search.search_books("renamed fresh"), [book.pk])
+
+    def test_deleting_a_chapter_refreshes_the_excerpt(self):
+        book = self.book("Two Parts", chapter="<p>first</p>")
+        Chapter.objects.create(Book=book, title="Two", content="<p>second</p>", order=2)
+        book.chapters.get(order=1).delete()
+        self.assertEqual(BookSearchDocument.objects.get(book=book).excerpt, "second")
+
+    def test_deleting_a_book_does_not_reindex_each_chapter(self):
+        book = self.book("Long Book", chapter="<p>first</p>")
+        for order in range(2, 10):
+            Chapter.objects.create(Book=book, title=f"Chapter {order}", content="text", order=order)
+        with mock.patch.object(search, "update_excerpt") as update_excerpt:
+            book.delete()
+        update_excerpt.assert_not_called()
+        self.assertFalse(BookSearchDocument.objects.exists())
+
+    def test_rebuild_search_index_restores_missing_documents(self):
+        book = self.book("Lost and Found", chapter="<p>an excerpt</p>")
+        BookSearchDocument.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_search_index", "--batch-size", "1", stdout=out)
+
+        self.assertIn("Indexed 1 books.", out.getvalue())
+        self.assertEqual(BookSearchDocument.objects.get(book=book).excerpt, "an excerpt")
+        self.assertEqual(search.search_books("lost"), [book.pk])
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:18
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_history(apps, schema_editor):
+    """Keep only the most recent History row per (library, book)."""
+    History = apps.get_model('library', 'History')
+    duplicates = (
+        History.objects.order_by()
+        .values('library_id', 'book_id')
+        .annotate(keep=Max('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        History.objects.filter(library_id=row['library_id'], book_id=row['book_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('author', '0004_activityevent_bookdailystats'),
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_history, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='history',
+            unique_together={('library', 'book')},
+        ),
+    ]
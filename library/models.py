@@ -1,4 +1,7 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from authentication.models import User
 from author.models import Book, Chapter  # assuming your main book app is called 'books'
 
@@ -11,17 +14,47 @@ class Library(models.Model):
 
 
 class History(models.Model):
+    LIMIT = 15  # books kept per library
+
     library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='history')
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     last_read_chapter = models.ForeignKey(Chapter, null=True, blank=True, on_delete=models.SET_NULL)
     last_read_time = models.DateTimeField(auto_now=True)
 
     class Meta:
+        unique_together = ('library', 'book')
         ordering = ['-last_read_time']
 
     def __str__(self):
         return f"{self.book.bname} ({self.library.user.username})"
 
+    @classmethod
+    def record(cls, library_id, book_id, chapter_id=None):
+        """
+        Move a book to the top of the reading history with one UPDATE, or
+        add it, dropping whatever fell past LIMIT. Reading the same chapter
+        again within HISTORY_COALESCE_SECONDS does nothing.
+        """
+        window = getattr(settings, "HISTORY_COALESCE_SECONDS", 60)
+        if window and not cache.add(f"history:{library_id}:{book_id}:{chapter_id}", True, window):
+            return
+
+        if cls.objects.filter(library_id=library_id, book_id=book_id).update(
+            last_read_chapter_id=chapter_id, last_read_time=timezone.now()
+        ):
+            return
+        # an upsert, in case another request added the book meanwhile
+        cls.objects.bulk_create(
+            [cls(library_id=library_id, book_id=book_id, last_read_chapter_id=chapter_id)],
+            update_conflicts=True,
+            unique_fields=['library', 'book'],
+            update_fields=['last_read_chapter', 'last_read_time'],
+        )
+        history = cls.objects.filter(library_id=library_id)
+        if history.count() > cls.LIMIT:
+            newest = history.order_by('-last_read_time', '-id').values('id')[:cls.LIMIT]
+            history.exclude(id__in=newest).delete()
+
 
 class Collection(models.Model):
     library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='collection')
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from authentication.models import User
+from author.models import Book, Chapter
+
+from .models import History, Library
+
+
+class HistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.library = Library.objects.create(user=User.objects.create_user("reader", "reader@example.com", "pw"))
+        self.books = [
+            Book.objects.create(user=self.author, bname=f"Book {i}", genre="Fantasy", description="d")
+            for i in range(History.LIMIT + 2)
+        ]
+        self.chapters = [
+            Chapter.objects.create(Book=self.books[0], title=f"Chapter {order}", content="text", order=order)
+            for order in (1, 2)
+        ]
+
+    def test_reading_again_moves_the_book_up_in_one_query(self):
+        History.record(self.library.id, self.books[0].id, self.chapters[0].id)
+        History.record(self.library.id, self.books[1].id)
+        with self.assertNumQueries(1):
+            History.record(self.library.id, self.books[0].id, self.chapters[1].id)
+
+        entries = list(History.objects.filter(library=self.library))
+        self.assertEqual([entry.book_id for entry in entries], [self.books[0].id, self.books[1].id])
+        self.assertEqual(entries[0].last_read_chapter_id, self.chapters[1].id)
+
+    def test_the_same_chapter_within_the_window_is_not_written_again(self):
+        History.record(self.library.id, self.books[0].id, self.chapters[0].id)
+        with self.assertNumQueries(0):
+            History.record(self.library.id, self.books[0].id, self.chapters[0].id)
+        with override_settings(HISTORY_COALESCE_SECONDS=0), self.assertNumQueries(1):
+            History.record(self.library.id, self.books[0].id, self.chapters[0].id)
+
+    def test_only_the_newest_books_are_kept(self):
+        for book in self.books[:History.LIMIT]:
+            History.record(self.library.id, book.id)
+        History.record(self.library.id, self.books[0].id, self.chapters[0].id)
+        self.assertEqual(History.objects.filter(library=self.library).count(), History.LIMIT)
+
+        History.record(self.library.id, self.books[-1].id)
+
+        kept = set(History.objects.filter(library=self.library).values_list("book_id", flat=True))
+        self.assertEqual(len(kept), History.LIMIT)
+        self.assertIn(self.books[0].id, kept)  # read again, so no longer the oldest
+        self.assertNotIn(self.books[1].id, kept)
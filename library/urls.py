@@ -4,5 +4,6 @@ from django.contrib.auth.decorators import login_required
 
 urlpatterns = [
     path('',login_required(views.library_home, login_url='login'), name='library'),
+    path('collection/more/',login_required(views.collection_more, login_url='login'), name='library_collection_more'),
     path('remove/<int:book_id>/',login_required(views.remove_from_collection, login_url='login'), name='remove_from_collection'),
 ]
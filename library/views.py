@@ -1,16 +1,35 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.template.loader import render_to_string
 from .models import Library, History, Collection
 from author.models import Book
+from reader.pagination import CursorPaginator
+
+COLLECTION_PAGE_SIZE = 24
+
+
+def collection_page(library, cursor=None):
+    collection = Collection.objects.filter(library=library).select_related('book', 'last_read_chapter')
+    return CursorPaginator(collection, ('-added_at',), COLLECTION_PAGE_SIZE).page(cursor)
+
 
 def library_home(request):
     library, _ = Library.objects.get_or_create(user=request.user)
-    history = History.objects.filter(library=library).order_by('-last_read_time')[:15]
-    collection = Collection.objects.filter(library=library).order_by('-added_at')[:100]
-    
+    history = History.objects.filter(library=library).select_related('book', 'last_read_chapter').order_by('-last_read_time')[:History.LIMIT]
+
     return render(request, 'reader/library.html', {
         'history': history,
-        'collection': collection,
+        'collection': collection_page(library),
+    })
+
+
+def collection_more(request):
+    library, _ = Library.objects.get_or_create(user=request.user)
+    collection = collection_page(library, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('reader/partials/collection_cards.html', {'collection': collection}, request=request),
+        'next_cursor': collection.next_cursor,
     })
 
 def remove_from_collection(request, book_id):
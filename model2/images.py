@@ -0,0 +1,196 @@
+"""
+Uploaded images: book covers, profile pictures and news images.
+
+An upload is read, checked and decoded with Pillow once, in the request
+(``prepare``), so a file that is not an image is turned away with a
+ValidationError before anything is saved. Everything slower happens after
+the response: ``attach`` hands the decoded image to a small thread pool
+once the transaction commits, which re-encodes the original as a JPEG,
+renders WebP and JPEG copies at the fixed widths of its kind, uploads them
+and then points the model's field at the new name. The field is saved with
+``update_fields``, so the usual signals (caches, highlight shelves) run.
+
+Names are content-hashed: ``book_covers/<sha1>.jpg`` for the original and
+``book_covers/<sha1>/<width>.<webp|jpg>`` for the copies. The same image
+uploaded twice gets the same names and is not uploaded again.
+
+``srcset`` and ``image_url`` (also the ``images`` template library) build
+the URLs for templates. Images stored before the pipeline have no copies;
+for them ``srcset`` is empty and ``image_url`` is the original.
+
+With IMAGE_PROCESSING = "inline" (the tests) the work runs in the request.
+"""
+import hashlib
+import io
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# widths of the copies made for each kind: cards, detail pages, avatars
+KINDS = {
+    "cover": (160, 320, 640),
+    "avatar": (64, 128, 256),
+    "news": (320, 640, 1280),
+}
+# the kind of each image field, by field name
+FIELD_KINDS = {
+    "coverimage": "cover",
+    "profile_picture": "avatar",
+    "image": "news",
+}
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+ACCEPTED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+ORIGINAL_MAX_SIZE = 2048
+MAX_PIXELS = 40_000_000
+QUALITY = 85
+
+HASHED_NAME = re.compile(r"^.+/[0-9a-f]{40}\.jpg$")
+
+_executor = None
+
+
+class PreparedImage:
+    """A decoded upload, ready to be stored under its content hash."""
+
+    def __init__(self, image, digest, kind):
+        self.image = image
+        self.digest = digest
+        self.kind = kind
+
+    def name(self, upload_to):
+        return f"{upload_to.rstrip('/')}/{self.digest}.jpg"
+
+
+def prepare(upload, kind):
+    """Read, check and decode ``upload``; raises ValidationError if it is not an image we take."""
+    if upload.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ValidationError(f"Images can be at most {settings.IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    data = b"".join(upload.chunks())
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in ACCEPTED_FORMATS:
+            raise ValidationError("Upload a JPEG, PNG, WebP or GIF image.")
+        if image.width * image.height > MAX_PIXELS:
+            raise ValidationError("This image is too large.")
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValidationError("Upload a valid image. The file was not an image or was corrupted.")
+    image = flatten(ImageOps.exif_transpose(image))
+    image.thumbnail((ORIGINAL_MAX_SIZE, ORIGINAL_MAX_SIZE))
+    return PreparedImage(image, hashlib.sha1(data).hexdigest(), kind)
+
+
+def flatten(image):
+    """RGB, with any transparency laid on white."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def encode(image, extension):
+    buffer = io.BytesIO()
+    image.save(buffer, FORMATS[extension], quality=QUALITY, optimize=extension == "jpg")
+    return buffer.getvalue()
+
+
+def rendition_name(name, width, extension):
+    return f"{name[:-len('.jpg')]}/{width}.{extension}"
+
+
+def renditions(prepared, name):
+    """``{name: bytes}`` for the original and every copy of ``prepared`` stored as ``name``."""
+    files = {name: encode(prepared.image, "jpg")}
+    for width in KINDS[prepared.kind]:
+        image = prepared.image
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for extension in FORMATS:
+            files[rendition_name(name, width, extension)] = encode(image, extension)
+    return files
+
+
+def store(prepared, upload_to):
+    """Upload the original and its copies, skipping any already stored; returns the original's name."""
+    name = prepared.name(upload_to)
+    for path, content in renditions(prepared, name).items():
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+    return name
+
+
+def process(model, pk, field_name, prepared):
+    field = model._meta.get_field(field_name)
+    name = store(prepared, field.upload_to)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return name
+    setattr(instance, field_name, name)
+    update_fields = [field_name]
+    if any(f.name == "updated_at" for f in model._meta.concrete_fields):
+        update_fields.append("updated_at")
+    instance.save(update_fields=update_fields)
+    return name
+
+
+def run_in_background(model, pk, field_name, prepared):
+    try:
+        process(model, pk, field_name, prepared)
+    except Exception:
+        logger.exception("Storing %s.%s for %s failed", model.__name__, field_name, pk)
+    finally:
+        connections.close_all()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+    return _executor
+
+
+def attach(instance, field_name, prepared):
+    """Store ``prepared`` as ``instance.<field_name>``; off the request once the transaction commits."""
+    model, pk = type(instance), instance.pk
+    if settings.IMAGE_PROCESSING == "inline":
+        setattr(instance, field_name, process(model, pk, field_name, prepared))
+        return
+    transaction.on_commit(lambda: executor().submit(run_in_background, model, pk, field_name, prepared))
+
+
+# --- URLs for templates ---
+
+def widths_for(fieldfile):
+    if not fieldfile or not HASHED_NAME.match(fieldfile.name):
+        return ()
+    return KINDS[FIELD_KINDS[fieldfile.field.name]]
+
+
+def srcset(fieldfile, extension="webp"):
+    """``"<url> 160w, <url> 320w, ..."`` for the copies of ``fieldfile``; empty if it has none."""
+    return ", ".join(
+        f"{fieldfile.storage.url(rendition_name(fieldfile.name, width, extension))} {width}w"
+        for width in widths_for(fieldfile)
+    )
+
+
+def image_url(fieldfile, width=None, extension="jpg"):
+    """URL of the smallest copy at least ``width`` wide, or of the original."""
+    if not fieldfile:
+        return ""
+    widths = widths_for(fieldfile)
+    if not widths or width is None:
+        return fieldfile.url
+    width = next((w for w in widths if w >= int(width)), widths[-1])
+    return fieldfile.storage.url(rendition_name(fieldfile.name, width, extension))
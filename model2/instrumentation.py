@@ -0,0 +1,290 @@
+"""
+Per-view request instrumentation.
+
+InstrumentationMiddleware measures every request: wall time, the number of
+SQL queries and the time spent in them, template render time (through the
+InstrumentedDjangoTemplates backend) and response size. Totals are kept per
+view name, method and status class, and served in the Prometheus text
+format at ``/metrics/``. Other modules can declare plain counters of their
+own with ``counter`` and add to them with ``metrics.increment``.
+
+Gunicorn runs several worker processes, each with its own totals. As a
+local stand-in for a metrics aggregator, every worker writes a snapshot of
+its totals to ``METRICS_DIR`` at most every ``METRICS_FLUSH_INTERVAL``
+seconds, and ``/metrics/`` sums the snapshots of all workers; snapshots
+not updated for ``METRICS_STALE_SECONDS`` are from workers that are gone
+and are removed. Without a ``METRICS_DIR`` each process reports only
+itself.
+
+Requests slower than ``METRICS_SLOW_REQUEST_SECONDS`` or running more than
+``METRICS_SLOW_REQUEST_QUERIES`` queries are logged with their most
+repeated SQL statements, which is how an N+1 query shows up.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LABELS = ("view", "method", "status")
+
+# the request being measured in this thread or task
+current = contextvars.ContextVar("instrumentation_request", default=None)
+
+# {name: help text} of the counters declared with ``counter``
+COUNTERS = {}
+
+
+def counter(name, help_text):
+    """Declare a counter served at /metrics/; returns ``name`` for ``metrics.increment``."""
+    COUNTERS[name] = help_text
+    return name
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # installed with connection.execute_wrapper for the length of the request
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+class Metrics:
+    """Totals for this process, plus the snapshots other workers left in ``METRICS_DIR``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: defaultdict(float))
+        self._counters = defaultdict(float)
+        self._last_flush = time.monotonic()
+
+    @property
+    def directory(self):
+        return getattr(settings, "METRICS_DIR", None)
+
+    def record(self, labels, duration, stats, response_bytes, slow):
+        with self._lock:
+            series = self._series[labels]
+            series["requests"] += 1
+            series["seconds"] += duration
+            series["queries"] += stats.queries
+            series["db_seconds"] += stats.db_seconds
+            series["template_seconds"] += stats.template_seconds
+            series["response_bytes"] += response_bytes
+            series["slow"] += slow
+            for bound in DURATION_BUCKETS:
+                if duration <= bound:
+                    series[f"le_{bound}"] += 1
+        self.maybe_flush()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= getattr(settings, "METRICS_FLUSH_INTERVAL", 10):
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": [[*labels, dict(values)] for labels, values in self._series.items()],
+                "counters": dict(self._counters),
+            }
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, f"worker-{pid or os.getpid()}.json")
+
+    def flush(self):
+        """Write this worker's totals where the other workers can read them."""
+        self._last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path() + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, self.path())
+
+    def collect(self):
+        """Request totals and counters across all workers (or just this process without METRICS_DIR)."""
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            stale = time.time() - getattr(settings, "METRICS_STALE_SECONDS", 60 * 60 * 24)
+            for name in os.listdir(self.directory):
+                if not (name.startswith("worker-") and name.endswith(".json")):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < stale:
+                        os.remove(path)  # a worker that is long gone
+                        continue
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue  # being replaced right now; it will be there next scrape
+                # a worker started before counters were added
+                snapshots.append({"requests": snapshot} if isinstance(snapshot, list) else snapshot)
+        totals = defaultdict(lambda: defaultdict(float))
+        counters = defaultdict(float)
+        for snapshot in snapshots:
+            for *labels, values in snapshot["requests"]:
+                for field, value in values.items():
+                    totals[tuple(labels)][field] += value
+            for name, value in snapshot.get("counters", {}).items():
+                counters[name] += value
+        return totals, counters
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+
+
+metrics = Metrics()
+
+
+def format_labels(labels, **extra):
+    pairs = [*zip(LABELS, labels), *extra.items()]
+    return "{" + ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs
+    ) + "}"
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render_prometheus(totals, counters):
+    families = [
+        ("django_requests_total", "counter", "Requests served.", "requests"),
+        ("django_request_db_queries_total", "counter", "SQL queries run while serving requests.", "queries"),
+        ("django_request_db_seconds_total", "counter", "Time spent in SQL queries.", "db_seconds"),
+        ("django_request_template_seconds_total", "counter", "Time spent rendering templates.", "template_seconds"),
+        ("django_response_bytes_total", "counter", "Response body bytes sent.", "response_bytes"),
+        ("django_slow_requests_total", "counter", "Requests over the slow request limits.", "slow"),
+    ]
+    lines = []
+    for name, kind, help_text, field in families:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{format_labels(labels)} {format_value(values[field])}" for labels, values in sorted(totals.items())]
+
+    name = "django_request_duration_seconds"
+    lines += [f"# HELP {name} Time taken to serve requests.", f"# TYPE {name} histogram"]
+    for labels, values in sorted(totals.items()):
+        for bound in DURATION_BUCKETS:
+            lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {format_value(values[f'le_{bound}'])}")
+        lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {format_value(values['requests'])}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(values['seconds'])}")
+        lines.append(f"{name}_count{format_labels(labels)} {format_value(values['requests'])}")
+
+    for name, help_text in sorted(COUNTERS.items()):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {format_value(counters.get(name, 0))}"]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Scrapers send ``Authorization: Bearer
+    <METRICS_TOKEN>``; without a token set it is open only to staff, or to
+    everyone with DEBUG on.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not (settings.DEBUG or request.user.is_staff):
+        if not token:
+            raise Http404
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(*metrics.collect()), content_type="text/plain; version=0.0.4")
+
+
+class InstrumentationMiddleware:
+    """Measure each request; keep it first in MIDDLEWARE so the whole stack is timed."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(settings.STATIC_URL) or request.path == "/metrics/":
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        labels = (match.view_name if match else "<unresolved>", request.method, f"{response.status_code // 100}xx")
+        size = 0 if response.streaming else len(response.content)
+        slow = (
+            duration >= getattr(settings, "METRICS_SLOW_REQUEST_SECONDS", 1.0)
+            or stats.queries >= getattr(settings, "METRICS_SLOW_REQUEST_QUERIES", 50)
+        )
+        if slow:
+            repeated = [f"{count}x {sql[:200]}" for sql, count in stats.statements.most_common(3) if count > 1]
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs, templates %.3fs. Most repeated: %s",
+                request.method, request.path, labels[0], duration, stats.queries, stats.db_seconds,
+                stats.template_seconds, "; ".join(repeated) or "none",
+            )
+        metrics.record(labels, duration, stats, size, slow)
+        return response
+
+
+# --- templates ---
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render for InstrumentationMiddleware."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 from google.oauth2 import service_account
 import dj_database_url
@@ -52,12 +53,16 @@ INSTALLED_APPS = [
     'browse',
     'library',
     'moderator',
+    'tasks',
 ]
 
 MIDDLEWARE = [
+    'model2.instrumentation.InstrumentationMiddleware',  # first, so it times everything below
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'reader.middleware.CachePolicyMiddleware',  # must stay above sessions and CSRF
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'authentication.middleware.SlidingSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -69,19 +74,29 @@ MIDDLEWARE = [
 
 TERMS_VERSION = "1.0"   # bump to "2.0" when T&C change
 
+# Email OTPs (authentication.otp): a code lives OTP_TTL seconds and takes
+# OTP_MAX_ATTEMPTS wrong guesses; an email gets at most OTP_SEND_LIMIT
+# codes, whatever their purpose, in OTP_SEND_WINDOW seconds.
+# `manage.py purge_otps` deletes codes older than both.
+OTP_TTL = 60 * 10
+OTP_MAX_ATTEMPTS = 5
+OTP_SEND_LIMIT = 5
+OTP_SEND_WINDOW = 60 * 60
+
 # optional prefixes to skip (useful for API endpoints, static, media)
 TERMS_WHITELIST_PREFIXES = [
     "/api/",
     "/static/",
     "/media/",
     "/health/",
+    "/metrics/",
 ]
 
 ROOT_URLCONF = 'model2.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'model2.instrumentation.InstrumentedDjangoTemplates',  # times renders for /metrics/
         'DIRS': [BASE_DIR / 'template'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,12 +105,18 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'libraries': {
+                'images': 'model2.templatetags.images',  # srcset URLs for uploaded images
+            },
         },
     },
 ]
 
 WSGI_APPLICATION = 'model2.wsgi.application'
 
+# leaves out the wall-clock benchmarks unless run with `--tag benchmark`
+TEST_RUNNER = 'model2.testing.TestRunner'
+
 # Database
 DATABASES = {
     'default': dj_database_url.parse(
@@ -105,6 +126,62 @@ DATABASES = {
     )
 }
 
+# Cache: CACHE_BACKEND picks local memory (default), file or Redis;
+# CACHE_LOCATION is the directory for "file" and the URL for "redis".
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_LOCATIONS = {
+    "locmem": "signedpublishing",
+    "file": str(BASE_DIR / ".cache"),
+    "redis": "redis://127.0.0.1:6379/1",
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": os.getenv("CACHE_LOCATION", CACHE_LOCATIONS[CACHE_BACKEND]),
+        "TIMEOUT": 300,
+    }
+}
+
+HOME_CACHE_TIMEOUT = 60 * 15         # home sections, also invalidated by signals
+HIGHLIGHT_SNAPSHOT_TIMEOUT = 60 * 15 # published highlight shelves, republished when moderators change them
+STATIC_PAGE_CACHE_TIMEOUT = 60 * 60  # about / contest / ranking
+TOC_CACHE_TIMEOUT = 60 * 60 * 24     # reader table of contents, keyed by book version
+HISTORY_COALESCE_SECONDS = 60        # re-reading a chapter within this window skips the history write
+
+# View deduplication (reader.dedupe): one view per visitor and chapter/book
+# per window, remembered in a rotating Bloom filter kept in the shared cache
+# ("cache") or in each process ("memory").
+VIEW_DEDUPE_SECONDS = 60 * 60 * 24
+VIEW_DEDUPE_BACKEND = os.getenv("VIEW_DEDUPE_BACKEND", "cache")
+VIEW_DEDUPE_CAPACITY = int(os.getenv("VIEW_DEDUPE_CAPACITY", 1_000_000))  # views per window
+VIEW_DEDUPE_ERROR_RATE = 0.001       # chance a first view is mistaken for a repeat
+# proxies in front of gunicorn that append the client to X-Forwarded-For;
+# with none, the header is ignored since clients can set it to anything
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", 0))
+PUBLIC_PAGE_MAX_AGE = 60             # how long a proxy may serve an anonymous page (reader.middleware)
+PUBLIC_PAGE_COUNTER_STALENESS = 60 * 5  # longest a cached page may show old view/like counts
+
+# Request instrumentation (model2.instrumentation), scraped at /metrics/.
+# Each gunicorn worker leaves a snapshot in METRICS_DIR for the others to sum.
+# /metrics/ answers scrapes sending "Authorization: Bearer <METRICS_TOKEN>";
+# set METRICS_TOKEN in the deployment's environment for the scraper, since
+# without one the page is open only to staff (and to anyone with DEBUG on).
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "signedpublishing-metrics"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_FLUSH_INTERVAL = 10          # seconds between a worker's snapshots
+METRICS_SLOW_REQUEST_SECONDS = float(os.getenv("METRICS_SLOW_REQUEST_SECONDS", 1.0))
+METRICS_SLOW_REQUEST_QUERIES = int(os.getenv("METRICS_SLOW_REQUEST_QUERIES", 50))
+
+# Rankings (reader.rankings), rebuilt by the refresh_rankings command
+RANKING_SIZE = 50                    # books kept per leaderboard
+RANKING_TRENDING_HALF_LIFE_DAYS = 3  # activity counts half as much after this many days
+RANKING_RATING_PRIOR = 10            # ratings worth of site-wide mean mixed into every book's rating
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -151,21 +228,43 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Google Cloud Storage settings
+# Media: MEDIA_BACKEND picks Google Cloud Storage (default) or the local
+# filesystem, wrapped by model2.storage, which stores uploads by content
+# hash, remembers URLs for MEDIA_URL_TIMEOUT seconds and, with
+# MEDIA_LOCAL_CACHE_DIR set, keeps hot objects on local disk.
+MEDIA_BACKENDS = {
+    "gcs": {
+        "BACKEND": "storages.backends.gcloud.GoogleCloudStorage",
+        "OPTIONS": {
+            "bucket_name": os.getenv("GS_BUCKET_NAME"),
+        },
+    },
+    "filesystem": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": BASE_DIR / "media",
+            "base_url": "/media/",
+            "allow_overwrite": True,  # names are content hashes
+        },
+    },
+}
 STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
     "default": {
-        "BACKEND": "storages.backends.gcloud.GoogleCloudStorage",
+        "BACKEND": "model2.storage.ContentAddressedStorage",
         "OPTIONS": {
-            "bucket_name": os.getenv("GS_BUCKET_NAME"),
+            "backend": MEDIA_BACKENDS[os.getenv("MEDIA_BACKEND", "gcs")],
+            "url_timeout": int(os.getenv("MEDIA_URL_TIMEOUT", 60 * 60)),
+            "local_cache_dir": os.getenv("MEDIA_LOCAL_CACHE_DIR"),
+            "local_cache_bytes": int(os.getenv("MEDIA_LOCAL_CACHE_BYTES", 256 * 1024 * 1024)),
         },
     },
 }
 
 # email setup using smpt: I AM EONE
-EMAIL_BACKEND = os.getenv("EMAIL_BACKEND")
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT"))
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS") == "True"
@@ -201,10 +300,51 @@ CSRF_TRUSTED_ORIGINS = [
     "https://signedpublishing.com",
 ]
 
+# Sessions: SESSION_BACKEND picks cached_db (default), db or signed_cookies.
+# Sessions are only written when they change; SlidingSessionMiddleware
+# pushes the expiry forward at most once per SESSION_REFRESH_INTERVAL.
+SESSION_ENGINES = {
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "db": "django.contrib.sessions.backends.db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv("SESSION_BACKEND", "cached_db")]
 SESSION_COOKIE_AGE = 60 * 60 * 24  # 24 hours in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # keep session open until timeout
-SESSION_SAVE_EVERY_REQUEST = True  # reset timer on each user activity
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = int(os.getenv("SESSION_REFRESH_INTERVAL", 60 * 15))  # seconds
 
 SECURE_CROSS_ORIGIN_OPENER_POLICY = "same-origin"
 SECURE_CROSS_ORIGIN_EMBEDDER_POLICY = "require-corp"
 SECURE_CROSS_ORIGIN_RESOURCE_POLICY = "same-origin"
+
+# Write-behind view counters (author.counters): pending views are flushed
+# every N seconds or once this many rows are waiting, whichever comes first.
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.getenv("VIEW_COUNTER_FLUSH_INTERVAL", 10))
+VIEW_COUNTER_FLUSH_THRESHOLD = int(os.getenv("VIEW_COUNTER_FLUSH_THRESHOLD", 500))
+
+# Activity events (views, likes, collection adds) are buffered the same way
+# and rolled up nightly with `manage.py rollup_daily_stats`.
+ACTIVITY_LOG_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", 10))
+ACTIVITY_LOG_FLUSH_THRESHOLD = int(os.getenv("ACTIVITY_LOG_FLUSH_THRESHOLD", 500))
+
+# Book search (browse.search): text search configuration used by PostgreSQL
+# and the most results a single query returns.
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "english")
+SEARCH_MAX_RESULTS = 500
+
+# Uploaded images (model2.images): decoded in the request, stored with
+# their resized copies by a thread pool after the response ("thread"), or
+# in the request itself ("inline").
+IMAGE_PROCESSING = os.getenv("IMAGE_PROCESSING", "thread")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+IMAGE_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Background tasks (tasks.queue): "thread" runs them in this process once
+# the transaction commits, "worker" leaves them to `manage.py run_tasks`,
+# "inline" runs them in the request. Tasks claimed but unfinished after
+# TASKS_STALE_SECONDS (a runner died) are queued again by run_tasks, which
+# the Procfile's worker process runs whatever the mode.
+TASKS_MODE = os.getenv("TASKS_MODE", "thread")
+TASKS_WORKERS = int(os.getenv("TASKS_WORKERS", 2))
+TASKS_STALE_SECONDS = 60 * 10
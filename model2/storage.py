@@ -0,0 +1,228 @@
+"""
+Content-addressed media storage.
+
+ContentAddressedStorage wraps the real media backend (GCS in production,
+the filesystem in development) given as ``backend``:
+
+- Uploads are stored by the SHA-1 of their content, ``<dir>/<sha1><ext>``,
+  keeping the directory from ``upload_to``. An identical upload gets the
+  same name and is not written again. Names that already hold a digest,
+  like those model2.images gives its originals and resized copies, are
+  kept as they are.
+- Stored objects never change under a name, so ``url()`` results are kept
+  per process for ``url_timeout`` seconds. Signed URLs must be valid for
+  longer than that (GS_EXPIRATION defaults to a day). ``exists()`` is
+  remembered the same way once true.
+- With ``local_cache_dir`` set, objects read or written are also kept on
+  local disk, up to ``local_cache_bytes``, dropping the least recently
+  used first.
+
+Deleting removes the object for every name pointing at it, so nothing in
+the app deletes media; unreferenced objects are left to a bucket policy.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+DIGEST = re.compile(r"[0-9a-f]{40}")
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(name, content):
+    """``name`` with its file name replaced by the SHA-1 of ``content``, unless it already holds a digest."""
+    directory, filename = posixpath.split(name)
+    stem, extension = posixpath.splitext(filename)
+    if DIGEST.fullmatch(stem) or DIGEST.fullmatch(posixpath.basename(directory)):
+        return name
+    digest = hashlib.sha1()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return posixpath.join(directory, digest.hexdigest() + extension.lower())
+
+
+class ExpiringCache:
+    """A bounded ``{key: value}`` whose entries are dropped ``timeout`` seconds after they were set."""
+
+    def __init__(self, timeout, max_entries):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class LocalCache:
+    """Objects kept on local disk under ``directory``, at most ``max_bytes`` of them, least recently used out first."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.sizes = None  # {name: bytes}, in use order; read from disk on first use
+
+    def path(self, name):
+        return os.path.join(self.directory, *name.split("/"))
+
+    def load(self):
+        if self.sizes is None:
+            found = []
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    stat = os.stat(os.path.join(root, filename))
+                    name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                    found.append((stat.st_mtime, name, stat.st_size))
+            self.sizes = OrderedDict((name, size) for _, name, size in sorted(found))
+        return self.sizes
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.load():
+                return None
+            self.sizes.move_to_end(name)
+        path = self.path(name)
+        try:
+            os.utime(path)  # the order survives a restart
+        except FileNotFoundError:
+            self.discard(name)
+            return None
+        return path
+
+    def put(self, name, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self.lock:
+            sizes = self.load()
+            sizes[name] = len(data)
+            sizes.move_to_end(name)
+            total = sum(sizes.values())
+            while total > self.max_bytes:
+                evicted, size = sizes.popitem(last=False)
+                total -= size
+                try:
+                    os.remove(self.path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def discard(self, name):
+        with self.lock:
+            self.load().pop(name, None)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+@deconstructible(path="model2.storage.ContentAddressedStorage")
+class ContentAddressedStorage(Storage):
+    def __init__(self, backend, url_timeout=60 * 60, url_cache_size=10_000, local_cache_dir=None,
+                 local_cache_bytes=256 * 1024 * 1024):
+        self.backend = import_string(backend["BACKEND"])(**backend.get("OPTIONS", {}))
+        self.urls = ExpiringCache(url_timeout, url_cache_size)
+        self.existing = ExpiringCache(url_timeout, url_cache_size)
+        self.local = LocalCache(local_cache_dir, local_cache_bytes) if local_cache_dir else None
+
+    def get_available_name(self, name, max_length=None):
+        # the name is decided by the content in _save
+        return name
+
+    def _save(self, name, content):
+        name = content_name(name, content)
+        if not self.exists(name):
+            if self.local:
+                data = b"".join(content.chunks(CHUNK_SIZE))
+                self.backend.save(name, ContentFile(data))
+                self.local.put(name, data)
+            else:
+                self.backend.save(name, content)
+            self.existing.set(name, True)
+        return name
+
+    def _open(self, name, mode="rb"):
+        if not self.local or "r" not in mode or "+" in mode:
+            return self.backend.open(name, mode)
+        path = self.local.get(name)
+        if path:
+            return File(open(path, mode), name=name)
+        with self.backend.open(name, "rb") as f:
+            data = f.read()
+        self.local.put(name, data)
+        return ContentFile(data, name=name)
+
+    def exists(self, name):
+        if self.existing.get(name) or (self.local and self.local.get(name)):
+            return True
+        found = self.backend.exists(name)
+        if found:
+            self.existing.set(name, True)
+        return found
+
+    def url(self, name):
+        url = self.urls.get(name)
+        if url is None:
+            url = self.backend.url(name)
+            self.urls.set(name, url)
+        return url
+
+    def delete(self, name):
+        self.backend.delete(name)
+        self.urls.discard(name)
+        self.existing.discard(name)
+        if self.local:
+            self.local.discard(name)
+
+    def size(self, name):
+        path = self.local and self.local.get(name)
+        return os.path.getsize(path) if path else self.backend.size(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
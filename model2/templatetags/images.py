@@ -0,0 +1,21 @@
+"""
+{% load images %}
+
+    <img src="{{ book.coverimage|image_url:320 }}"
+         srcset="{{ book.coverimage|srcset }}" sizes="160px">
+"""
+from django import template
+
+from model2 import images
+
+register = template.Library()
+
+
+@register.filter
+def srcset(fieldfile, extension="webp"):
+    return images.srcset(fieldfile, extension)
+
+
+@register.filter
+def image_url(fieldfile, width=None):
+    return images.image_url(fieldfile, width)
@@ -0,0 +1,17 @@
+"""Helpers shared by the apps' tests."""
+from django.test.runner import DiscoverRunner
+
+# uploads kept in memory rather than sent to the media bucket
+TEST_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Django's runner, leaving out the ``benchmark`` tests unless ``--tag`` asks for them."""
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        if not tags:
+            exclude_tags = {*(exclude_tags or ()), "benchmark"}
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -0,0 +1,196 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from authentication.models import User
+from author.models import Book
+
+from . import images
+from .instrumentation import metrics
+from .storage import ContentAddressedStorage
+from .testing import TEST_STORAGES
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        overrides = override_settings(STORAGES=TEST_STORAGES, METRICS_DIR=self.directory.name, METRICS_TOKEN="secret")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+        author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        for i in range(3):
+            Book.objects.create(user=author, bname=f"Book {i}", genre="Fantasy", description="d")
+
+    def scrape(self, token="secret"):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.get("/metrics/", **headers)
+
+    def test_views_are_measured_per_route(self):
+        self.client.get(reverse("browse"))
+        body = self.scrape().content.decode()
+
+        self.assertIn('django_requests_total{view="browse",method="GET",status="2xx"} 1', body)
+        self.assertIn('django_request_db_queries_total{view="browse",method="GET",status="2xx"}', body)
+        self.assertIn('django_request_duration_seconds_bucket{view="browse",method="GET",status="2xx",le="+Inf"} 1', body)
+        template_line = next(line for line in body.splitlines() if line.startswith("django_request_template_seconds_total"))
+        self.assertGreater(float(template_line.split()[-1]), 0)
+        self.assertNotIn('view="metrics"', body)
+
+    def test_totals_from_other_workers_are_added(self):
+        self.client.get(reverse("browse"))
+        other = {"requests": [["browse", "GET", "2xx", {"requests": 4, "queries": 8}]], "counters": {}}
+        with open(os.path.join(self.directory.name, "worker-999999.json"), "w") as f:
+            json.dump(other, f)
+
+        body = self.scrape().content.decode()
+        self.assertIn('django_requests_total{view="browse",method="GET",status="2xx"} 5', body)
+
+    def test_slow_requests_are_logged_with_repeated_queries(self):
+        with self.settings(METRICS_SLOW_REQUEST_QUERIES=1):
+            with self.assertLogs("model2.instrumentation", "WARNING") as logs:
+                for book in Book.objects.all():
+                    self.client.get(reverse("book", args=[book.id]))
+        self.assertIn("Slow request GET", logs.output[0])
+        self.assertIn('django_slow_requests_total{view="book",method="GET",status="2xx"} 3', self.scrape().content.decode())
+
+    def test_scrapes_need_the_token(self):
+        self.assertEqual(self.scrape(token=None).status_code, 403)
+        self.assertEqual(self.scrape(token="wrong").status_code, 403)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    def test_without_a_token_only_staff_can_scrape(self):
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.scrape(token=None).status_code, 404)
+            self.assertEqual(self.scrape(token="").status_code, 404)
+            staff = User.objects.create_user("staff", "staff@example.com", "pw", agreed_to_terms=True, is_staff=True)
+            self.client.force_login(staff)
+            self.assertEqual(self.scrape(token=None).status_code, 200)
+
+
+def png(size=(800, 1200), color="orange", name="cover.png"):
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, color).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(STORAGES=TEST_STORAGES, IMAGE_PROCESSING="inline")
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.client.force_login(self.author)
+
+    def add_book(self, cover):
+        return self.client.post(reverse("addbook"), {
+            "bname": "Book", "btype": "Novel", "genre": "Fantasy", "agerating": "All", "description": "d",
+            "coverimage": cover,
+        })
+
+    def test_covers_are_stored_with_resized_copies_under_their_hash(self):
+        self.add_book(png())
+
+        book = Book.objects.get()
+        self.assertRegex(book.coverimage.name, r"^book_covers/[0-9a-f]{40}\.jpg$")
+        root = book.coverimage.name[:-len(".jpg")]
+        for width in images.KINDS["cover"]:
+            for extension in ("webp", "jpg"):
+                with default_storage.open(f"{root}/{width}.{extension}") as f:
+                    self.assertEqual(Image.open(f).width, width)
+        self.assertIn(f"{root}/320.webp 320w", images.srcset(book.coverimage))
+        self.assertTrue(images.image_url(book.coverimage, 200).endswith(f"{root}/320.jpg"))
+
+    def test_the_same_image_is_stored_once(self):
+        first = images.prepare(png(), "cover")
+        second = images.prepare(png(name="again.png"), "cover")
+
+        self.assertEqual(images.store(first, "book_covers/"), images.store(second, "book_covers/"))
+
+    def test_uploads_that_are_not_images_are_turned_away(self):
+        self.add_book(SimpleUploadedFile("cover.png", b"not an image", content_type="image/png"))
+
+        self.assertFalse(Book.objects.exists())
+
+    def test_images_from_before_the_pipeline_keep_their_url(self):
+        book = Book.objects.create(user=self.author, bname="Old", genre="Fantasy", description="d")
+
+        self.assertEqual(images.srcset(book.coverimage), "")
+        self.assertEqual(images.image_url(book.coverimage, 320), book.coverimage.url)
+
+    @override_settings(IMAGE_PROCESSING="thread")
+    def test_uploads_wait_for_the_commit_and_leave_the_request(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add_book(png())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Book.objects.get().coverimage.name, "book_covers/cover.png")
+
+
+class MediaStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = os.path.join(directory.name, "media")
+        self.local = os.path.join(directory.name, "local")
+        self.storage = self.make_storage()
+
+    def make_storage(self, **options):
+        backend = {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": self.media, "base_url": "/media/", "allow_overwrite": True},
+        }
+        return ContentAddressedStorage(backend, local_cache_dir=self.local, **options)
+
+    def test_identical_uploads_are_stored_once_by_content(self):
+        first = self.storage.save("book_covers/cover.png", ContentFile(b"same", name="cover.png"))
+        second = self.storage.save("book_covers/other.PNG", ContentFile(b"same", name="other.PNG"))
+
+        self.assertRegex(first, r"^book_covers/[0-9a-f]{40}\.png$")
+        self.assertEqual(first, second)
+        self.assertEqual(os.listdir(os.path.join(self.media, "book_covers")), [os.path.basename(first)])
+
+    def test_names_holding_a_digest_are_kept(self):
+        name = "book_covers/" + "a" * 40 + "/320.webp"
+
+        self.assertEqual(self.storage.save(name, ContentFile(b"copy")), name)
+
+    def test_urls_are_remembered_until_they_expire(self):
+        with mock.patch.object(self.storage.backend, "url", side_effect=lambda name: f"/signed/{name}") as url:
+            self.storage.url("a.png")
+            self.storage.url("a.png")
+            self.assertEqual(url.call_count, 1)
+
+            with mock.patch("model2.storage.time.monotonic", return_value=10 ** 9):
+                self.storage.url("a.png")
+            self.assertEqual(url.call_count, 2)
+
+    def test_hot_objects_are_read_from_local_disk(self):
+        name = self.storage.save("news_images/a.jpg", ContentFile(b"news"))
+        os.remove(os.path.join(self.media, name))  # only the local copy is left
+
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b"news")
+        self.assertTrue(self.storage.exists(name))
+
+    def test_least_recently_used_objects_leave_the_local_disk_first(self):
+        storage = self.make_storage(local_cache_bytes=8)
+        old = storage.save("a.bin", ContentFile(b"1234"))
+        used = storage.save("b.bin", ContentFile(b"5678"))
+        storage.open(used).close()
+        storage.save("c.bin", ContentFile(b"9abc"))
+
+        self.assertIsNone(storage.local.get(old))
+        self.assertIsNotNone(storage.local.get(used))
+        # the backend still has it
+        with storage.open(old) as f:
+            self.assertEqual(f.read(), b"1234")
@@ -20,6 +20,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('reader.urls')),
@@ -28,4 +30,5 @@ urlpatterns = [
     path('authentication/', include('authentication.urls')),
     path('library/', include('library.urls')),
     path('moderator/', include('moderator.urls')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
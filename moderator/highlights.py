@@ -0,0 +1,107 @@
+"""
+Published highlight shelves.
+
+Reader pages never query HighlightedBook. Each category is published to the
+cache as a snapshot of what its shelf shows (book id, title, cover URLs,
+rating, views, whether the book has chapters yet) with a version that
+moves on every time it is published.
+
+Moderator changes republish the category at once (moderator.signals and
+``reorder``). Edits to a highlighted book or its chapters republish the
+shelves holding it, found from the cached snapshots without a query;
+edits to any other book leave the shelves alone. Snapshots expire after
+HIGHLIGHT_SNAPSHOT_TIMEOUT so the ratings and views on them catch up.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from author.models import Chapter
+from model2 import images
+
+from .models import HighlightedBook
+
+CATEGORIES = (HighlightedBook.CATEGORY_TOP, HighlightedBook.CATEGORY_FEATURED)
+SHELF_SIZE = 15
+
+
+def snapshot_key(category):
+    return f"highlights:{category}"
+
+
+def build_snapshot(category):
+    highlights = (
+        HighlightedBook.objects.filter(category=category)
+        .select_related('book')
+        .annotate(has_chapters=Exists(Chapter.objects.filter(Book=OuterRef('book'))))
+        .order_by('order')[:SHELF_SIZE]
+    )
+    published_at = timezone.now()
+    return {
+        'version': int(published_at.timestamp() * 1_000_000),
+        'published_at': published_at,
+        'books': [
+            {
+                'book_id': highlight.book_id,
+                'title': highlight.book.bname,
+                'cover_url': images.image_url(highlight.book.coverimage, 320),
+                'cover_srcset': images.srcset(highlight.book.coverimage),
+                'rating': highlight.book.avg_rating,
+                'views': highlight.book.views,
+                'has_chapters': highlight.has_chapters,
+            }
+            for highlight in highlights
+        ],
+    }
+
+
+def publish(*categories):
+    """Rebuild the snapshots of ``categories`` (all of them by default) and put them in the cache."""
+    snapshots = {category: build_snapshot(category) for category in categories or CATEGORIES}
+    cache.set_many(
+        {snapshot_key(category): snapshot for category, snapshot in snapshots.items()},
+        getattr(settings, 'HIGHLIGHT_SNAPSHOT_TIMEOUT', 60 * 15),
+    )
+    return snapshots
+
+
+def get_snapshots(*categories):
+    """``{category: snapshot}`` for ``categories`` (all by default), publishing any not in the cache."""
+    categories = categories or CATEGORIES
+    found = cache.get_many([snapshot_key(category) for category in categories])
+    snapshots = {category: found[snapshot_key(category)] for category in categories if snapshot_key(category) in found}
+    missing = [category for category in categories if category not in snapshots]
+    if missing:
+        snapshots.update(publish(*missing))
+    return snapshots
+
+
+def get_snapshot(category):
+    return get_snapshots(category)[category]
+
+
+def republish_book(book_id):
+    """Republish the cached shelves showing ``book_id``; shelves not cached are built fresh anyway."""
+    found = cache.get_many([snapshot_key(category) for category in CATEGORIES])
+    holding = [
+        category for category in CATEGORIES
+        if any(entry['book_id'] == book_id for entry in found.get(snapshot_key(category), {}).get('books', ()))
+    ]
+    if holding:
+        publish(*holding)
+
+
+def reorder(highlight_ids):
+    """Number the highlights 1..n in the order given, in one UPDATE, and republish their shelves."""
+    highlight_ids = [int(pk) for pk in highlight_ids]
+    with transaction.atomic():
+        highlights = HighlightedBook.objects.select_for_update().only('pk', 'category', 'order').in_bulk(highlight_ids)
+        for order, pk in enumerate(highlight_ids, start=1):
+            if pk in highlights:
+                highlights[pk].order = order
+        HighlightedBook.objects.bulk_update(highlights.values(), ['order'])
+    if highlights:
+        publish(*{highlight.category for highlight in highlights.values()})
+    return len(highlights)
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from author.counters import counters_only
+from author.models import Book, Chapter, cascaded
+
+from . import highlights
+from .models import HighlightedBook
+
+
+@receiver(post_save, sender=HighlightedBook)
+def publish_saved_highlight(sender, **kwargs):
+    # every category, in case the admin moved a highlight from one to the other
+    highlights.publish()
+
+
+@receiver(post_delete, sender=HighlightedBook)
+def publish_deleted_highlight(sender, instance, **kwargs):
+    highlights.publish(instance.category)
+
+
+@receiver([post_save, post_delete], sender=Book)
+def republish_highlighted_book(sender, instance, update_fields=None, **kwargs):
+    # shelves show the title and cover
+    if counters_only(update_fields):
+        return
+    highlights.republish_book(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Chapter)
+def republish_highlighted_chapters(sender, instance, update_fields=None, origin=None, **kwargs):
+    # shelves only list books that have chapters; a deleted book is
+    # republished once, by republish_highlighted_book
+    if counters_only(update_fields) or cascaded(origin, Chapter):
+        return
+    highlights.republish_book(instance.Book_id)
@@ -1,3 +1,77 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from authentication.models import User
+from author.models import Book, Chapter
+from model2.testing import TEST_STORAGES
+
+from . import highlights
+from .models import HighlightedBook
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class HighlightSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(
+            "staff", "staff@example.com", "pw", agreed_to_terms=True, is_staff=True
+        )
+        self.books = []
+        for i in range(3):
+            book = Book.objects.create(user=self.staff, bname=f"Book {i}", genre="Fantasy", description="d")
+            Chapter.objects.create(Book=book, title="One", content="text", order=1)
+            self.books.append(book)
+        self.highlights = [
+            HighlightedBook.objects.create(book=book, category=HighlightedBook.CATEGORY_TOP, order=i)
+            for i, book in enumerate(self.books, start=1)
+        ]
+
+    def shelf(self):
+        return highlights.get_snapshot(HighlightedBook.CATEGORY_TOP)
+
+    def test_reader_pages_read_the_shelves_from_cache(self):
+        self.shelf()
+        with self.assertNumQueries(0):
+            snapshot = self.shelf()
+        self.assertEqual([entry["title"] for entry in snapshot["books"]], ["Book 0", "Book 1", "Book 2"])
+        self.assertTrue(snapshot["books"][0]["has_chapters"])
+
+    def test_reordering_is_one_update_and_republishes(self):
+        version = self.shelf()["version"]
+        ids = [highlight.pk for highlight in reversed(self.highlights)]
+        with CaptureQueriesContext(connection) as queries:
+            highlights.reorder(ids)
+        self.assertEqual(sum(query["sql"].startswith("UPDATE") for query in queries), 1)
+        snapshot = self.shelf()
+        self.assertGreater(snapshot["version"], version)
+        self.assertEqual([entry["title"] for entry in snapshot["books"]], ["Book 2", "Book 1", "Book 0"])
+
+    def test_only_edits_to_highlighted_books_republish(self):
+        version = self.shelf()["version"]
+        other = Book.objects.create(user=self.staff, bname="Other", genre="Fantasy", description="d")
+        Chapter.objects.create(Book=other, title="One", content="text", order=1)
+        self.assertEqual(self.shelf()["version"], version)
+
+        self.books[0].bname = "Renamed"
+        self.books[0].save()
+        self.assertEqual(self.shelf()["books"][0]["title"], "Renamed")
+
+    def test_deleting_a_book_republishes_once(self):
+        for order in range(2, 6):
+            Chapter.objects.create(Book=self.books[0], title=f"Chapter {order}", content="text", order=order)
+        book_id = self.books[0].pk
+        with mock.patch.object(highlights, "republish_book") as republish_book:
+            self.books[0].delete()
+        republish_book.assert_called_once_with(book_id)
+
+    def test_reorder_view(self):
+        self.client.force_login(self.staff)
+        ids = [str(highlight.pk) for highlight in reversed(self.highlights)]
+        response = self.client.post(reverse("reorder_highlight"), {"order[]": ids}, secure=True)
+        self.assertRedirects(response, reverse("highlight_list"), fetch_redirect_response=False)
+        self.assertEqual(self.shelf()["books"][0]["title"], "Book 2")
@@ -3,6 +3,9 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from authentication.models import User
 from author.models import Book
+from django.core.exceptions import ValidationError
+from model2 import images
+from . import highlights
 from .models import HighlightedBook
 from .models import News
 # Staff-only decorator
@@ -70,9 +73,10 @@ def delete_highlight(request, pk):
 @user_passes_test(staff_required)
 def reorder_highlight(request):
     if request.method == 'POST':
-        new_order = request.POST.getlist('order[]')
-        for idx, hb_id in enumerate(new_order, start=1):
-            HighlightedBook.objects.filter(id=hb_id).update(order=idx)
+        try:
+            highlights.reorder(request.POST.getlist('order[]'))  # one UPDATE for the whole list
+        except ValueError:
+            messages.error(request, "Invalid order")
         return redirect('highlight_list')
     messages.error(request, "Invalid request")
     return redirect('highlight_list')
@@ -139,12 +143,19 @@ def add_news(request):
             messages.error(request, "Title and content are required.")
             return redirect('add_news')
 
-        News.objects.create(
+        try:
+            image = images.prepare(image, 'news') if image else None
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect('add_news')
+
+        news = News.objects.create(
             title=title,
             content=content,
-            image=image,
             added_by=request.user
         )
+        if image:
+            images.attach(news, 'image', image)
         messages.success(request, "News added successfully.")
         return redirect('highlight_list')
 
@@ -0,0 +1,58 @@
+"""
+Cached home page sections.
+
+News is stored as a plain list under a fixed key and dropped by the
+handler in reader.signals when a news item changes. The top and featured
+shelves are the snapshots moderator.highlights publishes. The latest of
+the news rebuild time and the shelves' publish times doubles as the page's
+Last-Modified (see reader.conditional), so a warm home page renders
+without touching the database.
+
+The browse page is validated the same way, by a stamp dropped whenever a
+book is saved or deleted or its search document (author name, excerpt)
+changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from moderator import highlights
+from moderator.models import HighlightedBook, News
+
+NEWS_KEY = "home:news_items"
+UPDATED_KEY = "home:updated_at"
+BROWSE_KEY = "browse:updated_at"
+
+
+def timeout():
+    return getattr(settings, "HOME_CACHE_TIMEOUT", 300)
+
+
+def latest_news():
+    return list(News.objects.all().order_by('-added_on')[:10])  # latest 10 news items
+
+
+def get_home_sections():
+    """The top and featured shelves and the news, from cache where possible."""
+    news_items = cache.get_or_set(NEWS_KEY, latest_news, timeout())
+    updated_at = cache.get_or_set(UPDATED_KEY, timezone.now, timeout())
+    shelves = highlights.get_snapshots()
+    top, featured = shelves[HighlightedBook.CATEGORY_TOP], shelves[HighlightedBook.CATEGORY_FEATURED]
+    return {
+        'top_books': top['books'],
+        'featured_books': featured['books'],
+        'news_items': news_items,
+        'updated_at': max(updated_at, top['published_at'], featured['published_at']),
+    }
+
+
+def invalidate_news():
+    cache.delete_many((NEWS_KEY, UPDATED_KEY))
+
+
+def browse_updated_at():
+    return cache.get_or_set(BROWSE_KEY, timezone.now, timeout())
+
+
+def invalidate_browse():
+    cache.delete(BROWSE_KEY)
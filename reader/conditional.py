@@ -0,0 +1,127 @@
+"""
+Conditional GET for the public reader pages.
+
+``conditional_page`` computes cheap validators for a page before its view
+runs: a Last-Modified timestamp and an ETag over the values the page is
+built from. A revalidating browser or reverse proxy is answered with
+304 Not Modified without rendering anything. The page is also marked for
+``reader.middleware.CachePolicyMiddleware``, which picks the
+Cache-Control header once the response is final.
+
+Counters shown on a page (views, likes) change without touching any
+timestamp. The ETag therefore also carries a time bucket of
+``PUBLIC_PAGE_COUNTER_STALENESS`` seconds, so counters are never served
+staler than that.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from author.models import Book, Chapter, Review
+
+from .cache import browse_updated_at, get_home_sections
+from .models import BookRanking
+
+# the deploy time stands in for templates that only change with the code
+STARTED_AT = datetime.now(dt_timezone.utc)
+
+
+def public_max_age():
+    return getattr(settings, "PUBLIC_PAGE_MAX_AGE", 60)
+
+
+def counter_bucket():
+    return int(time.time() // getattr(settings, "PUBLIC_PAGE_COUNTER_STALENESS", 300))
+
+
+def make_etag(request, last_modified, parts, per_user):
+    user = request.user
+    if per_user and user.is_authenticated:
+        # signed-in pages carry the user's name and a CSRF token
+        parts = (*parts, user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    raw = repr((last_modified and last_modified.timestamp(), parts, request.get_full_path()))
+    return '"%s"' % hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def conditional_page(validator, max_age=None, per_user=True, on_request=None):
+    """
+    Answer If-None-Match / If-Modified-Since for a page readable without login.
+
+    ``validator(request, *args, **kwargs)`` returns ``(last_modified, parts)``.
+    ``last_modified`` is a datetime or None. ``parts`` is a tuple of whatever
+    else the page shows. Without ``per_user`` the page shows per-user state
+    the validator does not cover, so signed-in users always get a fresh
+    page. ``on_request`` runs for every GET, including 304s, for side
+    effects like counting views.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = etag = timestamp = None
+            if request.method in ("GET", "HEAD"):
+                validate = per_user or not request.user.is_authenticated
+                if validate:
+                    last_modified, parts = validator(request, *args, **kwargs)
+                    etag = make_etag(request, last_modified, parts, per_user)
+                    timestamp = int(last_modified.timestamp()) if last_modified else None
+                if on_request:
+                    on_request(request, *args, **kwargs)
+                if validate:
+                    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if etag and response.status_code in (200, 304):
+                response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+            response.public_max_age = max_age or public_max_age()
+            return response
+        return wrapped
+    return decorator
+
+
+# --- validators ---
+
+def static_page(request):
+    return STARTED_AT, ()
+
+
+def home_page(request):
+    # re-stamped whenever news changes or a highlight shelf is republished
+    # (see reader.cache)
+    return get_home_sections()["updated_at"], ()
+
+
+def browse_page(request):
+    # re-stamped whenever a book or its search document changes (see
+    # reader.cache)
+    return browse_updated_at(), ()
+
+
+def ranking_page(request):
+    # boards are only rewritten by refresh_rankings
+    return BookRanking.objects.aggregate(last=Max("computed_at"))["last"], ()
+
+
+def book_page(request, book_id):
+    book = get_object_or_404(
+        Book.objects.values("updated_at", "rating_sum", "total_ratings"), pk=book_id
+    )
+    chapters = Chapter.objects.filter(Book_id=book_id).aggregate(
+        last=Max("created_at"), count=Count("id"), likes=Sum("likes")
+    )
+    reviews = Review.objects.filter(book_id=book_id).aggregate(last=Max("updated_at"), count=Count("id"))
+    last_modified = max(filter(None, (book["updated_at"], chapters["last"], reviews["last"])))
+    parts = (
+        book["rating_sum"], book["total_ratings"], chapters["count"], chapters["likes"],
+        reviews["count"], counter_bucket(),
+    )
+    return last_modified, parts
@@ -0,0 +1,208 @@
+"""
+View deduplication.
+
+A view is counted once per visitor and item (a chapter, a book) per
+``VIEW_DEDUPE_SECONDS``. Visitors are identified by their user id when
+signed in, and otherwise by a fingerprint of their address and browser.
+The address is REMOTE_ADDR, unless the site runs behind
+``TRUSTED_PROXY_COUNT`` proxies appending to X-Forwarded-For; only the
+entry the outermost of them added is used, since anything to its left
+comes from the client.
+Seen views are remembered in a rotating Bloom filter:
+
+* time is cut into generations one window long; a view is a duplicate if
+  it is in the current or the previous generation's filter, so a repeat
+  is ignored for at least one full window;
+* each filter is split into 512-bit blocks and all of a view's bits land
+  in one block, so checking and adding touch one block per generation;
+* its size follows from ``VIEW_DEDUPE_CAPACITY`` (views per window) and
+  ``VIEW_DEDUPE_ERROR_RATE`` (the chance a first view is taken for a
+  repeat). Memory stays fixed however many views come in.
+
+Blocks live in a backend: ``memory`` keeps them in the process (tests,
+single worker), ``cache`` in the shared Django cache so all gunicorn workers
+agree. Two workers adding to the same block at once may lose one of the
+adds, which can only let a later repeat be counted, never drop a view.
+
+Each process tallies checks and duplicates per generation. ``stats()``
+reports them, and the duplicate rate of every finished generation is
+logged so the window and capacity can be tuned. The same counts are
+served at /metrics/ (model2.instrumentation), summed over all workers.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from model2.instrumentation import counter, metrics
+
+logger = logging.getLogger(__name__)
+
+BLOCK_BITS = 512
+
+VIEWS_CHECKED = counter("reader_view_dedupe_checks_total", "Views checked for repeats.")
+VIEWS_DUPLICATE = counter(
+    "reader_view_dedupe_duplicates_total", "Views not counted, being repeats; over the checks, the duplicate rate.",
+)
+
+
+def client_address(request):
+    """The visitor's address, read from X-Forwarded-For only as far as TRUSTED_PROXY_COUNT proxies vouch for."""
+    proxies = getattr(settings, "TRUSTED_PROXY_COUNT", 0)
+    if proxies:
+        forwarded = [address.strip() for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+        if len(forwarded) >= proxies and forwarded[-proxies]:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def fingerprint(request):
+    """Who is viewing: ``u<id>`` for a signed-in user, a hash of address and browser otherwise."""
+    if request.user.is_authenticated:
+        return f"u{request.user.pk}"
+    address = client_address(request)
+    agent = request.META.get("HTTP_USER_AGENT", "")
+    return "a" + hashlib.blake2b(f"{address}|{agent}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+class MemoryBlocks:
+    """Filter blocks in this process; generations older than the previous one are dropped."""
+
+    def __init__(self):
+        self._blocks = {}
+
+    def get_many(self, keys):
+        return {key: self._blocks[key] for key in keys if key in self._blocks}
+
+    def set(self, key, value, timeout):
+        self._blocks[key] = value
+
+    def rotate(self, generation):
+        self._blocks = {key: value for key, value in self._blocks.items() if key[0] >= generation - 1}
+
+
+class CacheBlocks:
+    """Filter blocks in the shared cache; each expires once its generation is out of the window."""
+
+    def get_many(self, keys):
+        found = cache.get_many([self.cache_key(key) for key in keys])
+        return {key: found[self.cache_key(key)] for key in keys if self.cache_key(key) in found}
+
+    def set(self, key, value, timeout):
+        cache.set(self.cache_key(key), value, timeout)
+
+    def rotate(self, generation):
+        pass
+
+    @staticmethod
+    def cache_key(key):
+        return "reader:dedupe:%d:%d" % key
+
+
+BACKENDS = {"memory": MemoryBlocks, "cache": CacheBlocks}
+
+
+class ViewDeduplicator:
+    def __init__(self, window=None, capacity=None, error_rate=None, backend=None):
+        self._window = window
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._backend = backend
+        self._store = None
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked = 0
+        self._duplicates = 0
+
+    @property
+    def window(self):
+        return self._window or getattr(settings, "VIEW_DEDUPE_SECONDS", 60 * 60 * 24)
+
+    @property
+    def capacity(self):
+        return self._capacity or getattr(settings, "VIEW_DEDUPE_CAPACITY", 1_000_000)
+
+    @property
+    def error_rate(self):
+        return self._error_rate or getattr(settings, "VIEW_DEDUPE_ERROR_RATE", 0.001)
+
+    @property
+    def backend(self):
+        if self._store is None:
+            self._store = BACKENDS[self._backend or getattr(settings, "VIEW_DEDUPE_BACKEND", "cache")]()
+        return self._store
+
+    @property
+    def bits(self):
+        """Bits per generation for ``capacity`` views at ``error_rate``."""
+        return math.ceil(-self.capacity * math.log(self.error_rate) / math.log(2) ** 2)
+
+    @property
+    def blocks(self):
+        return max(math.ceil(self.bits / BLOCK_BITS), 1)
+
+    @property
+    def hashes(self):
+        return max(round(self.bits / self.capacity * math.log(2)), 1)
+
+    def locate(self, item):
+        """The block ``item`` falls in and its bit mask there."""
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        block = int.from_bytes(digest[:8], "big") % self.blocks
+        h1 = int.from_bytes(digest[8:12], "big")
+        h2 = int.from_bytes(digest[12:], "big") | 1
+        mask = 0
+        for i in range(self.hashes):
+            mask |= 1 << ((h1 + i * h2) % BLOCK_BITS)
+        return block, mask
+
+    def first_view(self, visitor, item):
+        """Record ``visitor`` viewing ``item``; True unless it was already seen this window."""
+        generation = int(time.time() // self.window)
+        block, mask = self.locate(f"{visitor}|{item}")
+        current, previous = (generation, block), (generation - 1, block)
+
+        with self._lock:
+            self.rotate(generation)
+            found = self.backend.get_many([current, previous])
+            duplicate = any((found.get(key, 0) & mask) == mask for key in (current, previous))
+            if not duplicate:
+                # kept until the generation after this one has ended
+                self.backend.set(current, found.get(current, 0) | mask, self.window * 2)
+            self._checked += 1
+            self._duplicates += duplicate
+        metrics.increment(VIEWS_CHECKED)
+        if duplicate:
+            metrics.increment(VIEWS_DUPLICATE)
+        return not duplicate
+
+    def rotate(self, generation):
+        if generation == self._generation:
+            return
+        if self._generation is not None and self._checked:
+            stats = self.stats()
+            logger.info(
+                "View dedupe generation %s: %d checked, %d duplicates (%.1f%%)",
+                self._generation, stats["checked"], stats["duplicates"], stats["duplicate_rate"] * 100,
+            )
+        self.backend.rotate(generation)
+        self._generation = generation
+        self._checked = self._duplicates = 0
+
+    def stats(self):
+        """Checks and duplicates seen by this process in the current generation."""
+        return {
+            "generation": self._generation,
+            "checked": self._checked,
+            "duplicates": self._duplicates,
+            "duplicate_rate": self._duplicates / self._checked if self._checked else 0.0,
+            "bits": self.blocks * BLOCK_BITS,
+            "hashes": self.hashes,
+        }
+
+
+view_dedupe = ViewDeduplicator()
@@ -0,0 +1,120 @@
+"""
+Data for the chapter reading page.
+
+The page costs the same number of queries however long the book is or how
+many comments a chapter has: the chapter, its text, its book and the
+reader's like flag come in one query, the table of contents comes from
+cache (keyed by the book's version, see ``book_version``), previous/next are
+read off that list, and one page of comments is fetched with its authors
+and the reader's like flags.
+
+The chapter text is shown as stored by ``ChapterContent.values_for``:
+already sanitized and cut into pages, so a long chapter is read one page
+(``?page=N``) at a time. ``reader_page_etag`` fingerprints everything the
+page shows so the view can answer a repeat visit with 304 Not Modified.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+from django.utils.safestring import mark_safe
+
+from author.models import Chapter, ChapterLike, Comment, CommentLike
+
+from .pagination import CursorPaginator
+
+COMMENTS_PAGE_SIZE = 20
+
+
+def book_version(book):
+    """Changes whenever the book or one of its chapters is edited (see reader.signals)."""
+    return f"{book.updated_at.timestamp():.6f}"
+
+
+def toc_key(book):
+    return f"reader:toc:{book.pk}:{book_version(book)}"
+
+
+def table_of_contents(book):
+    """``[{'id', 'order', 'title'}, ...]`` for ``book`` in reading order."""
+    key = toc_key(book)
+    toc = cache.get(key)
+    if toc is None:
+        toc = list(Chapter.objects.filter(Book=book).order_by('order').values('id', 'order', 'title'))
+        cache.set(key, toc, getattr(settings, "TOC_CACHE_TIMEOUT", 60 * 60 * 24))
+    return toc
+
+
+def neighbours(toc, chapter_id):
+    """The entries before and after ``chapter_id`` in ``toc`` (None at either end)."""
+    for i, entry in enumerate(toc):
+        if entry['id'] == chapter_id:
+            prev_chapter = toc[i - 1] if i > 0 else None
+            next_chapter = toc[i + 1] if i + 1 < len(toc) else None
+            return prev_chapter, next_chapter
+    return None, None
+
+
+def comment_page(chapter_id, user, cursor=None):
+    """A page of the chapter's comments, oldest first, each with ``liked`` by ``user``."""
+    comments = (
+        Comment.objects.filter(chapter_id=chapter_id)
+        .select_related('user')
+        .annotate(liked=CommentLike.exists_for(user))
+    )
+    return CursorPaginator(comments, ('created_at', 'id'), COMMENTS_PAGE_SIZE).page(cursor)
+
+
+def chapter_pages(chapter):
+    try:
+        return chapter.body.pages
+    except Chapter.body.RelatedObjectDoesNotExist:
+        return [""]
+
+
+def load_reader_page(user, book_id, chapter_id, page=1):
+    """Context for ``reader/rread.html``; raises Http404 for an unknown chapter."""
+    chapter = get_object_or_404(
+        Chapter.objects.select_related('Book', 'body').annotate(liked=ChapterLike.exists_for(user)),
+        id=chapter_id,
+        Book_id=book_id,
+    )
+    toc = table_of_contents(chapter.Book)
+    prev_chapter, next_chapter = neighbours(toc, chapter.id)
+    pages = chapter_pages(chapter)
+    page = min(max(page, 1), len(pages))
+    return {
+        "chapter_liked": chapter.liked,
+        "book": chapter.Book,
+        "chapter": chapter,
+        "chapters": toc,
+        "prev_chapter": prev_chapter,
+        "next_chapter": next_chapter,
+        "comments": comment_page(chapter.id, user),
+        "chapter_html": mark_safe(pages[page - 1]),
+        "page_number": page,
+        "page_count": len(pages),
+        "prev_page": page - 1 if page > 1 else None,
+        "next_page": page + 1 if page < len(pages) else None,
+    }
+
+
+def reader_page_etag(context, user, csrf_cookie=None):
+    """A strong validator for the page rendered from ``context`` for ``user``."""
+    chapter = context["chapter"]
+    body = getattr(chapter, "body", None)
+    parts = [
+        body.etag if body else "",
+        context["page_number"],
+        chapter.title,
+        chapter.likes,
+        chapter.comments_count,
+        context["chapter_liked"],
+        book_version(context["book"]),
+        user.pk,
+        csrf_cookie,
+        [(c.pk, c.likes, c.liked, c.user.username) for c in context["comments"]],
+        context["comments"].next_cursor,
+    ]
+    return '"%s"' % hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from author.rollups import rebuild_daily_stats
+from reader.rankings import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Fold finished days into the running book scores and rebuild every leaderboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--skip-rollup",
+            action="store_true",
+            help="Use BookDailyStats as they are instead of rolling up yesterday and today first.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["skip_rollup"]:
+            today = timezone.localdate()
+            rebuild_daily_stats(today - timedelta(days=1), today)
+
+        written = refresh_rankings()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} ranking rows."))
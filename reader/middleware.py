@@ -0,0 +1,30 @@
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+class CachePolicyMiddleware:
+    """
+    Cache-Control for pages marked by ``reader.conditional.conditional_page``.
+
+    This has to sit above the session and CSRF middleware: whether a
+    response sets a cookie is only known once they have run. Anonymous
+    responses that set no cookie are public, so a reverse proxy may keep
+    them for ``max-age`` seconds. Everything else stays private to the
+    browser, which revalidates it each time.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        max_age = getattr(response, "public_max_age", None)
+        if max_age is None or response.status_code not in (200, 304):
+            return response
+
+        patch_vary_headers(response, ("Cookie",))
+        user = getattr(request, "user", None)
+        if response.cookies or (user is not None and user.is_authenticated):
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('author', '0007_bookdailystats_author_book_date_a80f0a_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookScore',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking_score', serialize=False, to='author.book')),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('trending', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RankingCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=40)),
+                ('scope', models.CharField(blank=True, max_length=80)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='author.book')),
+            ],
+            options={
+                'ordering': ['board', 'scope', 'rank'],
+                'unique_together': {('board', 'scope', 'rank')},
+            },
+        ),
+    ]
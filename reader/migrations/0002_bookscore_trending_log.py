@@ -0,0 +1,35 @@
+import math
+
+from django.db import migrations, models
+
+
+def to_log2(apps, schema_editor):
+    BookScore = apps.get_model('reader', 'BookScore')
+    scores = list(BookScore.objects.all())
+    for score in scores:
+        score.trending = math.log2(score.trending) if score.trending and score.trending > 0 else None
+    BookScore.objects.bulk_update(scores, ['trending'], batch_size=1000)
+
+
+def from_log2(apps, schema_editor):
+    BookScore = apps.get_model('reader', 'BookScore')
+    scores = list(BookScore.objects.all())
+    for score in scores:
+        score.trending = 2.0 ** score.trending if score.trending is not None else 0
+    BookScore.objects.bulk_update(scores, ['trending'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookscore',
+            name='trending',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(to_log2, from_log2),
+    ]
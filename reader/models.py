@@ -2,3 +2,42 @@ from django.db import models
 from authentication.models import User
 from author.models import Book, Chapter
 
+
+# --- RANKINGS (see reader.rankings) ---
+class BookScore(models.Model):
+    """Running per-book scores, advanced one finished day at a time."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name="ranking_score")
+    likes = models.PositiveIntegerField(default=0)  # all-time chapter likes
+    # log2 of the activity weighted by 2 ** (days since TRENDING_EPOCH /
+    # half-life); only the order matters, so old rows never need decaying.
+    # Null until the book has any activity
+    trending = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Scores for {self.book_id}"
+
+
+class RankingCheckpoint(models.Model):
+    """The last day folded into BookScore."""
+    name = models.CharField(max_length=40, primary_key=True)
+    day = models.DateField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.day}"
+
+
+class BookRanking(models.Model):
+    """One row of a materialized leaderboard."""
+    board = models.CharField(max_length=40)               # "views:week", "rating:all", ...
+    scope = models.CharField(max_length=80, blank=True)   # "", "type:novel", "genre:Fantasy"
+    rank = models.PositiveSmallIntegerField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="rankings")
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('board', 'scope', 'rank')
+        ordering = ['board', 'scope', 'rank']
+
+    def __str__(self):
+        return f"#{self.rank} {self.board} {self.scope or 'all'}"
@@ -0,0 +1,155 @@
+"""
+Keyset (cursor) pagination.
+
+A page is addressed by an opaque cursor holding the sort key and id of the
+last row shown, and the next page is fetched with ``WHERE (key, id) > cursor``
+instead of ``OFFSET``, so page N costs the same as page 1. There is no total
+count; ``approximate_count`` gives a cheap one where a page wants to show it.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+def _default(value):
+    # isoformat keeps microseconds, which DjangoJSONEncoder would truncate
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot put {type(value).__name__} in a cursor")
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The values inside ``cursor``, or None when it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Paginate ``queryset`` ordered by ``ordering`` (field names, ``-`` for
+    descending). ``id`` is appended as a tie-breaker when it is not already
+    the last key, so every cursor points at exactly one row.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        last = self.ordering[-1].lstrip('-')
+        if last not in ('id', 'pk'):
+            self.ordering.append('-id' if self.ordering[-1].startswith('-') else 'id')
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """The page after ``cursor``; the first page when it is missing or not one of ours."""
+        queryset = self.queryset.order_by(*self.ordering)
+        values = decode_cursor(cursor)
+        if values is not None and len(values) == len(self.ordering):
+            try:
+                queryset = queryset.filter(self._after(self._clean(values)))
+            except (ValidationError, ValueError, TypeError):
+                pass
+
+        rows = list(queryset[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            return CursorPage(rows)
+        rows = rows[:self.per_page]
+        return CursorPage(rows, encode_cursor([self._value(rows[-1], f) for f in self.ordering]))
+
+    def _clean(self, values):
+        """``values`` converted by the fields they sort on; raises if one of them can't be."""
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            model = self.queryset.model
+            for name in field.lstrip('-').split('__'):
+                model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+                model = model_field.related_model
+            if model_field.is_relation:
+                model_field = model_field.target_field
+            cleaned.append(model_field.to_python(value))
+        return cleaned
+
+    def _after(self, values):
+        """Rows that sort after ``values``, i.e. ``(k1, k2, ...) > (v1, v2, ...)``."""
+        expanded = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for previous, value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{previous.lstrip('-'): value})
+            expanded |= step
+        # the redundant bound on the leading key lets the database range-scan its index
+        first = self.ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return bound & expanded
+
+    @staticmethod
+    def _value(obj, field):
+        for attr in field.lstrip('-').split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+
+class ListCursorPaginator:
+    """Cursor pages over an already ranked, bounded list such as search results."""
+
+    def __init__(self, object_list, per_page=20):
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        values = decode_cursor(cursor)
+        start = values[0] if values and isinstance(values[0], int) and values[0] > 0 else 0
+        end = start + self.per_page
+        next_cursor = encode_cursor([end]) if end < len(self.object_list) else None
+        return CursorPage(self.object_list[start:end], next_cursor)
+
+
+def approximate_count(queryset, cap=1000):
+    """
+    A count that never scans more than ``cap`` rows. For an unfiltered table
+    on PostgreSQL the planner's row estimate is used instead.
+    """
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:  # -1 until the table has been analyzed
+            return row[0]
+    return queryset[:cap].count()
@@ -0,0 +1,215 @@
+"""
+Ranking engine behind the ranking page.
+
+Leaderboards are materialized into BookRanking by ``refresh_rankings`` (run
+it from cron through the ``refresh_rankings`` command) so the page itself is
+one indexed lookup on (board, scope, rank). Each board is kept overall, per
+book type and per genre.
+
+Inputs:
+
+* views and likes per day, week and month are summed from the
+  BookDailyStats rollups inside the window only;
+* all-time views come from ``Book.views``; all-time likes and the trending
+  score live in BookScore and are advanced by folding in only the days
+  since the last run (``fold_activity``);
+* rating uses a Bayesian average over the books that have ratings, pulling
+  books with few ratings towards the site-wide mean so a single 5-star
+  review does not top the board.
+
+Trending weights each day's activity by ``2 ** (days / half-life)`` counted
+from a fixed epoch, which orders books exactly as an exponentially decayed
+score would without ever having to decay the stored values. The weights
+grow without bound, so BookScore keeps the score's base-2 logarithm and
+the board converts it back to today's decayed value.
+"""
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Power
+from django.utils import timezone
+
+from author.models import Book, BookDailyStats, Chapter
+from author.rollups import aggregate_daily
+
+from .models import BookRanking, BookScore, RankingCheckpoint
+
+TRENDING_EPOCH = date(2025, 1, 1)
+# how much each kind of daily activity counts towards trending
+TRENDING_WEIGHTS = {'views': 1, 'likes': 3, 'comments': 5, 'bookmarks': 5}
+
+METRICS = ('views', 'likes', 'rating', 'trending')
+PERIODS = {'day': 1, 'week': 7, 'month': 30, 'all': None}
+BOARDS = [
+    f'{metric}:{period}' for metric in ('views', 'likes') for period in PERIODS
+] + ['rating:all', 'trending:all']
+
+CHECKPOINT = 'book_scores'
+
+
+def ranking_size():
+    return getattr(settings, "RANKING_SIZE", 50)
+
+
+def half_life():
+    return getattr(settings, "RANKING_TRENDING_HALF_LIFE_DAYS", 3)
+
+
+def trending_exponent(day):
+    """log2 of the weight of ``day``'s activity."""
+    return (day - TRENDING_EPOCH).days / half_life()
+
+
+def log2_add(a, b):
+    """``log2(2 ** a + 2 ** b)`` without leaving log space; None stands for no score."""
+    if a is None or b is None:
+        return b if a is None else a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2.0 ** (low - high))
+
+
+# --- incremental scores ---
+
+@transaction.atomic
+def fold_activity(through):
+    """Add the finished days up to ``through`` not yet counted to BookScore; returns the books touched."""
+    checkpoint = RankingCheckpoint.objects.select_for_update().filter(name=CHECKPOINT).first()
+    stats = BookDailyStats.objects.filter(date__lte=through)
+    likes = defaultdict(int)
+    trending = {}
+
+    if checkpoint:
+        if checkpoint.day >= through:
+            return 0
+        stats = stats.filter(date__gt=checkpoint.day)
+    else:
+        # first run: likes from before the activity log existed are only on
+        # the chapters, so start from those (less anything logged since)
+        for row in Chapter.objects.order_by().values('Book_id').annotate(total=Sum('likes')):
+            likes[row['Book_id']] = row['total']
+        for (book_id, _), values in aggregate_daily(through + timedelta(days=1), timezone.localdate()).items():
+            likes[book_id] -= values['likes']
+
+    for row in stats.values('book_id', 'date', *TRENDING_WEIGHTS):
+        if checkpoint:
+            likes[row['book_id']] += row['likes']
+        activity = sum(row[field] * weight for field, weight in TRENDING_WEIGHTS.items())
+        if activity > 0:  # a day of more unlikes than anything else counts as no activity
+            day_score = math.log2(activity) + trending_exponent(row['date'])
+            trending[row['book_id']] = log2_add(trending.get(row['book_id']), day_score)
+
+    book_ids = set(likes) | set(trending)
+    existing = BookScore.objects.in_bulk(list(book_ids))
+    scores = []
+    for book_id in book_ids:
+        score = existing.get(book_id) or BookScore(book_id=book_id)
+        score.likes = max(score.likes + likes[book_id], 0)  # unlikes can outnumber likes within a day
+        score.trending = log2_add(score.trending, trending.get(book_id))
+        scores.append(score)
+    BookScore.objects.bulk_create(
+        scores,
+        update_conflicts=True,
+        unique_fields=['book'],
+        update_fields=['likes', 'trending'],
+        batch_size=1000,
+    )
+
+    RankingCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'day': through})
+    return len(scores)
+
+
+# --- boards ---
+
+def scopes():
+    """``(scope, filter)`` for the overall board, each book type and each genre in use."""
+    yield '', {}
+    for btype, _ in Book.BOOK_TYPES:
+        yield f'type:{btype}', {'btype': btype}
+    for genre in Book.objects.order_by().values_list('genre', flat=True).distinct():
+        yield f'genre:{genre}', {'genre': genre}
+
+
+def board_source(board, today):
+    """A queryset of ``(book id, score)`` rows for ``board`` and the path from it to Book."""
+    metric, period = board.split(':')
+    days = PERIODS[period]
+
+    if days:
+        window = BookDailyStats.objects.filter(date__gt=today - timedelta(days=days), date__lte=today)
+        rows = window.order_by().values('book_id').annotate(score=Sum(metric))
+        return rows.filter(score__gt=0), 'book__', 'book_id'
+    if metric == 'views':
+        return Book.objects.filter(views__gt=0).annotate(score=F('views')), '', 'pk'
+    if metric == 'likes':
+        return BookScore.objects.filter(likes__gt=0).annotate(score=F('likes')), 'book__', 'book_id'
+    if metric == 'trending':
+        # take the epoch weight back out so the score reads as today's decayed value
+        rows = BookScore.objects.filter(trending__isnull=False).annotate(
+            score=Power(Value(2.0), F('trending') - Value(trending_exponent(today)))
+        )
+        return rows, 'book__', 'book_id'
+    if metric == 'rating':
+        return rated_books(), '', 'pk'
+    raise ValueError(f"Unknown board {board!r}")
+
+
+def rated_books():
+    """Books with ratings, scored by a Bayesian average towards the site-wide mean."""
+    prior = getattr(settings, "RANKING_RATING_PRIOR", 10)
+    totals = Book.objects.aggregate(sum=Sum('rating_sum'), count=Sum('total_ratings'))
+    mean = totals['sum'] / totals['count'] if totals['count'] else 0
+    return Book.objects.filter(total_ratings__gt=0).annotate(
+        score=(Value(prior * mean) + Cast('rating_sum', FloatField())) / (Value(float(prior)) + F('total_ratings'))
+    )
+
+
+def build_board(board, today, computed_at):
+    source, book_path, book_field = board_source(board, today)
+    rows = []
+    for scope, condition in scopes():
+        top = (
+            source.filter(**{f'{book_path}{field}': value for field, value in condition.items()})
+            .order_by('-score', book_field)
+            .values_list(book_field, 'score')[:ranking_size()]
+        )
+        rows.extend(
+            BookRanking(board=board, scope=scope, rank=rank, book_id=book_id, score=score, computed_at=computed_at)
+            for rank, (book_id, score) in enumerate(top, start=1)
+        )
+    return rows
+
+
+def refresh_rankings(today=None):
+    """Advance the running scores and rebuild every board; returns the number of rows written."""
+    today = today or timezone.localdate()
+    fold_activity(today - timedelta(days=1))
+
+    computed_at = timezone.now()
+    written = 0
+    for board in BOARDS:
+        rows = build_board(board, today, computed_at)
+        with transaction.atomic():
+            BookRanking.objects.filter(board=board).delete()
+            BookRanking.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+# --- reads ---
+
+def get_ranking(metric='views', period='week', scope='', limit=None):
+    """The materialized board, best first, with each book loaded."""
+    if metric not in METRICS or period not in PERIODS:
+        return []
+    board = f'{metric}:{period}'
+    if board not in BOARDS:
+        board = f'{metric}:all'
+    return list(
+        BookRanking.objects.filter(board=board, scope=scope)
+        .select_related('book')
+        .order_by('rank')[:limit or ranking_size()]
+    )
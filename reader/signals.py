@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from author.counters import counters_only
+from author.models import Book, Chapter, cascaded
+from author.ordering import chapters_reordered
+from browse.search import documents_changed
+from moderator.models import News
+
+from . import cache
+
+
+@receiver([post_save, post_delete], sender=Chapter)
+def touch_book(sender, instance, origin=None, **kwargs):
+    # a new updated_at is a new book version, so cached tables of contents
+    # (reader.loaders) are rebuilt on the next read; a book being deleted
+    # needs none
+    if counters_only(kwargs.get('update_fields')) or cascaded(origin, Chapter):
+        return
+    Book.objects.filter(pk=instance.Book_id).update(updated_at=timezone.now())
+
+
+@receiver(chapters_reordered)
+def touch_reordered_book(sender, book_id, **kwargs):
+    Book.objects.filter(pk=book_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=News)
+def invalidate_news(sender, **kwargs):
+    cache.invalidate_news()
+
+
+@receiver(post_save, sender=Book)
+def invalidate_saved_book(sender, update_fields=None, **kwargs):
+    # browse cards show no counters
+    if not counters_only(update_fields):
+        cache.invalidate_browse()
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_deleted_book(sender, **kwargs):
+    cache.invalidate_browse()
+
+
+@receiver(documents_changed)
+def invalidate_browse(sender, **kwargs):
+    cache.invalidate_browse()
@@ -1,3 +1,403 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from author.counters import view_counter
+from author.models import ActivityEvent, Book, BookDailyStats, Chapter, Comment, Review
+from library.models import Library
+from model2.instrumentation import metrics, render_prometheus
+from model2.testing import TEST_STORAGES
+from moderator.models import HighlightedBook, News
+
+from . import rankings, urls as reader_urls
+from .dedupe import ViewDeduplicator, fingerprint
+from .models import BookScore
+from .pagination import CursorPaginator, ListCursorPaginator, encode_cursor
+
+
+@override_settings(STORAGES=TEST_STORAGES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ReadPageQueryBudgetTests(TestCase):
+    # user (1), chapter (1), table of contents (1), comments (1), library (1)
+    # and history (3 for a book new to it: update, insert and count, 1 after);
+    # the session comes from cache
+    BUDGET = 8
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user("reader", "reader@example.com", "pw", agreed_to_terms=True)
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        Library.objects.create(user=self.reader)
+        self.client.force_login(self.reader)
+        self.client.get(reverse("about"))  # the session's sliding-expiry refresh happens here
+
+    def make_book(self, chapters, comments):
+        book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+        for order in range(1, chapters + 1):
+            Chapter.objects.create(Book=book, title=f"Chapter {order}", content="text", order=order)
+        chapter = book.chapters.order_by("order")[chapters // 2]
+        for i in range(comments):
+            commenter = User.objects.create_user(f"c{book.pk}-{i}", f"c{book.pk}-{i}@example.com", "pw")
+            comment = Comment.objects.create(chapter=chapter, user=commenter, content=f"comment {i}")
+            if i % 2:
+                comment.liked_by.add(self.reader)
+        chapter.liked_by.add(self.reader)
+        return book, chapter
+
+    def count_queries(self, book, chapter):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("read", args=[book.id, chapter.id]))
+        self.assertEqual(response.status_code, 200)
+        return ctx, response
+
+    def test_query_count_does_not_grow_with_book_size(self):
+        small = self.make_book(chapters=2, comments=1)
+        large = self.make_book(chapters=40, comments=30)
+
+        small_queries, _ = self.count_queries(*small)
+        large_queries, response = self.count_queries(*large)
+
+        self.assertLessEqual(len(large_queries), self.BUDGET)
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertTrue(response.context["chapter_liked"])
+        self.assertEqual(len(response.context["chapters"]), 40)
+
+    def test_deleting_a_book_takes_constant_queries(self):
+        small, _ = self.make_book(chapters=2, comments=1)
+        large, _ = self.make_book(chapters=40, comments=1)
+        with CaptureQueriesContext(connection) as small_queries:
+            small.delete()
+        with CaptureQueriesContext(connection) as large_queries:
+            large.delete()
+        self.assertEqual(len(large_queries), len(small_queries))
+
+    def test_table_of_contents_is_cached_until_a_chapter_changes(self):
+        book, chapter = self.make_book(chapters=5, comments=0)
+
+        def chapter_queries():
+            queries, _ = self.count_queries(book, chapter)
+            return [q["sql"] for q in queries if 'FROM "author_chapter"' in q["sql"]]
+
+        self.assertEqual(len(chapter_queries()), 2)
+        self.assertEqual(len(chapter_queries()), 1)
+
+        Chapter.objects.create(Book=book, title="Epilogue", content="text", order=6)
+        _, response = self.count_queries(book, chapter)
+        self.assertEqual(response.context["chapters"][-1]["title"], "Epilogue")
+
+    def test_prev_and_next_come_from_the_table_of_contents(self):
+        book, chapter = self.make_book(chapters=3, comments=0)
+        _, response = self.count_queries(book, chapter)
+        self.assertEqual(response.context["prev_chapter"]["order"], chapter.order - 1)
+        self.assertEqual(response.context["next_chapter"]["order"], chapter.order + 1)
+
+    def test_comments_are_listed_oldest_first(self):
+        book, chapter = self.make_book(chapters=1, comments=3)
+        _, response = self.count_queries(book, chapter)
+        self.assertEqual([comment.content for comment in response.context["comments"]],
+                         ["comment 0", "comment 1", "comment 2"])
+
+    def test_unchanged_page_is_answered_with_not_modified(self):
+        book, chapter = self.make_book(chapters=2, comments=1)
+        url = reverse("read", args=[book.id, chapter.id])
+        self.client.get(url)  # sets the CSRF cookie, which is part of the page
+        first = self.client.get(url)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        Chapter.objects.filter(pk=chapter.pk).update(likes=F("likes") + 1)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_long_chapters_are_read_a_page_at_a_time(self):
+        book, chapter = self.make_book(chapters=1, comments=0)
+        chapter.content = "".join(f"<p>{'word ' * 500}</p>" for _ in range(8))
+        chapter.save()
+        url = reverse("read", args=[book.id, chapter.id])
+
+        response = self.client.get(url, {"page": 2})
+        self.assertEqual(response.context["page_count"], 2)
+        self.assertEqual(response.context["page_number"], 2)
+        self.assertIsNone(response.context["next_page"])
+        self.assertEqual(self.client.get(url, {"page": 9}).context["page_number"], 2)
+
+
+@override_settings(STORAGES=TEST_STORAGES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CachePolicyTests(TestCase):
+    # the only reader routes a shared cache may keep for anonymous visitors
+    CACHEABLE = {"home", "browse", "ranking", "about", "contest", "book"}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.book = Book.objects.create(user=self.author, bname="Book", genre="Fantasy", description="d")
+        self.chapter = Chapter.objects.create(Book=self.book, title="One", content="<p>text</p>", order=1)
+        self.comment = Comment.objects.create(chapter=self.chapter, user=self.author, content="hi")
+        self.review = Review.objects.create(book=self.book, user=self.author, rating=4, review="ok")
+
+    def route_urls(self):
+        args = {
+            "book_id": self.book.id,
+            "chapter_id": self.chapter.id,
+            "comment_id": self.comment.id,
+            "review_id": self.review.id,
+        }
+        for pattern in reader_urls.urlpatterns:
+            kwargs = {name: args[name] for name in pattern.pattern.regex.groupindex}
+            yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+    def test_only_public_pages_are_cacheable_by_a_proxy(self):
+        for name, url in self.route_urls():
+            with self.subTest(route=name):
+                response = self.client.get(url)
+                self.assertLess(response.status_code, 500)
+                cache_control = response.get("Cache-Control", "")
+                self.assertEqual("public" in cache_control, name in self.CACHEABLE, cache_control)
+
+    def test_signed_in_pages_are_private(self):
+        self.client.force_login(self.author)
+        for name in ("home", "browse", "about", "book"):
+            with self.subTest(route=name):
+                args = [self.book.id] if name == "book" else []
+                response = self.client.get(reverse(name, args=args))
+                self.assertIn("private", response["Cache-Control"])
+                self.assertIn("Cookie", response["Vary"])
+
+    def test_revalidation_returns_not_modified_until_the_book_changes(self):
+        url = reverse("book", args=[self.book.id])
+        first = self.client.get(url)
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        views = view_counter.pending(Book, self.book.id)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"], REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(view_counter.pending(Book, self.book.id), views + 1)  # another visitor's view
+
+        Chapter.objects.create(Book=self.book, title="Two", content="<p>more</p>", order=2)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_home_page_revalidates_against_its_sections(self):
+        first = self.client.get(reverse("home"))
+        self.assertEqual(self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        HighlightedBook.objects.create(book=self.book, category=HighlightedBook.CATEGORY_TOP, order=1)
+        self.assertEqual(self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_browse_page_revalidates_without_scanning_books(self):
+        url = reverse("browse")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.author.username = "renamed"
+        self.author.save()
+        renamed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(renamed.status_code, 200)
+        self.assertContains(renamed, "renamed")
+
+        Book.objects.create(user=self.author, bname="Another", genre="Fantasy", description="d")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=renamed["ETag"]).status_code, 200)
+
+    def test_warm_home_page_runs_no_queries(self):
+        HighlightedBook.objects.create(book=self.book, category=HighlightedBook.CATEGORY_FEATURED, order=1)
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual([book["title"] for book in response.context["featured_books"]], ["Book"])
+
+    def test_news_changes_show_on_the_next_home_page(self):
+        def titles():
+            return [news.title for news in self.client.get(reverse("home")).context["news_items"]]
+
+        first = News.objects.create(title="First", content="a")
+        self.assertEqual(titles(), ["First"])
+        News.objects.create(title="Second", content="b")
+        self.assertEqual(titles(), ["Second", "First"])
+        first.delete()
+        self.assertEqual(titles(), ["Second"])
+
+
+class ViewDedupeTests(SimpleTestCase):
+    def make(self, **kwargs):
+        return ViewDeduplicator(window=100, capacity=1000, error_rate=0.01, backend="memory", **kwargs)
+
+    def test_one_view_per_visitor_and_item_per_window(self):
+        dedupe = self.make()
+        with mock.patch("reader.dedupe.time.time", return_value=1_000):
+            self.assertTrue(dedupe.first_view("u1", "chapter:1"))
+            self.assertFalse(dedupe.first_view("u1", "chapter:1"))
+            self.assertTrue(dedupe.first_view("u1", "chapter:2"))
+            self.assertTrue(dedupe.first_view("u2", "chapter:1"))
+        with mock.patch("reader.dedupe.time.time", return_value=1_150):
+            self.assertFalse(dedupe.first_view("u1", "chapter:1"))  # previous generation still counts
+        with mock.patch("reader.dedupe.time.time", return_value=1_250):
+            self.assertTrue(dedupe.first_view("u1", "chapter:1"))
+
+    def test_memory_is_bounded_and_duplicates_are_measured(self):
+        dedupe = self.make()
+        for now in (1_000, 1_100, 1_200, 1_300):
+            with mock.patch("reader.dedupe.time.time", return_value=now):
+                for visitor in range(200):
+                    dedupe.first_view(f"u{visitor}", "book:1")
+                    dedupe.first_view(f"u{visitor}", "book:1")
+        self.assertLessEqual({key[0] for key in dedupe.backend._blocks}, {12, 13})
+        stats = dedupe.stats()
+        self.assertEqual(stats["checked"], 400)
+        self.assertGreaterEqual(stats["duplicate_rate"], 0.5)
+
+    @override_settings(METRICS_DIR=None)
+    def test_duplicates_are_served_as_metrics(self):
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+        dedupe = self.make()
+        dedupe.first_view("u1", "chapter:1")
+        dedupe.first_view("u1", "chapter:1")
+
+        body = render_prometheus(*metrics.collect())
+        self.assertIn("reader_view_dedupe_checks_total 2", body)
+        self.assertIn("reader_view_dedupe_duplicates_total 1", body)
+
+    def test_forwarded_addresses_count_only_behind_trusted_proxies(self):
+        def visitor(forwarded):
+            request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=forwarded)
+            request.user = AnonymousUser()
+            return fingerprint(request)
+
+        self.assertEqual(visitor("1.1.1.1"), visitor("2.2.2.2"))
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(visitor("1.1.1.1, 3.3.3.3"), visitor("2.2.2.2, 3.3.3.3"))
+            self.assertNotEqual(visitor("3.3.3.3"), visitor("4.4.4.4"))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        # ties on the name, so the id breaks them
+        for name in ["b", "a", "c", "b", "a", "b", "d"]:
+            Book.objects.create(user=cls.author, bname=name, genre="Fantasy", description="d")
+
+    def walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for ordering in (("bname",), ("-bname",), ("-created_at",)):
+            with self.subTest(ordering=ordering):
+                paginator = CursorPaginator(Book.objects.all(), ordering, per_page=2)
+                expected = list(Book.objects.order_by(*paginator.ordering))
+                self.assertEqual(self.walk(paginator), expected)
+
+    def test_bad_cursors_serve_the_first_page(self):
+        paginator = CursorPaginator(Book.objects.all(), ("-created_at",), per_page=2)
+        first = list(paginator.page())
+        for cursor in ("not base64!", encode_cursor({"a": 1}), encode_cursor(["b"]),
+                       encode_cursor(["b", "zzz"]), encode_cursor([None, 1]), encode_cursor([[1], {}])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(paginator.page(cursor)), first)
+
+    def test_list_pages(self):
+        paginator = ListCursorPaginator(list(range(5)), per_page=2)
+        self.assertEqual(self.walk(paginator), [0, 1, 2, 3, 4])
+        self.assertEqual(list(paginator.page(encode_cursor(["x"]))), [0, 1])
+
+    def test_views_survive_tampered_cursors(self):
+        book = Book.objects.first()
+        bad = encode_cursor(["b", "zzz"])
+        for url in (reverse("browse"), reverse("browse_more"), reverse("book_reviews", args=[book.id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {"cursor": bad}).status_code, 200)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class RankingTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.author = User.objects.create_user("author", "author@example.com", "pw", agreed_to_terms=True)
+        self.books = {
+            name: Book.objects.create(user=self.author, bname=name, btype=btype, genre=genre, description="d")
+            for name, btype, genre in (
+                ("Novel A", "novel", "Fantasy"), ("Novel B", "novel", "Drama"), ("Comic", "comic", "Fantasy"),
+            )
+        }
+
+    def stats(self, name, days_ago, **values):
+        BookDailyStats.objects.create(book=self.books[name], date=self.today - timedelta(days=days_ago), **values)
+
+    def board(self, metric, period, scope=""):
+        return [(row.book.bname, row.score) for row in rankings.get_ranking(metric, period, scope)]
+
+    def test_period_boards_sum_only_their_window_per_scope(self):
+        self.stats("Novel A", 1, views=5)
+        self.stats("Novel B", 1, views=3)
+        self.stats("Novel B", 2, views=4)
+        self.stats("Comic", 20, views=50)
+        rankings.refresh_rankings(self.today)
+
+        self.assertEqual(self.board("views", "day"), [])
+        self.assertEqual(self.board("views", "week"), [("Novel B", 7), ("Novel A", 5)])
+        self.assertEqual(self.board("views", "month"), [("Comic", 50), ("Novel B", 7), ("Novel A", 5)])
+        self.assertEqual(self.board("views", "month", "genre:Fantasy"), [("Comic", 50), ("Novel A", 5)])
+        self.assertEqual(self.board("views", "week", "type:comic"), [])
+
+    def test_a_single_top_rating_does_not_beat_many_good_ones(self):
+        Book.objects.filter(pk=self.books["Novel A"].pk).update(rating_sum=5, total_ratings=1)
+        Book.objects.filter(pk=self.books["Novel B"].pk).update(rating_sum=90, total_ratings=20)
+        Book.objects.filter(pk=self.books["Comic"].pk).update(rating_sum=60, total_ratings=20)
+        rankings.refresh_rankings(self.today)
+        self.assertEqual([name for name, _ in self.board("rating", "all")], ["Novel B", "Novel A", "Comic"])
+
+    def test_scores_fold_in_each_finished_day_once(self):
+        # the first run starts from the likes on the chapters
+        Chapter.objects.create(Book=self.books["Novel A"], title="One", content="text", order=1, likes=2)
+        self.stats("Novel A", 2, likes=2, views=10)
+        rankings.refresh_rankings(self.today)
+        rankings.refresh_rankings(self.today)
+        self.assertEqual(BookScore.objects.get(book=self.books["Novel A"]).likes, 2)
+
+        self.stats("Novel A", 0, likes=3)
+        rankings.refresh_rankings(self.today + timedelta(days=1))
+        self.assertEqual(BookScore.objects.get(book=self.books["Novel A"]).likes, 5)
+        self.assertEqual(self.board("likes", "all"), [("Novel A", 5)])
+        self.assertEqual(self.board("trending", "all")[0][0], "Novel A")
+
+    @override_settings(RANKING_TRENDING_HALF_LIFE_DAYS=1)
+    def test_trending_stays_finite_far_from_the_epoch(self):
+        far = date(2300, 1, 1)
+        for name, days_ago, views in (("Novel A", 2, 8), ("Novel A", 3, 8), ("Novel B", 1, 5)):
+            BookDailyStats.objects.create(book=self.books[name], date=far - timedelta(days=days_ago), views=views)
+        rankings.refresh_rankings(far)
+
+        [(first, first_score), (second, second_score)] = self.board("trending", "all")
+        self.assertEqual((first, second), ("Novel A", "Novel B"))
+        self.assertAlmostEqual(first_score, 8 / 4 + 8 / 8)  # halved for every day since
+        self.assertAlmostEqual(second_score, 5 / 2)
+        self.assertLess(BookScore.objects.get(book=self.books["Novel A"]).trending, 1e6)
+
+    def test_command_rolls_up_the_recent_days_first(self):
+        ActivityEvent.objects.create(kind=ActivityEvent.VIEW, book=self.books["Comic"], count=1, day=self.today)
+        out = StringIO()
+        call_command("refresh_rankings", stdout=out)
+        self.assertIn("Wrote", out.getvalue())
+
+        with self.assertNumQueries(2):  # Last-Modified, then the board
+            response = self.client.get(reverse("ranking"), {"metric": "views", "period": "day"})
+        self.assertEqual([row.book.bname for row in response.context["rankings"]], ["Comic"])
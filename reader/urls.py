@@ -5,6 +5,7 @@ from django.contrib.auth.decorators import login_required
 urlpatterns = [
     path('', views.home, name='home'),
     path('home/browse/', views.browse, name='browse'),
+    path('home/browse/more/', views.browse_more, name='browse_more'),
     path('home/ranking/', views.ranking, name='ranking'),
     path('home/contest/', views.contest, name='contest'),
     path('home/about/', views.about, name='about'),
@@ -19,10 +20,12 @@ urlpatterns = [
     path('toggle-like/<int:book_id>/', views.toggle_like, name='toggle_like'),
     path('chapter/<int:chapter_id>/toggle-like/', views.toggle_chapter_like, name='toggle_chapter_like'),
     path('chapter/<int:chapter_id>/add-comment/', views.add_comment, name='add_comment'),
+    path('chapter/<int:chapter_id>/comments/', views.chapter_comments, name='chapter_comments'),
 
     # --- Reviews & Ratings ---
     path('book/<int:book_id>/review/', views.add_or_edit_review, name='add_or_edit_review'),
     path('book/<int:book_id>/review/delete/', views.delete_review, name='delete_review'),
     path('review/<int:review_id>/delete/', views.delete_review_by_id, name='delete_review_by_id'),  
     path('book/<int:book_id>/review/check/', views.check_review, name='check_review'),
+    path('book/<int:book_id>/reviews/', views.book_reviews, name='book_reviews'),
 ]
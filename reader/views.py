@@ -1,69 +1,136 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator
+from django.template.loader import render_to_string
 from django.db import models
 from django.db.models import Q, F, Sum
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_cookie
+from django.conf import settings
 
-from django.db import transaction
 from library.models import Library, Collection, History
-from author.models import Book, Chapter, Comment, Review
-from moderator.models import HighlightedBook, News
+from author.models import Book, Chapter, ChapterLike, Comment, Review
+from author.counters import view_counter
+from browse.search import search_books
+from . import conditional
+from .cache import get_home_sections
+from .conditional import conditional_page
+from .dedupe import fingerprint, view_dedupe
+from .loaders import comment_page, load_reader_page, reader_page_etag
+from .rankings import get_ranking
+from .pagination import CursorPaginator, ListCursorPaginator, approximate_count
 
 # Create your views here.
 
+@conditional_page(conditional.home_page)
 def home(request):
-    top_books = HighlightedBook.objects.filter(category='TOP').select_related('book').order_by('order')[:15]
-    featured_books = HighlightedBook.objects.filter(category='FEATURED').select_related('book').order_by('order')[:15]
-    books = Book.objects.all()
-    news_items = News.objects.all().order_by('-added_on')[:10]  # latest 10 news items
-
-    return render(request, 'reader/rhome.html', {
-        'books': books,
-        'top_books': top_books,
-        'featured_books': featured_books,
-        'news_items': news_items,
-    })
+    return render(request, 'reader/rhome.html', get_home_sections())
+
+BROWSE_PAGE_SIZE = 20
+RANKING_METRICS = [('views', 'Most Viewed'), ('likes', 'Most Liked'), ('rating', 'Top Rated'), ('trending', 'Trending')]
+RANKING_PERIODS = [('day', 'Today'), ('week', 'This Week'), ('month', 'This Month'), ('all', 'All Time')]
+REVIEWS_PAGE_SIZE = 10
 
-def browse(request):
-    query = request.GET.get('q', '')  # Get search keyword
-    books_list = Book.objects.all()
+
+def _browse_page(request):
+    query = request.GET.get('q', '').strip()  # Get search keyword
+    cursor = request.GET.get('cursor')
 
     if query:
-        books_list = books_list.filter(
-            Q(bname__icontains=query) |
-            Q(user__username__icontains=query) |
-            Q(genre__icontains=query)
-        )
+        # ranked ids from the search index, then only this page's books
+        books = ListCursorPaginator(search_books(query), BROWSE_PAGE_SIZE).page(cursor)
+        found = Book.objects.select_related('user').in_bulk(books.object_list)
+        books.object_list = [found[pk] for pk in books.object_list if pk in found]
+    else:
+        books = CursorPaginator(Book.objects.select_related('user'), ('bname',), BROWSE_PAGE_SIZE).page(cursor)  # Sort A–Z
+    return query, books
+
 
-    books_list = books_list.order_by('bname')  # Sort A–Z
+def review_page(book_id, cursor=None):
+    reviews = Review.objects.filter(book_id=book_id).select_related('user')
+    return CursorPaginator(reviews, ('-created_at',), REVIEWS_PAGE_SIZE).page(cursor)
 
-    paginator = Paginator(books_list, 20)
-    page_number = request.GET.get('page')
-    books = paginator.get_page(page_number)
 
+@conditional_page(conditional.browse_page)
+def browse(request):
+    query, books = _browse_page(request)
     return render(request, 'reader/rbrowse.html', {'books': books, 'query': query})
 
 
+def browse_more(request):
+    query, books = _browse_page(request)
+    data = {
+        'html': render_to_string('reader/partials/book_cards.html', {'books': books}, request=request),
+        'next_cursor': books.next_cursor,
+    }
+    if not query and not request.GET.get('cursor'):
+        data['count'] = approximate_count(Book.objects.all())
+    return JsonResponse(data)
+
+
+def chapter_comments(request, chapter_id):
+    comments = comment_page(chapter_id, request.user, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('reader/partials/comments.html', {'comments': comments}, request=request),
+        'next_cursor': comments.next_cursor,
+    })
+
+
+def book_reviews(request, book_id):
+    book = get_object_or_404(Book, id=book_id)
+    reviews = review_page(book.id, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('reader/partials/reviews.html', {'book': book, 'reviews': reviews}, request=request),
+        'next_cursor': reviews.next_cursor,
+    })
+
+
+# Static pages are cached per view; vary_on_cookie must sit inside cache_page
+# so logged-in users (whose navbar differs) get their own cache entry.
+@conditional_page(conditional.ranking_page, max_age=settings.STATIC_PAGE_CACHE_TIMEOUT)
+@cache_page(settings.STATIC_PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def ranking(request):
-    return render(request, 'reader/rranking.html')
+    metric = request.GET.get('metric', 'views')
+    period = request.GET.get('period', 'week')
+    scope = request.GET.get('scope', '')
+    return render(request, 'reader/rranking.html', {
+        'rankings': get_ranking(metric, period, scope),  # materialized, see reader.rankings
+        'metric': metric,
+        'period': period,
+        'scope': scope,
+        'metrics': RANKING_METRICS,
+        'periods': RANKING_PERIODS,
+        'book_types': Book.BOOK_TYPES,
+    })
 
+@conditional_page(conditional.static_page, max_age=settings.STATIC_PAGE_CACHE_TIMEOUT)
+@cache_page(settings.STATIC_PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def contest(request):
     return render(request, 'reader/rcontest.html')
 
+@conditional_page(conditional.static_page, max_age=settings.STATIC_PAGE_CACHE_TIMEOUT)
+@cache_page(settings.STATIC_PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def about(request):
     return render(request, 'reader/rabout.html')
 
+def count_book_view(request, book_id):
+    if view_dedupe.first_view(fingerprint(request), f"book:{book_id}"):
+        Book(pk=book_id).increment_views()  # buffered, see author.counters
+
+# signed-in readers see their own history and collection here, so only
+# anonymous visitors get validators; the view is counted even on a 304
+@conditional_page(conditional.book_page, per_user=False, on_request=count_book_view)
 def book(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
+    book = get_object_or_404(Book.objects.select_related('user'), id=book_id)
     chapters = book.chapters.order_by('order')
-    top_books = HighlightedBook.objects.filter(category='TOP').select_related('book').order_by('order')[:15]
 
-    book.views = models.F('views') + 1
-    book.save(update_fields=["views"])
-    book.refresh_from_db()  # refresh actual value
+    view_counter.apply_pending(book)
 
     chapters = book.chapters.order_by('order')
 
@@ -87,48 +154,35 @@ def book(request, book_id):
         'total_likes': total_likes, 
         "rating_range": range(1, 6),
         'history': history,  
-        'top_books': top_books,
+        'liked_chapters': ChapterLike.liked_ids(request.user, chapters),
+        'reviews': review_page(book.id),
     })
 
 
 
 def read(request, book_id, chapter_id):
-    book = get_object_or_404(Book, id=book_id)
-    chapter = get_object_or_404(Chapter, id=chapter_id, Book=book)  
-    prev_chapter = Chapter.objects.filter(Book=book, order__lt=chapter.order).order_by('-order').first()
-    next_chapter = Chapter.objects.filter(Book=book, order__gt=chapter.order).order_by('order').first()
-
-    user_liked_chapter = False
-    if request.user.is_authenticated:
-        user_liked_chapter = chapter.liked_by.filter(id=request.user.id).exists()
-   
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+    context = load_reader_page(request.user, book_id, chapter_id, page)
+    book, chapter = context["book"], context["chapter"]
 
     # -----------------------------
     # Update Library History
     # -----------------------------
     library, _ = Library.objects.get_or_create(user=request.user)
-
-    # Remove existing entry for this book to move it to the top
-    History.objects.filter(library=library, book=book).delete()
-
-    # Enforce max 15 books
-    if History.objects.filter(library=library).count() >= 15:
-        oldest = History.objects.filter(library=library).order_by('last_read_time').first()
-        if oldest:
-            oldest.delete()
-
-    # Add new history entry
-    History.objects.create(library=library, book=book, last_read_chapter=chapter)
-
-
-    return render(request, "reader/rread.html", {
-        "chapter_liked": user_liked_chapter,
-        "book": book,
-        "chapter": chapter,
-        "chapters": book.chapters.all().order_by("order"),
-        "prev_chapter": prev_chapter,
-        "next_chapter": next_chapter,
-    })
+    History.record(library.id, book.id, chapter.id)
+
+    # the reader's copy stays valid until something on the page changes;
+    # revalidate every time and answer 304 instead of re-sending it
+    etag = reader_page_etag(context, request.user, request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render(request, "reader/rread.html", context)
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
 def add_to_collection(request, book_id):
@@ -156,17 +210,14 @@ def add_to_collection(request, book_id):
 def increment_chapter_view(request, chapter_id):
     """
     Count a view after 10 seconds of reading.
-    One view per user/session per chapter.
+    One view per reader per chapter every VIEW_DEDUPE_SECONDS.
     """
-    chapter = get_object_or_404(Chapter, id=chapter_id)
+    chapter = get_object_or_404(Chapter.objects.select_related("Book"), id=chapter_id)
     book = chapter.Book
+    view_counter.apply_pending(chapter, book)
 
-    # --- session handling ---
-    viewed_chapters = request.session.get("viewed_chapters", [])
-    viewed_chapters = [str(cid) for cid in viewed_chapters]  # normalize
-
-    # --- already counted? ---
-    if str(chapter_id) in viewed_chapters:
+    # --- already counted? one view per reader and chapter per window ---
+    if not view_dedupe.first_view(fingerprint(request), f"chapter:{chapter.id}"):
         return JsonResponse({
             "success": False,
             "message": "Already counted",
@@ -174,19 +225,9 @@ def increment_chapter_view(request, chapter_id):
             "book_views": book.views,
         })
 
-    # --- atomic increment ---
-    Chapter.objects.filter(id=chapter_id).update(views=F("views") + 1)
-    chapter.Book.__class__.objects.filter(id=book.id).update(views=F("views") + 1)
-
-    # refresh values
-    chapter.refresh_from_db(fields=["views"])
-    book.refresh_from_db(fields=["views"])
-
-    # --- update session (persist immediately) ---
-    viewed_chapters.append(str(chapter_id))
-    request.session["viewed_chapters"] = viewed_chapters
-    request.session.modified = True
-    request.session.save()  # <— ensure it's written now, not later
+    # --- buffered increment, written back in batches ---
+    chapter.increment_views()
+    book.increment_views()
 
     return JsonResponse({
         "success": True,
@@ -229,10 +270,7 @@ def toggle_like(request, book_id):
 def toggle_chapter_like(request, chapter_id):
     chapter = get_object_or_404(Chapter, id=chapter_id)
 
-    with transaction.atomic():
-        liked = chapter.toggle_like(request.user)
-        # Re-fetch to ensure accurate like count after concurrent updates
-        chapter.refresh_from_db(fields=["likes"])
+    liked = chapter.toggle_like(request.user)  # leaves the fresh count on chapter.likes
 
     return JsonResponse({
         "liked": liked,
@@ -306,8 +344,8 @@ def add_or_edit_review(request, book_id):
             defaults={"rating": rating, "review": review_text},
         )
 
-        # Update book rating stats
-        book.update_average_rating()
+        # Review.save already moved the book's rating totals
+        book.refresh_from_db(fields=["rating", "total_ratings"])
 
         return JsonResponse({
             "success": True,
@@ -328,7 +366,7 @@ def delete_review(request, book_id):
     try:
         review = Review.objects.get(book=book, user=request.user)
         review.delete()
-        book.update_average_rating()
+        book.refresh_from_db(fields=["rating", "total_ratings"])
         return JsonResponse({
             "success": True,
             "message": "Review deleted",
@@ -346,7 +384,6 @@ def delete_review_by_id(request, review_id):
     book = review.book
     if request.user == review.user or request.user == book.user or request.user.is_staff:
         review.delete()
-        book.update_average_rating()
         return JsonResponse({"success": True, "message": "Review deleted"})
     return JsonResponse({"error": "Permission denied"}, status=403)
 
@@ -0,0 +1,28 @@
+// "Load more" links: <a data-load-more data-url data-cursor data-target>.
+// The endpoint answers {html, next_cursor}; the html is appended to the
+// target and the link either moves on to the next cursor or goes away.
+document.addEventListener('click', async (e) => {
+  const link = e.target.closest('[data-load-more]');
+  if (!link) return;
+  e.preventDefault();
+  if (link.dataset.loading) return;
+  link.dataset.loading = '1';
+
+  const url = new URL(link.dataset.url, window.location.origin);
+  url.searchParams.set('cursor', link.dataset.cursor);
+
+  try {
+    const res = await fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+    const data = await res.json();
+    const target = document.querySelector(link.dataset.target);
+    target.insertAdjacentHTML('beforeend', data.html);
+    target.dispatchEvent(new CustomEvent('loadmore:appended', { bubbles: true }));
+    if (data.next_cursor) {
+      link.dataset.cursor = data.next_cursor;
+    } else {
+      link.remove();
+    }
+  } finally {
+    delete link.dataset.loading;
+  }
+});
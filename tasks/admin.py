@@ -0,0 +1,17 @@
+from django.contrib import admin
+
+from . import queue
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('started_at', 'last_error', 'created_at')
+    actions = ['retry']
+
+    @admin.action(description="Retry the selected dead tasks")
+    def retry(self, request, queryset):
+        retried = queue.retry(queryset.filter(status=Task.DEAD))
+        self.message_user(request, f"{retried} task(s) queued again.")
@@ -0,0 +1,15 @@
+"""Email, sent through the task queue so requests don't wait on SMTP."""
+from django.conf import settings
+from django.core import mail
+
+from .queue import enqueue, task
+
+
+@task(max_attempts=5, backoff=30)
+def send_mail(subject, message, recipient_list, from_email=None):
+    mail.send_mail(subject, message, from_email or settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=False)
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Queue an email; it is sent after the current transaction commits."""
+    return enqueue(send_mail, subject=subject, message=message, recipient_list=recipient_list, from_email=from_email)
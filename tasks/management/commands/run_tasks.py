@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks import queue
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks as they come due."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run what is due now and exit.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to wait when nothing is due.")
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            queue.requeue_stale()
+            ran = queue.run_due(options["batch_size"])
+            total += ran
+            if options["once"]:
+                if not ran:
+                    break
+            elif not ran:
+                time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} tasks."))
@@ -0,0 +1,155 @@
+"""
+Background tasks.
+
+A function decorated with ``@task`` is queued with ``enqueue(fn, **kwargs)``,
+which writes a Task row in the caller's transaction and returns at once;
+the keyword arguments must be JSON. How the task then runs depends on
+TASKS_MODE:
+
+- "thread": a small thread pool in this process runs it as soon as the
+  transaction commits, and runs retries when they come due.
+- "worker": ``manage.py run_tasks`` picks it up.
+- "inline": it runs at once, in the caller (the tests).
+
+``manage.py run_tasks`` also runs whatever a "thread" process left behind
+when it stopped, and the retries queued from the admin, so the Procfile
+runs it as a worker next to the web processes in either mode. A task is
+claimed with a conditional UPDATE, so it runs once however many runners
+see it.
+
+A task that raises is retried after ``backoff`` seconds, doubling with
+every attempt (with some jitter, up to MAX_BACKOFF). After
+``max_attempts`` it is marked DEAD and kept, with the traceback, until
+retried from the admin. Tasks that succeed are deleted.
+"""
+import logging
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DONE = 'done'
+MAX_BACKOFF = 60 * 60
+
+# {name: {"function": fn, "max_attempts": n, "backoff": seconds}}
+REGISTRY = {}
+
+_executor = None
+
+
+def task(max_attempts=5, backoff=30):
+    """Register the decorated function as a task, named by its dotted path."""
+    def decorator(fn):
+        fn.task_name = f"{fn.__module__}.{fn.__qualname__}"
+        REGISTRY[fn.task_name] = {"function": fn, "max_attempts": max_attempts, "backoff": backoff}
+        return fn
+    return decorator
+
+
+def resolve(name):
+    if name not in REGISTRY:
+        import_string(name)  # importing the module registers its tasks
+    return REGISTRY[name]
+
+
+def retry_delay(backoff, attempts):
+    return min(backoff * 2 ** (attempts - 1), MAX_BACKOFF) * random.uniform(0.8, 1.2)
+
+
+def enqueue(fn, **kwargs):
+    queued = Task.objects.create(name=fn.task_name, kwargs=kwargs, max_attempts=REGISTRY[fn.task_name]["max_attempts"])
+    if settings.TASKS_MODE == "inline":
+        run(queued.pk)
+    elif settings.TASKS_MODE == "thread":
+        transaction.on_commit(lambda: submit(queued.pk))
+    return queued
+
+
+def run(pk):
+    """
+    Run task ``pk`` if it is due and nobody else has claimed it. Returns
+    DONE, QUEUED (to be retried), DEAD, or None when it did not run.
+    """
+    now = timezone.now()
+    claimed = Task.objects.filter(pk=pk, status=Task.QUEUED, run_at__lte=now).update(
+        status=Task.RUNNING, attempts=F('attempts') + 1, started_at=now,
+    )
+    if not claimed:
+        return None
+    queued = Task.objects.get(pk=pk)
+    try:
+        resolve(queued.name)["function"](**queued.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if queued.attempts >= queued.max_attempts:
+            logger.error("Task %s (%s) failed for good after %s attempts", pk, queued.name, queued.attempts)
+            Task.objects.filter(pk=pk).update(status=Task.DEAD, last_error=error)
+            return Task.DEAD
+        backoff = REGISTRY.get(queued.name, {}).get("backoff", 30)
+        run_at = timezone.now() + timedelta(seconds=retry_delay(backoff, queued.attempts))
+        logger.warning("Task %s (%s) failed, retrying at %s", pk, queued.name, run_at)
+        Task.objects.filter(pk=pk).update(status=Task.QUEUED, run_at=run_at, last_error=error)
+        return Task.QUEUED
+    Task.objects.filter(pk=pk).delete()
+    return DONE
+
+
+def run_due(limit=100):
+    """Run up to ``limit`` due tasks, oldest first; returns how many ran."""
+    due = (
+        Task.objects.filter(status=Task.QUEUED, run_at__lte=timezone.now())
+        .order_by('run_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    return sum(run(pk) is not None for pk in list(due))
+
+
+def requeue_stale():
+    """Queue again the tasks claimed by a runner that stopped before finishing them."""
+    started_before = timezone.now() - timedelta(seconds=settings.TASKS_STALE_SECONDS)
+    return Task.objects.filter(status=Task.RUNNING, started_at__lt=started_before).update(status=Task.QUEUED)
+
+
+def retry(tasks):
+    """Queue ``tasks`` (dead ones, usually) again with fresh attempts."""
+    return tasks.update(status=Task.QUEUED, attempts=0, run_at=timezone.now())
+
+
+# --- "thread" mode ---
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.TASKS_WORKERS, thread_name_prefix="tasks")
+    return _executor
+
+
+def submit(pk):
+    executor().submit(work, pk)
+
+
+def work(pk):
+    try:
+        if run(pk) != Task.QUEUED:
+            return
+        run_at = Task.objects.filter(pk=pk).values_list('run_at', flat=True).first()
+    except Exception:
+        logger.exception("Running task %s failed", pk)
+        return
+    finally:
+        connections.close_all()
+    if run_at:
+        timer = threading.Timer((run_at - timezone.now()).total_seconds() + 0.1, submit, args=(pk,))
+        timer.daemon = True
+        timer.start()
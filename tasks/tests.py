@@ -0,0 +1,110 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import EmailOTP
+
+from . import queue
+from .mail import queue_mail
+from .models import Task
+
+calls = []
+
+
+@queue.task(max_attempts=2, backoff=10)
+def flaky(fail):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError("SMTP went away")
+
+
+@override_settings(TASKS_MODE="worker")
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_that_succeed_are_deleted(self):
+        queue.enqueue(flaky, fail=False)
+
+        self.assertEqual(queue.run_due(), 1)
+        self.assertEqual(calls, [False])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_kept_as_dead(self):
+        queued = queue.enqueue(flaky, fail=True)
+
+        with self.assertLogs("tasks.queue", "WARNING"):
+            self.assertEqual(queue.run_due(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=7))
+        self.assertEqual(queue.run_due(), 0)  # not due yet
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs("tasks.queue", "ERROR"):
+            self.assertEqual(queue.run_due(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.DEAD, 2))
+        self.assertIn("SMTP went away", queued.last_error)
+
+        queue.retry(Task.objects.filter(status=Task.DEAD))
+        self.assertEqual(Task.objects.get().status, Task.QUEUED)
+
+    def test_a_claimed_task_runs_once(self):
+        queued = queue.enqueue(flaky, fail=False)
+        Task.objects.update(status=Task.RUNNING, started_at=timezone.now())
+
+        self.assertIsNone(queue.run(queued.pk))
+        self.assertEqual(calls, [])
+
+    def test_tasks_left_running_by_a_dead_runner_are_queued_again(self):
+        queue.enqueue(flaky, fail=False)
+        Task.objects.update(status=Task.RUNNING, started_at=timezone.now() - timedelta(hours=1))
+
+        call_command("run_tasks", "--once", stdout=StringIO())
+
+        self.assertEqual(calls, [False])
+
+    @override_settings(TASKS_MODE="thread")
+    def test_thread_mode_waits_for_the_commit(self):
+        with mock.patch.object(queue, "submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            queued = queue.enqueue(flaky, fail=False)
+            submit.assert_not_called()
+
+        submit.assert_called_once_with(queued.pk)
+
+
+@override_settings(TASKS_MODE="worker")
+class OTPMailTests(TestCase):
+    def test_otp_requests_return_before_the_mail_is_sent(self):
+        response = self.client.post(reverse("send_otp"), {"email": "new@example.com"})
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(mail.outbox, [])
+        code = EmailOTP.objects.get(temp_email="new@example.com").code
+        self.assertNotIn(code, str(Task.objects.get().kwargs))
+
+        call_command("run_tasks", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["new@example.com"])
+        self.assertIn(f"Your OTP is {code}", mail.outbox[0].body)
+
+    def test_replaced_codes_are_not_mailed(self):
+        self.client.post(reverse("send_otp"), {"email": "new@example.com"})
+        self.client.post(reverse("send_otp"), {"email": "new@example.com"})
+
+        call_command("run_tasks", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(TASKS_MODE="inline")
+    def test_inline_mode_sends_at_once(self):
+        queue_mail("Hello", "Body", ["reader@example.com"])
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Task.objects.exists())